@@ -0,0 +1,100 @@
+"""Database 连接层前后对比的微基准
+
+用法: python benchmarks/bench_database.py [次数]
+"""
+import sqlite3
+import sys
+import os
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+
+class LegacyDatabase(Database):
+    """旧实现：每次调用都重新建立连接并提交"""
+
+    def save_note(self, note_id, title, content, parent_id, position):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO notes (id, title, content, parent_id, position)
+                VALUES (?, ?, ?, ?, ?)
+            """, (note_id, title, content, parent_id, position))
+            conn.commit()
+        return True
+
+    def delete_note(self, note_id):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+            conn.commit()
+        return True
+
+    def get_all_notes(self):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("""
+                SELECT id, title, content, parent_id, position
+                FROM notes
+                ORDER BY position
+            """).fetchall()
+
+    def add_image(self, note_id, image_path):
+        image_id = str(uuid4())
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO note_images (id, note_id, image_path)
+                VALUES (?, ?, ?)
+            """, (image_id, note_id, image_path))
+            conn.commit()
+        return image_id
+
+    def get_note_images(self, note_id):
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("""
+                SELECT id, image_path
+                FROM note_images
+                WHERE note_id = ?
+            """, (note_id,)).fetchall()
+
+
+def _timeit(func, count):
+    start = time.perf_counter()
+    for i in range(count):
+        func(i)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def run(db, count):
+    content = "<p>" + "x" * 2000 + "</p>"
+    results = {}
+    results["save_note"] = _timeit(
+        lambda i: db.save_note(str(i + 1), f"标题{i}", content, None, i), count)
+    results["save_note (autosave)"] = _timeit(
+        lambda i: db.save_note("1", "标题0", content + str(i), None, 0), count)
+    results["add_image"] = _timeit(
+        lambda i: db.add_image(str(i + 1), f"images/{i}.png"), count)
+    results["get_note_images"] = _timeit(
+        lambda i: db.get_note_images(str(i + 1)), count)
+    results["get_all_notes"] = _timeit(lambda i: db.get_all_notes(), max(1, count // 20))
+    results["delete_note"] = _timeit(lambda i: db.delete_note(str(i + 1)), count)
+    return results
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(LegacyDatabase(Path(tmp) / "legacy.db"), count)
+        db = Database(Path(tmp) / "tuned.db")
+        after = run(db, count)
+        db.close()
+
+    print(f"{'操作':<24}{'旧实现(us)':>14}{'新实现(us)':>14}{'加速':>10}")
+    for name in before:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:<24}{before[name]:>14.1f}{after[name]:>14.1f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""树结构内存占用对比：原先的 Note 对象 + 字典索引与紧凑的 NoteStore
+
+用法: python benchmarks/bench_memory.py [笔记数 ...]
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.generate import tree_shape, WORDS
+from note_store import NoteStore
+
+
+class LegacyNote:
+    """旧的笔记对象：每个实例一个 __dict__，id 是时间戳字符串"""
+
+    def __init__(self, title, content="", parent=None):
+        self.id = str(datetime.now().timestamp())
+        self.title = title
+        self.content = content
+        self.parent = parent
+        self.children = []
+
+
+def build_legacy(rows):
+    root = LegacyNote("根目录")
+    notes = {root.id: root}
+    parents, positions = {}, {}
+    ids = {}
+    for nid, title, parent, _ in rows:
+        note = LegacyNote(title)
+        note.id = ids[nid] = f"{1700000000 + nid / 1000:.6f}"
+        notes[note.id] = note
+    for nid, _, parent, _ in rows:
+        note_id = ids[nid]
+        parent_id = ids.get(parent, root.id)
+        siblings = notes[parent_id].children
+        positions[note_id] = len(siblings)
+        parents[note_id] = parent_id
+        siblings.append(note_id)
+    return root, notes, parents, positions
+
+
+def build_compact(rows):
+    return NoteStore.from_rows(rows, "根目录")
+
+
+def make_rows(count, depth=4, fanout=10):
+    rng = random.Random(count)
+    # 标题从有限的词表中组合，和真实笔记本一样存在大量重复
+    titles = [" ".join(rng.sample(WORDS, 2)) for _ in range(2000)]
+    return [(int(note_id), rng.choice(titles), int(parent_id), position)
+            for note_id, parent_id, position in tree_shape(count, depth, fanout)]
+
+
+def measure(build, rows):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = build(rows)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tree
+    return current, elapsed
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'笔记数':>10}{'布局':>10}{'内存 MB':>12}{'字节/篇':>10}{'构建 s':>10}")
+    for count in sizes:
+        rows = make_rows(count)
+        for name, build in (("旧布局", build_legacy), ("紧凑", build_compact)):
+            current, elapsed = measure(build, rows)
+            print(f"{count:>10}{name:>10}{current / 1e6:>12.1f}{current / count:>10.0f}{elapsed:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""快速打开的标题索引：建立耗时和逐字输入时的查询延迟
+
+用法: python benchmarks/bench_quick_open.py [笔记数 ...]
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.generate import tree_shape, WORDS
+from note_store import NoteStore
+from title_index import TitleIndex
+
+
+def make_store(count, rng):
+    # 常用词加上大量随机词，标题大多不重复
+    vocab = WORDS + ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(20000)]
+    rows = [(int(note_id), " ".join(rng.choices(vocab, k=rng.randint(1, 4))), int(parent_id), position)
+            for note_id, parent_id, position in tree_shape(count, 5, 16)]
+    return NoteStore.from_rows(rows, "根目录"), vocab
+
+
+def typing_queries(vocab, rng, words=200):
+    """模拟逐字输入：每个词的所有前缀，外加拼错一个字的完整词和带路径的查询"""
+    queries = []
+    for word in rng.sample(vocab, words):
+        queries.extend(word[:k] for k in range(1, len(word) + 1))
+        if len(word) > 4:
+            i = rng.randrange(len(word))
+            queries.append(word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:])
+        queries.append(f"{rng.choice(vocab)}/{word}")
+    return queries
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f"{'笔记数':>10}{'建立 s':>10}{'查询数':>8}{'p50 ms':>10}{'p95 ms':>10}{'最大 ms':>10}")
+    for count in sizes:
+        rng = random.Random(count)
+        store, vocab = make_store(count, rng)
+        start = time.perf_counter()
+        index = TitleIndex(store)
+        build = time.perf_counter() - start
+        latencies = []
+        for query in typing_queries(vocab, rng):
+            start = time.perf_counter()
+            index.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"{count:>10}{build:>10.2f}{len(latencies):>8}{percentile(latencies, 0.5):>10.2f}"
+              f"{percentile(latencies, 0.95):>10.2f}{latencies[-1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""正文存储编码的体积与写入量对比
+
+模拟在一篇 QTextEdit 生成的长笔记中逐字输入并自动保存，
+比较数据库文件大小和每次保存写入 WAL 的字节数。
+
+用法: python benchmarks/bench_storage.py [段落数] [编辑次数]
+"""
+import os
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+from html_text import html_to_text
+
+QT_HEADER = (
+    '<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 4.0//EN" "http://www.w3.org/TR/REC-html40/strict.dtd">\n'
+    '<html><head><meta name="qrichtext" content="1" /><meta charset="utf-8" />'
+    '<style type="text/css">\np, li { white-space: pre-wrap; }\nhr { height: 1px; border-width: 0; }\n'
+    '</style></head><body style=" font-family:\'Microsoft YaHei UI\'; font-size:9pt; font-weight:400; font-style:normal;">\n'
+)
+QT_PARAGRAPH = (
+    '<p style=" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; '
+    '-qt-block-indent:0; text-indent:0px;">{}</p>'
+)
+
+
+class RawDatabase(Database):
+    """编码层之前的存储方式：原样保存 toHtml() 的输出，不记录修订"""
+    RECORD_REVISIONS = False
+
+    def save_note(self, note_id, title, content, parent_id, position):
+        with self.transaction() as conn:
+            conn.execute("""
+                INSERT INTO notes (id, title, content, parent_id, position)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    title = excluded.title,
+                    content = excluded.content,
+                    parent_id = excluded.parent_id,
+                    position = excluded.position
+            """, (note_id, title, content, parent_id, position))
+            rowid = conn.execute("SELECT rowid FROM notes WHERE id = ?", (note_id,)).fetchone()[0]
+            for table in self.FTS_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+            self.index_notes(conn, [(rowid, title, html_to_text(content))])
+        return True
+
+
+class CodecOnlyDatabase(Database):
+    RECORD_REVISIONS = False
+
+
+def to_html(paragraphs):
+    return QT_HEADER + "\n".join(QT_PARAGRAPH.format(p) for p in paragraphs) + "</body></html>"
+
+
+def run(db, paragraphs, edits, notes=20):
+    rng = random.Random(42)
+    paragraphs = list(paragraphs)
+    for i in range(notes):
+        db.save_note(str(i + 1), f"笔记{i}", to_html(paragraphs), None, i)
+    db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.conn.execute("PRAGMA wal_autocheckpoint=0")
+    wal = Path(str(db.db_path) + "-wal")
+
+    for _ in range(edits):
+        index = rng.randrange(len(paragraphs))
+        text = paragraphs[index]
+        pos = rng.randrange(len(text) + 1)
+        paragraphs[index] = text[:pos] + rng.choice("abc中文 ") + text[pos:]
+        db.save_note("1", "笔记0", to_html(paragraphs), None, 0)
+    written = wal.stat().st_size if wal.exists() else 0
+
+    db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.conn.execute("VACUUM")
+    size = db.db_path.stat().st_size
+    stored = db.conn.execute("SELECT SUM(LENGTH(CAST(content AS BLOB))) FROM notes").fetchone()[0]
+    if db.RECORD_REVISIONS:
+        stored += db.conn.execute("SELECT SUM(LENGTH(data)) FROM note_revisions").fetchone()[0] or 0
+    db.close()
+    return size, stored, written / edits
+
+
+def main():
+    paragraph_count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(1)
+    words = ["笔记", "数据库", "索引", "性能", "the", "note", "tree", "保存", "图片", "搜索",
+             "编辑器", "内容", "节点", "query", "cache", "修订", "压缩", "写入", "读取", "启动"]
+    paragraphs = [" ".join(rng.choice(words) for _ in range(40)) for _ in range(paragraph_count)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, cls in (("原始 HTML", RawDatabase), ("精简+压缩", CodecOnlyDatabase), ("精简+压缩+修订", Database)):
+            results.append((name, *run(cls(Path(tmp) / f"{cls.__name__}.db"), paragraphs, edits)))
+
+    print(f"单篇正文约 {len(to_html(paragraphs).encode()) / 1024:.0f} KB，共 {edits} 次编辑")
+    print("数据库大小和每次写入量包含全文索引，正文存储只统计 notes.content 与修订记录")
+    print(f"{'方案':<16}{'数据库大小(KB)':>16}{'正文存储(KB)':>16}{'每次保存写入(KB)':>20}")
+    for name, size, stored, per_edit in results:
+        print(f"{name:<16}{size / 1024:>16.0f}{stored / 1024:>16.0f}{per_edit / 1024:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""生成用于性能测试的合成笔记本
+
+用法: python benchmarks/generate.py 目标目录 [--notes N] [--depth D] [--fanout F]
+                                  [--body-size 字节] [--images N]
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+from image_manager import ImageManager
+
+# 顶层合成笔记直接挂在根目录下
+TOP_PARENT = "0"
+WORDS = ["笔记", "数据库", "索引", "性能", "the", "note", "tree", "保存", "图片", "搜索",
+         "编辑器", "内容", "节点", "query", "cache", "修订", "压缩", "写入", "读取", "启动",
+         "alpha", "beta", "gamma", "delta", "项目", "会议", "计划", "总结", "bug", "release"]
+PARAGRAPH = '<p style="margin:0px;">{}</p>'
+
+
+def _png(width: int, height: int, seed: int) -> bytes:
+    """不依赖 Qt 生成一张纯色 PNG"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    color = bytes(((seed * 37) % 256, (seed * 91) % 256, (seed * 53) % 256))
+    raw = b"".join(b"\x00" + color * width for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+def make_body(rng: random.Random, size: int, images=()) -> str:
+    paragraphs = []
+    length = 0
+    while length < size:
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))
+        paragraphs.append(PARAGRAPH.format(text))
+        length += len(text)
+    for src in images:
+        paragraphs.insert(rng.randrange(len(paragraphs) + 1), f'<p><img src="{src}" /></p>')
+    return "<html><body>" + "".join(paragraphs) + "</body></html>"
+
+
+def tree_shape(notes: int, depth: int, fanout: int):
+    """按层生成 (note_id, parent_id, position)，每层每个节点最多 fanout 个子节点"""
+    count = 0
+    level = [TOP_PARENT]
+    for _ in range(depth):
+        next_level = []
+        for parent_id in level:
+            for position in range(fanout):
+                if count >= notes:
+                    return
+                count += 1
+                note_id = str(count)
+                yield note_id, parent_id, position
+                next_level.append(note_id)
+        level = next_level
+        if not level:
+            return
+    # 层数用完后剩余的笔记全部放在最后一层的节点下
+    while count < notes:
+        for parent_id in level:
+            if count >= notes:
+                return
+            count += 1
+            yield str(count), parent_id, fanout + count
+
+
+def generate(directory, notes=1000, depth=4, fanout=10, body_size=2000, images=0,
+             seed=0, batch=5000, progress=None):
+    """在 directory 下生成 notes.db 和 images/，返回生成的笔记 id 列表"""
+    directory = Path(directory).resolve()
+    directory.mkdir(parents=True, exist_ok=True)
+    # 图片路径与应用一样相对于笔记本目录保存
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return _generate(directory, notes, depth, fanout, body_size, images, seed, batch, progress)
+    finally:
+        os.chdir(cwd)
+
+
+def _generate(directory, notes, depth, fanout, body_size, images, seed, batch, progress):
+    rng = random.Random(seed)
+    db = Database(directory / "notes.db")
+    image_store = ImageManager(db, "images")
+
+    sources = []
+    if images:
+        source_dir = directory / "image_sources"
+        source_dir.mkdir(exist_ok=True)
+        for i in range(images):
+            path = source_dir / f"{i}.png"
+            path.write_bytes(_png(64 + i % 64, 48, i))
+            sources.append(path)
+
+    ids = []
+    shape = tree_shape(notes, depth, fanout)
+    while True:
+        with db.transaction():
+            for note_id, parent_id, position in shape:
+                srcs = []
+                if sources and rng.random() < images / notes:
+                    srcs.append(image_store.store_file(str(rng.choice(sources))))
+                body = make_body(rng, rng.randint(body_size // 2, body_size * 3 // 2), srcs)
+                # 图片引用的外键指向笔记，先写笔记再记引用；Database 只记录错误，这里失败就中止
+                if not db.save_note(note_id, " ".join(rng.choice(WORDS) for _ in range(3)), body, parent_id,
+                                    (position + 1) * Database.POSITION_GAP):
+                    raise RuntimeError(f"写入笔记 {note_id} 失败")
+                for src in srcs:
+                    if db.add_image(note_id, src) is None:
+                        raise RuntimeError(f"记录笔记 {note_id} 的图片引用失败")
+                ids.append(note_id)
+                if len(ids) % batch == 0:
+                    break
+            else:
+                break
+        if progress:
+            progress(len(ids), notes)
+    if progress:
+        progress(len(ids), notes)
+    db.close()
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成笔记本")
+    parser.add_argument("directory")
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--body-size", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.directory, args.notes, args.depth, args.fanout, args.body_size, args.images, args.seed,
+             progress=lambda done, total: print(f"\r已生成 {done}/{total}", end="", flush=True))
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""对本地笔记服务（python cli.py serve）做压力测试，报告吞吐量和各接口的延迟分位数
+
+用法: python benchmarks/load_test.py [--url http://127.0.0.1:8765] [--clients 32]
+                                   [--duration 10] [--write-ratio 0.05]
+
+每个客户端保持一个连接，按比例随机发出读请求（子节点分页、正文、搜索）和写请求
+（新建后修改正文），写入的笔记放在测试开始时新建的一篇笔记下，结束时删除。
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit, quote
+
+SEARCH_TERMS = ["笔记", "数据库", "索引", "性能", "note", "tree", "cache", "query", "release", "会议"]
+
+
+class Client:
+    """保持连接的最小 HTTP/1.1 JSON 客户端"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def worker(client, deadline, notes, sandbox, write_ratio, latencies, errors, rng):
+    while time.perf_counter() < deadline:
+        if rng.random() < write_ratio:
+            route = "write"
+
+            async def call():
+                status, data = await client.request("POST", "/notes", {"title": "压测笔记", "parent": sandbox})
+                if status != 201:
+                    return status
+                status, _ = await client.request("PATCH", f"/notes/{data['id']}",
+                                                 {"content": f"<p>{rng.random()}</p>"})
+                return status
+        else:
+            kind = rng.random()
+            note_id = rng.choice(notes)
+            if kind < 0.4:
+                route, method, path = "children", "GET", f"/notes/{note_id}/children?limit=50"
+            elif kind < 0.8:
+                route, method, path = "content", "GET", f"/notes/{note_id}"
+            else:
+                route, method, path = "search", "GET", f"/search?q={quote(rng.choice(SEARCH_TERMS))}&limit=20"
+
+            async def call():
+                status, _ = await client.request(method, path)
+                return status
+        start = time.perf_counter()
+        try:
+            status = await call()
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status = None
+            client.close()
+            client.writer = None
+        latencies[route].append(time.perf_counter() - start)
+        if status not in (200, 201):
+            errors[route] += 1
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+async def run(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    setup = Client(host, port)
+    _, tree = await setup.request("GET", "/tree")
+    notes = [row[0] for row in tree["notes"]] or ["0"]
+    _, created = await setup.request("POST", "/notes", {"title": "压测", "parent": "0"})
+    sandbox = created["id"]
+    print(f"笔记 {len(notes)} 篇，{args.clients} 个客户端，{args.duration}s，写入比例 {args.write_ratio}")
+
+    latencies, errors = defaultdict(list), defaultdict(int)
+    clients = [Client(host, port) for _ in range(args.clients)]
+    deadline = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client, deadline, notes, sandbox, args.write_ratio, latencies, errors,
+                                  random.Random(i)) for i, client in enumerate(clients)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        client.close()
+    await setup.request("DELETE", f"/notes/{sandbox}")
+    setup.close()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n总请求 {total}，{total / elapsed:.0f} req/s")
+    print(f"{'接口':<10}{'请求数':>8}{'错误':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'最大 ms':>9}")
+    for route in sorted(latencies):
+        values = sorted(latencies[route])
+        print(f"{route:<10}{len(values):>8}{errors[route]:>6}{len(values) / elapsed:>9.0f}"
+              f"{percentile(values, 0.5):>9.2f}{percentile(values, 0.95):>9.2f}"
+              f"{percentile(values, 0.99):>9.2f}{values[-1] * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="笔记服务压力测试")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except ConnectionError as e:
+        print(f"无法连接 {args.url}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""无界面的性能测试套件
+
+在合成笔记本上测量真实热点路径的耗时，打印分位数表格并写出 JSON 结果，
+便于在不同提交之间对比。界面相关的测试在 Qt offscreen 平台上运行，
+没有安装 PyQt6 时跳过。
+
+用法: python benchmarks/run.py [--notes 1000 10000] [--depth 4] [--fanout 10]
+                             [--body-size 2000] [--images 0] [--repeat 20]
+                             [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.generate import generate, WORDS
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(50) * 1000,
+        "p90_ms": percentile(90) * 1000,
+        "p99_ms": percentile(99) * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(func, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_core(repeat, rng):
+    from note_manager import NoteManager
+
+    results = {}
+    managers = []
+
+    def load(_):
+        managers.append(NoteManager())
+    results["NoteManager._load_notes"] = measure(load, max(3, repeat // 4))
+    for manager in managers[:-1]:
+        manager.db.close()
+    manager = managers[-1]
+
+    note_ids = [note_id for note_id in manager.notes if note_id != manager.root.id]
+    parents = rng.sample(note_ids, min(len(note_ids), repeat))
+    created = []
+    results["create_note"] = measure(
+        lambda i: created.append(manager.create_note("新建笔记", parents[i % len(parents)])), repeat)
+
+    targets = rng.sample(note_ids, min(len(note_ids), repeat))
+    bodies = {note_id: manager.get_content(note_id) for note_id in targets}
+    results["update_note"] = measure(
+        lambda i: manager.update_note(targets[i % len(targets)],
+                                      content=bodies[targets[i % len(targets)]] + f"<p>{i}</p>"), repeat)
+
+    results["delete_note (leaf)"] = measure(lambda i: manager.delete_note(created[i]), len(created))
+    subtree_roots = [note_id for note_id in manager.root.children]
+    results["delete_note (subtree)"] = measure(lambda i: manager.delete_note(subtree_roots[i]), 1)
+
+    queries = [" ".join(rng.sample(WORDS, 2)) for _ in range(repeat)]
+    results["NoteManager.search"] = measure(lambda i: manager.search(queries[i]), repeat)
+    manager.db.close()
+    return results
+
+
+def bench_ui(repeat, rng):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    try:
+        from PyQt6.QtCore import QSettings, QStandardPaths
+        from PyQt6.QtWidgets import QApplication, QMessageBox
+    except ImportError:
+        print("未安装 PyQt6，跳过界面测试")
+        return {}
+    from ui.main_window import MainWindow
+
+    app = QApplication.instance() or QApplication([])
+    # 搜索到尾部时会弹出提示框，测试时不能阻塞
+    QMessageBox.information = staticmethod(lambda *args, **kwargs: None)
+
+    # 窗口位置、当前笔记本等设置写到临时目录（当前目录），不动用户真实的设置
+    QStandardPaths.setTestModeEnabled(True)
+    settings = QSettings(os.path.abspath("settings.ini"), QSettings.Format.IniFormat)
+
+    results = {}
+    windows = []
+    results["MainWindow.__init__"] = measure(lambda _: windows.append(MainWindow(settings)), 1)
+    window = windows[0]
+    results["MainWindow.refresh_tree"] = measure(lambda _: window.refresh_tree(), repeat)
+
+    def find_next(i):
+        if i % 5 == 0:
+            window.search_box.setText(rng.choice(WORDS))
+        window.find_next()
+        app.processEvents()
+    results["MainWindow.find_next"] = measure(find_next, repeat)
+    window.close()
+    app.processEvents()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def print_table(size, results):
+    print(f"\n笔记数 {size}")
+    print(f"{'操作':<28}{'次数':>6}{'平均':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'最大':>10}  (ms)")
+    for name, stats in results.items():
+        print(f"{name:<28}{stats['count']:>6}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p90_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tree Note 性能测试")
+    parser.add_argument("--notes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--body-size", type=int, default=2000)
+    parser.add_argument("--images", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-ui", action="store_true", help="只测试非界面部分")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "runs": {},
+    }
+    cwd = os.getcwd()
+    for size in args.notes:
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            generate(tmp, size, args.depth, args.fanout, args.body_size, args.images)
+            print(f"生成 {size} 篇笔记用时 {time.perf_counter() - start:.1f}s")
+            # NoteManager 和 MainWindow 使用当前目录下的 notes.db 与 images/
+            os.chdir(tmp)
+            try:
+                samples = bench_core(args.repeat, random.Random(size))
+                if not args.no_ui:
+                    samples.update(bench_ui(args.repeat, random.Random(size)))
+            finally:
+                os.chdir(cwd)
+        results = {name: summarize(values) for name, values in samples.items() if values}
+        report["runs"][str(size)] = results
+        print_table(size, results)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Tree Note 命令行工具，不启动界面，在当前目录（或 -C 指定的目录）的笔记本上操作，
+--notebook 选择 notebooks/ 下的其他笔记本
+
+用法:
+  python cli.py import 源目录或归档.jsonl [--parent ID] [--format dir|jsonl]
+  python cli.py export 目标目录或归档.jsonl [--note ID] [--format dir|jsonl]
+  python cli.py serve [--host 127.0.0.1] [--port 8765] [--readers 4]
+  python cli.py maintain [--dry-run] [--quick] [--no-vacuum]
+  python cli.py notebooks [--create 名称]
+"""
+import argparse
+import os
+import sys
+import time
+
+
+def _progress(action):
+    start = time.perf_counter()
+
+    def report(done, total):
+        print(f"\r{action} {done}/{total}  {time.perf_counter() - start:.1f}s", end="", flush=True)
+    return report
+
+
+def cmd_import(manager, args):
+    count = manager.import_notes(args.source, args.parent, args.format, progress=_progress("已导入"))
+    print(f"\n新导入 {count} 篇笔记")
+
+
+def cmd_export(manager, args):
+    count = manager.export_notes(args.note or manager.ROOT_ID, args.target, args.format, progress=_progress("已导出"))
+    print(f"\n导出 {count} 篇笔记到 {args.target}")
+
+
+def cmd_serve(manager, args):
+    import service
+    service.serve(manager, args.host, args.port, args.readers)
+
+
+def cmd_maintain(manager, args):
+    import maintenance
+    report = maintenance.run(manager.db, manager.images, repair=not args.dry_run,
+                             vacuum=not args.no_vacuum, quick=args.quick)
+    print(maintenance.format_report(report))
+    if report["integrity"]:
+        raise ValueError("数据库已损坏，请从备份恢复")
+
+
+def cmd_notebooks(registry, args):
+    if args.create:
+        print(f"已新建笔记本 {registry.create(args.create)}")
+    for name in registry.names():
+        db_path = registry.directory(name) / "notes.db"
+        size = db_path.stat().st_size if db_path.exists() else 0
+        print(f"{name:<20}{size / 1e6:>10.2f} MB  {registry.directory(name)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tree Note 命令行工具")
+    parser.add_argument("-C", dest="directory", help="笔记本所在目录（notes.db 与 images/）")
+    parser.add_argument("--notebook", help="要操作的笔记本，默认是目录下的默认笔记本")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="批量导入目录树或 JSON Lines 归档，中断后重新执行会继续")
+    importer.add_argument("source")
+    importer.add_argument("--parent", help="导入到该笔记之下，默认根目录")
+    importer.add_argument("--format", choices=("dir", "jsonl"))
+    importer.set_defaults(func=cmd_import)
+
+    exporter = commands.add_parser("export", help="把子树导出为目录镜像或 JSON Lines 归档")
+    exporter.add_argument("target")
+    exporter.add_argument("--note", help="要导出的笔记，默认整个笔记本")
+    exporter.add_argument("--format", choices=("dir", "jsonl"))
+    exporter.set_defaults(func=cmd_export)
+
+    server = commands.add_parser("serve", help="启动本地 JSON over HTTP 服务，见 service.py")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8765)
+    server.add_argument("--readers", type=int, default=4, help="读线程数（只读连接数）")
+    server.set_defaults(func=cmd_serve)
+
+    maintainer = commands.add_parser("maintain", help="离线检查并修复笔记本、整理数据库文件，见 maintenance.py")
+    maintainer.add_argument("--dry-run", action="store_true", help="只检查并报告，不做修改")
+    maintainer.add_argument("--quick", action="store_true", help="只释放空闲页，不重写整个文件")
+    maintainer.add_argument("--no-vacuum", action="store_true", help="不整理数据库文件")
+    maintainer.set_defaults(func=cmd_maintain)
+
+    notebooks = commands.add_parser("notebooks", help="列出或新建笔记本")
+    notebooks.add_argument("--create", metavar="名称")
+    notebooks.set_defaults(func=cmd_notebooks)
+
+    args = parser.parse_args(argv)
+    # 源和目标路径相对于调用时的目录
+    for name in ("source", "target"):
+        if getattr(args, name, None):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    if args.directory:
+        os.makedirs(args.directory, exist_ok=True)
+        os.chdir(args.directory)
+
+    from note_manager import NoteManager
+    from notebooks import NotebookRegistry
+    registry = NotebookRegistry()
+    if args.func is cmd_notebooks:
+        try:
+            args.func(registry, args)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+        return 0
+    notebook = args.notebook or registry.DEFAULT
+    if not registry.exists(notebook):
+        print(f"笔记本不存在: {notebook}", file=sys.stderr)
+        return 1
+    manager = NoteManager(directory=registry.directory(notebook))
+    try:
+        args.func(manager, args)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        manager.db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
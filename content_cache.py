@@ -0,0 +1,42 @@
+import sys
+from collections import OrderedDict
+from typing import Optional
+
+
+class ContentCache:
+    """按占用字节数淘汰的 LRU 笔记内容缓存"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, note_id: str) -> Optional[str]:
+        content = self._entries.get(note_id)
+        if content is not None:
+            self._entries.move_to_end(note_id)
+        return content
+
+    def put(self, note_id: str, content: str):
+        self.discard(note_id)
+        self._entries[note_id] = content
+        self.size += sys.getsizeof(content)
+        # 最近写入的条目总是保留，即使它本身超过上限
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= sys.getsizeof(evicted)
+
+    def discard(self, note_id: str):
+        content = self._entries.pop(note_id, None)
+        if content is not None:
+            self.size -= sys.getsizeof(content)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
@@ -0,0 +1,103 @@
+import re
+import struct
+import zlib
+from typing import Union
+
+# 压缩后的正文以该前缀开头，没有前缀的是旧版本直接保存的 HTML
+COMPRESSED_MAGIC = b"TNZ1"
+# 超过该字节数的正文才压缩，小正文压缩收益抵不上开销
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 6
+
+_DOCTYPE = re.compile(r"<!DOCTYPE[^>]*>\s*", re.IGNORECASE)
+# QTextEdit 为每个段落写出的四个 0 外边距，可以合并成简写
+_ZERO_MARGINS = re.compile(
+    r"margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px;"
+)
+# 与默认值相同的段落样式
+_DEFAULT_BLOCK_STYLE = re.compile(r" ?-qt-block-indent:0;| ?text-indent:0px;")
+# 只改写标签中 style 属性的值，正文文字（其中的 < > 已转义）出现同样的字符串时保持原样
+_TAG = re.compile(r"<[A-Za-z][^<>]*>")
+_STYLE_ATTR = re.compile(r' style="([^"]*)"')
+
+
+def _minify_style(match) -> str:
+    style = _DEFAULT_BLOCK_STYLE.sub("", _ZERO_MARGINS.sub("margin:0px;", match.group(1)))
+    return f' style="{style}"' if style.strip() else ""
+
+
+def _minify_tag(match) -> str:
+    tag = match.group(0)
+    return _STYLE_ATTR.sub(_minify_style, tag) if ' style="' in tag else tag
+
+
+def minify_html(html: str) -> str:
+    """去掉 toHtml() 输出中与默认值相同的冗余部分，渲染结果不变"""
+    if not html or "<" not in html:
+        return html
+    html = _DOCTYPE.sub("", html, count=1)
+    return _TAG.sub(_minify_tag, html)
+
+
+def encode(content: str) -> Union[str, bytes]:
+    if content is None:
+        return None
+    data = content.encode("utf-8")
+    if len(data) < COMPRESS_THRESHOLD:
+        return content
+    return COMPRESSED_MAGIC + zlib.compress(data, COMPRESS_LEVEL)
+
+
+def decode(value: Union[str, bytes, None]) -> str:
+    if value is None or isinstance(value, str):
+        return value
+    if value.startswith(COMPRESSED_MAGIC):
+        return zlib.decompress(value[len(COMPRESSED_MAGIC):]).decode("utf-8")
+    return bytes(value).decode("utf-8")
+
+
+# 修订记录：完整快照保存编码后的正文，增量只保存与上一版本不同的中间部分
+# 增量头部：公共前缀长度、公共后缀长度、中间部分是否压缩
+_DELTA_HEADER = struct.Struct("<IIB")
+
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    # 二分比较切片，比逐字符循环快得多
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def make_delta(previous: str, current: str) -> bytes:
+    limit = min(len(previous), len(current))
+    prefix = _common_prefix(previous, current, limit)
+    suffix = _common_suffix(previous, current, limit - prefix)
+    middle = current[prefix:len(current) - suffix].encode("utf-8")
+    compressed = len(middle) >= COMPRESS_THRESHOLD
+    if compressed:
+        middle = zlib.compress(middle, COMPRESS_LEVEL)
+    return _DELTA_HEADER.pack(prefix, suffix, compressed) + middle
+
+
+def apply_delta(previous: str, delta: bytes) -> str:
+    prefix, suffix, compressed = _DELTA_HEADER.unpack_from(delta)
+    middle = bytes(delta[_DELTA_HEADER.size:])
+    if compressed:
+        middle = zlib.decompress(middle)
+    return previous[:prefix] + middle.decode("utf-8") + previous[len(previous) - suffix:]
@@ -1,25 +1,195 @@
+import re
+import json
 import sqlite3
-from typing import Optional, List, Tuple
+import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, List, Tuple
 from uuid import uuid4
 from pathlib import Path
+from html_text import html_to_text
+import content_codec
+from instrumentation import instrumentation, timed
+
+logger = logging.getLogger(__name__)
+
+def _stored_size(value) -> int:
+    """数据库中正文占用的字节数，用于读写量统计"""
+    if value is None:
+        return 0
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+# 连续的汉字、假名和谚文
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]{2,}")
+
+
+def cjk_bigrams(text: str) -> str:
+    """文本中不重复的相邻两字组合，以空格分隔，供二元组索引使用"""
+    grams = {run[i:i + 2] for run in _CJK_RUN.findall(text) for i in range(len(run) - 1)}
+    return " ".join(sorted(grams))
+
+
+# 搜索结果：offsets 为匹配在正文纯文本中的 (起点, 长度)，search_notes 不计算，见 match_offsets
+SearchHit = namedtuple("SearchHit", ["note_id", "rank", "offsets"], defaults=(None,))
 
 class Database:
-    def __init__(self):
+    # 每个连接建立后执行的调优参数
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA cache_size=-16000",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA foreign_keys=ON",
+    )
+    # sqlite3 模块按连接缓存的预编译语句数量
+    CACHED_STATEMENTS = 128
+    # 按顺序执行的结构迁移，PRAGMA user_version 记录已完成的数量
+    MIGRATIONS = (
+        "_migrate_fts",
+        "_migrate_image_path_index",
+        "_migrate_revisions",
+        "_migrate_integer_ids",
+        "_migrate_import_journal",
+        "_migrate_sparse_positions",
+        "_migrate_parent_index",
+        "_migrate_root_row",
+        "_migrate_image_note_index",
+        "_migrate_change_log",
+        "_migrate_cjk_bigrams",
+    )
+    # 修订历史：每隔若干版本保存一次完整快照，其余保存增量
+    RECORD_REVISIONS = True
+    SNAPSHOT_INTERVAL = 32
+    # 每篇笔记保留的修订数，必须是 SNAPSHOT_INTERVAL 的整数倍
+    MAX_REVISIONS = 256
+    REVISION_FULL = 0
+    REVISION_DELTA = 1
+    # trigram 分词器只能索引不少于 3 个字符的词，两个汉字的词由 notes_bigrams 索引
+    FTS_MIN_TERM = 3
+    # 全文索引表，rowid 都与 notes 表一致
+    # 匹配的笔记超过这个数量时，只对最新的这些计算相关度
+    RANK_CANDIDATES = 500
+    FTS_TABLES = ("notes_fts", "notes_bigrams")
+    # IN 查询每批的参数个数，低于 SQLite 的变量数上限
+    SQL_BATCH = 500
+    # 每条搜索结果最多返回的匹配位置数
+    MAX_HIT_OFFSETS = 64
+    # 兄弟排序键的间隔，与 note_store.GAP 一致
+    POSITION_GAP = 1024
+    # 根目录的行，与 note_store.ROOT 一致
+    ROOT_ID = 0
+    ROOT_TITLE = "根目录"
+    # 变更日志的操作类型，由 notes 表上的触发器写入
+    CHANGE_INSERT = 0
+    CHANGE_UPDATE = 1
+    CHANGE_DELETE = 2
+    # 截短变更日志时保留的行数，落后更多的读者整体重新读取树结构
+    CHANGE_LOG_KEEP = 10000
+
+    def __init__(self, db_path: Optional[Path] = None):
         # 将数据库路径设置为与运行程序同一级目录
-        self.db_path = Path.cwd() / "notes.db"
+        self.db_path = Path(db_path) if db_path else Path.cwd() / "notes.db"
+        # 每个线程持有一个长连接，避免每次操作都重新建立连接
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
         self._init_db()
     
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=self.CACHED_STATEMENTS,
+            )
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def transaction(self):
+        """显式事务，嵌套时只有最外层提交，多次写入共用一次提交
+
+        内层使用保存点：内层出错而外层捕获异常继续执行时，只撤销内层的写入，
+        不会把写了一半的内容随外层一起提交。
+        """
+        conn = self.conn
+        depth = self._local.depth
+        savepoint = f"sp_{depth}"
+        conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+        self._local.depth += 1
+        try:
+            yield conn
+        except BaseException:
+            self._local.depth -= 1
+            # 某些错误下 SQLite 已经自动回滚了整个事务
+            if conn.in_transaction:
+                if depth == 0:
+                    conn.execute("ROLLBACK")
+                else:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+            raise
+        self._local.depth -= 1
+        if depth:
+            conn.execute(f"RELEASE {savepoint}")
+            return
+        try:
+            conn.execute("COMMIT")
+        except BaseException:
+            # 延迟检查的外键在提交时才报错，事务仍然开着，必须回滚
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+    
+    def _report_error(self, name: str, message: str):
+        instrumentation.record_error(name)
+        logger.error(message)
+    
+    def release_thread_connection(self):
+        """关闭当前线程的连接；短期工作线程结束前调用，否则连接和文件句柄要到 close() 才释放"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        del self._local.conn
+        with self._lock:
+            self._connections = [c for c in self._connections if c is not conn]
+        try:
+            conn.close()
+        except Exception as e:
+            logger.error(f"关闭数据库连接失败: {e}")
+    
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.error(f"关闭数据库连接失败: {e}")
+        self._local = threading.local()
+    
     def _init_db(self):
         # 确保数据库文件路径存在
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
+        with self.transaction() as conn:
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS notes (
-                    id TEXT PRIMARY KEY,
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
                     title TEXT NOT NULL,
                     content TEXT,
-                    parent_id TEXT,
+                    parent_id INTEGER,
                     position INTEGER,
                     FOREIGN KEY (parent_id) REFERENCES notes(id)
                 )
@@ -33,67 +203,643 @@ class Database:
                     FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
                 )
             """)
-            conn.commit()
+        self._migrate()
+    
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(self.MIGRATIONS):
+            return
+        # 重建表时 DROP TABLE 会触发级联删除，迁移期间关闭外键（事务中不能切换）
+        self.conn.execute("PRAGMA foreign_keys=OFF")
+        try:
+            for target, name in enumerate(self.MIGRATIONS, start=1):
+                if version >= target:
+                    continue
+                with self.transaction() as conn:
+                    getattr(self, name)(conn)
+                    conn.execute(f"PRAGMA user_version = {target}")
+        finally:
+            self.conn.execute("PRAGMA foreign_keys=ON")
+    
+    def _migrate_fts(self, conn: sqlite3.Connection):
+        # 全文索引的 rowid 与 notes 表的 rowid 一致，索引的是去掉 HTML 标记后的纯文本
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts
+            USING fts5(title, body, tokenize='trigram')
+        """)
+        rows = conn.execute("SELECT rowid, title, content FROM notes")
+        conn.executemany(
+            "INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)",
+            ((rowid, title, html_to_text(content_codec.decode(content))) for rowid, title, content in rows),
+        )
+    
+    def _migrate_image_path_index(self, conn: sqlite3.Connection):
+        # 图片引用计数按路径查询
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_note_images_path ON note_images(image_path)")
+    
+    def _migrate_revisions(self, conn: sqlite3.Connection):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS note_revisions (
+                note_id TEXT NOT NULL,
+                rev INTEGER NOT NULL,
+                kind INTEGER NOT NULL,
+                data BLOB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (note_id, rev)
+            )
+        """)
+    
+    def _migrate_integer_ids(self, conn: sqlite3.Connection):
+        # 旧版本的 id 是时间戳字符串，改为自增整数主键并沿用原来的 rowid，全文索引无需重建
+        columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(notes)")}
+        if columns["id"].upper() == "INTEGER":
+            return
+        conn.execute("""
+            CREATE TABLE notes_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                content TEXT,
+                parent_id INTEGER,
+                position INTEGER,
+                FOREIGN KEY (parent_id) REFERENCES notes(id)
+            )
+        """)
+        conn.execute("CREATE TEMP TABLE id_map (old TEXT PRIMARY KEY, new INTEGER)")
+        conn.execute("INSERT INTO id_map SELECT id, rowid FROM notes")
+        # 顶层笔记的父节点是每次启动都会变化的根目录 id，统一改为 0
+        conn.execute("""
+            INSERT INTO notes_new (id, title, content, parent_id, position)
+            SELECT notes.rowid, notes.title, notes.content,
+                   CASE WHEN notes.parent_id IS NULL THEN NULL ELSE COALESCE(id_map.new, 0) END,
+                   notes.position
+            FROM notes LEFT JOIN id_map ON id_map.old = notes.parent_id
+        """)
+        for table in ("note_images", "note_revisions"):
+            conn.execute(f"""
+                UPDATE {table} SET note_id = (SELECT new FROM id_map WHERE old = {table}.note_id)
+                WHERE note_id IN (SELECT old FROM id_map)
+            """)
+        conn.execute("DROP TABLE notes")
+        conn.execute("ALTER TABLE notes_new RENAME TO notes")
+        conn.execute("DROP TABLE temp.id_map")
+    
+    def _migrate_import_journal(self, conn: sqlite3.Connection):
+        # 批量导入时已写入的源，用于中断后继续导入
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS import_journal (
+                job TEXT NOT NULL,
+                source TEXT NOT NULL,
+                note_id INTEGER NOT NULL,
+                parent_id INTEGER,
+                PRIMARY KEY (job, source)
+            )
+        """)
+    
+    def _migrate_sparse_positions(self, conn: sqlite3.Connection):
+        # 旧版本的 position 是连续下标，拉开间隔后移动笔记只需要改一行
+        conn.execute("UPDATE notes SET position = (position + 1) * ?", (self.POSITION_GAP,))
+    
+    def _migrate_parent_index(self, conn: sqlite3.Connection):
+        # 按父节点分页读取子节点（服务模式不在内存中保存整棵树）
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_parent_position ON notes(parent_id, position)")
+    
+    def _migrate_root_row(self, conn: sqlite3.Connection):
+        # 根目录写成 id 为 0 的一行，顶层笔记的 parent_id 才能满足外键约束；它没有全文索引行
+        conn.execute(
+            "INSERT OR IGNORE INTO notes (id, title, content, parent_id, position) VALUES (?, ?, '', NULL, 0)",
+            (self.ROOT_ID, self.ROOT_TITLE),
+        )
+    
+    def _migrate_image_note_index(self, conn: sqlite3.Connection):
+        # 按笔记查图片引用（删除子树、去重），包含 image_path 后不需要回表
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_note_images_note ON note_images(note_id, image_path)")
+    
+    def _migrate_change_log(self, conn: sqlite3.Connection):
+        # 任何连接（包括其他进程）对 notes 的修改都按顺序记一行，读者只需重新读取变化的笔记
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                note_id INTEGER NOT NULL,
+                op INTEGER NOT NULL,
+                content_changed INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS notes_log_insert AFTER INSERT ON notes BEGIN
+                INSERT INTO change_log (note_id, op) VALUES (new.id, {self.CHANGE_INSERT});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS notes_log_update AFTER UPDATE ON notes BEGIN
+                INSERT INTO change_log (note_id, op, content_changed)
+                VALUES (new.id, {self.CHANGE_UPDATE}, old.content IS NOT new.content);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS notes_log_delete AFTER DELETE ON notes BEGIN
+                INSERT INTO change_log (note_id, op) VALUES (old.id, {self.CHANGE_DELETE});
+            END
+        """)
+    
+    def _migrate_cjk_bigrams(self, conn: sqlite3.Connection):
+        # 中文常见的两字词短于 trigram，原先只能 LIKE 全表扫描；每篇笔记的二元组只记一次，
+        # 只用于过滤，不需要位置信息
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS notes_bigrams
+            USING fts5(grams, tokenize='unicode61', detail='none')
+        """)
+        conn.executemany(
+            "INSERT INTO notes_bigrams (rowid, grams) VALUES (?, ?)",
+            ((rowid, cjk_bigrams(f"{title} {body}"))
+             for rowid, title, body in conn.execute("SELECT rowid, title, body FROM notes_fts")),
+        )
+    
+    def index_notes(self, conn: sqlite3.Connection, rows: Iterable[Tuple[int, str, str]]):
+        """写入全文索引，rows 为 (rowid, 标题, 正文纯文本)，需在事务中调用"""
+        rows = list(rows)
+        conn.executemany("INSERT INTO notes_fts (rowid, title, body) VALUES (?, ?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO notes_bigrams (rowid, grams) VALUES (?, ?)",
+            ((rowid, cjk_bigrams(f"{title} {body}")) for rowid, title, body in rows),
+        )
     
+    def unindex_notes(self, conn: sqlite3.Connection, note_ids: Iterable[int]):
+        """从全文索引中删除笔记，需在事务中调用"""
+        params = [(note_id,) for note_id in note_ids]
+        for table in self.FTS_TABLES:
+            conn.executemany(f"DELETE FROM {table} WHERE rowid = (SELECT rowid FROM notes WHERE id = ?)", params)
+    
+    def data_version(self) -> int:
+        """当前线程的连接看到的数据版本，只有其他连接提交后才会变化"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+    
+    def last_change_seq(self) -> int:
+        return self.conn.execute("SELECT IFNULL(MAX(seq), 0) FROM change_log").fetchone()[0]
+    
+    @timed("db.get_changes")
+    def get_changes(self, after_seq: int) -> Optional[List[Tuple[int, int, int, int]]]:
+        """返回 seq 之后的 (seq, note_id, op, content_changed)；需要的日志已被截短时返回 None"""
+        try:
+            conn = self.conn
+            first = conn.execute("SELECT MIN(seq) FROM change_log").fetchone()[0]
+            if first is not None and first > after_seq + 1:
+                return None
+            return conn.execute(
+                "SELECT seq, note_id, op, content_changed FROM change_log WHERE seq > ? ORDER BY seq", (after_seq,)
+            ).fetchall()
+        except Exception as e:
+            self._report_error("db.get_changes", f"读取变更日志失败: {e}")
+            return None
+    
+    def trim_change_log(self, keep: Optional[int] = None) -> int:
+        """只保留最近的 keep 行变更日志，返回删除的行数"""
+        keep = self.CHANGE_LOG_KEEP if keep is None else keep
+        try:
+            with self.transaction() as conn:
+                return conn.execute(
+                    "DELETE FROM change_log WHERE seq <= (SELECT MAX(seq) FROM change_log) - ?", (keep,)
+                ).rowcount
+        except Exception as e:
+            self._report_error("db.trim_change_log", f"截短变更日志失败: {e}")
+            return 0
+    
+    @timed("db.create_note")
+    def create_note(self, title: str, parent_id: str, position: int) -> Optional[str]:
+        """插入一篇空笔记，返回数据库分配的 id"""
+        try:
+            with self.transaction() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO notes (title, content, parent_id, position) VALUES (?, '', ?, ?)",
+                    (title, parent_id, position),
+                )
+                self.index_notes(conn, [(cursor.lastrowid, title, "")])
+            return str(cursor.lastrowid)
+        except Exception as e:
+            self._report_error("db.create_note", f"创建笔记失败: {e}")
+            return None
+    
+    @timed("db.save_note")
     def save_note(self, note_id: str, title: str, content: str, parent_id: Optional[str], position: int) -> bool:
+        content = content_codec.minify_html(content)
+        stored = content_codec.encode(content)
+        if instrumentation.enabled:
+            instrumentation.add_bytes("db.save_note", written=_stored_size(stored))
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
-                    INSERT OR REPLACE INTO notes (id, title, content, parent_id, position)
+            with self.transaction() as conn:
+                row = conn.execute("SELECT rowid, content FROM notes WHERE id = ?", (note_id,)).fetchone()
+                previous = content_codec.decode(row[1]) if row else None
+                # 使用 upsert 而不是 INSERT OR REPLACE，保持 rowid 不变以便同步全文索引；
+                # 已有笔记的父节点和位置只由 move_note 修改，排队中的旧记录不会把移动覆盖回去
+                cursor = conn.execute("""
+                    INSERT INTO notes (id, title, content, parent_id, position)
                     VALUES (?, ?, ?, ?, ?)
-                """, (note_id, title, content, parent_id, position))
-                conn.commit()
+                    ON CONFLICT(id) DO UPDATE SET
+                        title = excluded.title,
+                        content = excluded.content
+                """, (note_id, title, stored, parent_id, position))
+                rowid = row[0] if row else cursor.lastrowid
+                if self.RECORD_REVISIONS and content and content != previous:
+                    self._append_revision(conn, note_id, previous, content)
+                for table in self.FTS_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE rowid = ?", (rowid,))
+                self.index_notes(conn, [(rowid, title, html_to_text(content))])
             return True
         except Exception as e:
-            print(f"保存笔记失败: {e}")
+            self._report_error("db.save_note", f"保存笔记失败: {e}")
             return False
     
+    def reserve_note_ids(self, count: int) -> Optional[int]:
+        """预留 count 个连续的笔记 id，返回第一个；自增计数器跳过这些 id，之后不会再分配"""
+        try:
+            with self.transaction() as conn:
+                row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'notes'").fetchone()
+                last = max(row[0] if row else 0, conn.execute("SELECT IFNULL(MAX(id), 0) FROM notes").fetchone()[0])
+                if row:
+                    conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'notes'", (last + count,))
+                else:
+                    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('notes', ?)", (last + count,))
+            return last + 1
+        except Exception as e:
+            self._report_error("db.reserve_note_ids", f"分配笔记 id 失败: {e}")
+            return None
+    
+    @timed("db.import_notes")
+    def import_notes(self, job: str, notes: List[Tuple], image_refs: List[Tuple[int, str]]) -> bool:
+        """在一个事务中批量写入导入的笔记
+
+        notes 为 (source, id, title, content, parent_id, position)，id 来自 reserve_note_ids；
+        image_refs 为 (note_id, image_path)。导入不记录修订历史。
+        """
+        try:
+            with self.transaction() as conn:
+                # 外键在提交时检查，批内笔记的顺序不受限制
+                conn.execute("PRAGMA defer_foreign_keys=ON")
+                conn.executemany(
+                    "INSERT INTO notes (id, title, content, parent_id, position) VALUES (?, ?, ?, ?, ?)",
+                    ((note_id, title, content_codec.encode(content_codec.minify_html(content)), parent_id, position)
+                     for _, note_id, title, content, parent_id, position in notes),
+                )
+                self.index_notes(conn, ((note_id, title, html_to_text(content))
+                                        for _, note_id, title, content, _, _ in notes))
+                conn.executemany(
+                    "INSERT INTO note_images (id, note_id, image_path) VALUES (?, ?, ?)",
+                    ((str(uuid4()), str(note_id), image_path) for note_id, image_path in image_refs),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO import_journal (job, source, note_id, parent_id) VALUES (?, ?, ?, ?)",
+                    ((job, source, note_id, parent_id) for source, note_id, _, _, parent_id, _ in notes),
+                )
+            return True
+        except Exception as e:
+            self._report_error("db.import_notes", f"导入笔记失败: {e}")
+            return False
+    
+    def get_import_journal(self, job: str) -> List[Tuple[str, int, int]]:
+        """返回导入任务已完成的 (source, note_id, parent_id)"""
+        try:
+            return self.conn.execute(
+                "SELECT source, note_id, parent_id FROM import_journal WHERE job = ?", (job,)
+            ).fetchall()
+        except Exception as e:
+            self._report_error("db.get_import_journal", f"读取导入记录失败: {e}")
+            return []
+    
+    def clear_import_journal(self, job: str):
+        try:
+            with self.transaction() as conn:
+                conn.execute("DELETE FROM import_journal WHERE job = ?", (job,))
+        except Exception as e:
+            self._report_error("db.clear_import_journal", f"清除导入记录失败: {e}")
+    
+    def _append_revision(self, conn: sqlite3.Connection, note_id: str, previous: Optional[str], content: str):
+        last = conn.execute("SELECT MAX(rev) FROM note_revisions WHERE note_id = ?", (note_id,)).fetchone()[0]
+        rev = (last or 0) + 1
+        if last is None or not previous or rev % self.SNAPSHOT_INTERVAL == 0:
+            kind, data = self.REVISION_FULL, content_codec.encode(content)
+        else:
+            kind, data = self.REVISION_DELTA, content_codec.make_delta(previous, content)
+        conn.execute(
+            "INSERT INTO note_revisions (note_id, rev, kind, data) VALUES (?, ?, ?, ?)",
+            (note_id, rev, kind, data),
+        )
+        # 只在新快照处裁剪，保证剩下最旧的一条仍是完整快照
+        if kind == self.REVISION_FULL and rev > self.MAX_REVISIONS:
+            conn.execute(
+                "DELETE FROM note_revisions WHERE note_id = ? AND rev < ?",
+                (note_id, rev - self.MAX_REVISIONS),
+            )
+    
+    def get_note_revisions(self, note_id: str) -> List[Tuple[int, str]]:
+        """返回笔记的 (修订号, 时间)，从旧到新"""
+        try:
+            cursor = self.conn.execute(
+                "SELECT rev, created_at FROM note_revisions WHERE note_id = ? ORDER BY rev", (note_id,)
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            self._report_error("db.get_note_revisions", f"获取修订历史失败: {e}")
+            return []
+    
+    @timed("db.get_note_revision")
+    def get_note_revision(self, note_id: str, rev: int) -> Optional[str]:
+        """从最近的完整快照开始依次应用增量，还原指定修订的正文"""
+        try:
+            rows = self.conn.execute("""
+                SELECT kind, data FROM note_revisions
+                WHERE note_id = ? AND rev <= ? AND rev >= (
+                    SELECT MAX(rev) FROM note_revisions
+                    WHERE note_id = ? AND rev <= ? AND kind = ?
+                )
+                ORDER BY rev
+            """, (note_id, rev, note_id, rev, self.REVISION_FULL)).fetchall()
+        except Exception as e:
+            self._report_error("db.get_note_revision", f"获取修订内容失败: {e}")
+            return None
+        content = None
+        for kind, data in rows:
+            if kind == self.REVISION_FULL:
+                content = content_codec.decode(data)
+            else:
+                content = content_codec.apply_delta(content, data)
+        return content
+    
+    @timed("db.move_notes")
+    def move_notes(self, moves: List[Tuple[str, str, int]]) -> bool:
+        """在一个事务中修改笔记的 (id, 父节点, 排序键)"""
+        try:
+            with self.transaction() as conn:
+                conn.executemany(
+                    "UPDATE notes SET parent_id = ?, position = ? WHERE id = ?",
+                    ((parent_id, position, note_id) for note_id, parent_id, position in moves),
+                )
+            return True
+        except Exception as e:
+            self._report_error("db.move_notes", f"移动笔记失败: {e}")
+            return False
+    
+    @timed("db.delete_note")
     def delete_note(self, note_id: str) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.transaction() as conn:
+                self.unindex_notes(conn, [note_id])
+                conn.execute("DELETE FROM note_revisions WHERE note_id = ?", (note_id,))
                 conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
-                conn.commit()
             return True
         except Exception as e:
-            print(f"删除笔记失败: {e}")
+            self._report_error("db.delete_note", f"删除笔记失败: {e}")
             return False
     
+    @timed("db.delete_notes")
+    def delete_notes(self, note_ids: List[str]) -> bool:
+        """在一个事务中批量删除笔记及其图片记录"""
+        params = [(note_id,) for note_id in note_ids]
+        try:
+            with self.transaction() as conn:
+                # 子树中父节点先于子节点删除，外键在提交时整体检查
+                conn.execute("PRAGMA defer_foreign_keys=ON")
+                conn.executemany("DELETE FROM note_images WHERE note_id = ?", params)
+                self.unindex_notes(conn, note_ids)
+                conn.executemany("DELETE FROM note_revisions WHERE note_id = ?", params)
+                conn.executemany("DELETE FROM notes WHERE id = ?", params)
+            return True
+        except Exception as e:
+            self._report_error("db.delete_notes", f"删除笔记失败: {e}")
+            return False
+    
+    @timed("db.get_all_notes")
     def get_all_notes(self) -> List[Tuple]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT id, title, content, parent_id, position 
-                    FROM notes 
-                    ORDER BY position
-                """)
-                return cursor.fetchall()
+            cursor = self.conn.execute("""
+                SELECT id, title, content, parent_id, position 
+                FROM notes 
+                WHERE id <> 0
+                ORDER BY position
+            """)
+            return [(str(note_id), title, content_codec.decode(content),
+                     None if parent_id is None else str(parent_id), position)
+                    for note_id, title, content, parent_id, position in cursor]
         except Exception as e:
-            print(f"获取笔记失败: {e}")
+            self._report_error("db.get_all_notes", f"获取笔记失败: {e}")
             return []
     
+    @timed("db.get_note_skeleton")
+    def get_note_skeleton(self) -> List[Tuple]:
+        """只读取树结构，不读取正文；id 和 parent_id 为整数"""
+        try:
+            cursor = self.conn.execute("""
+                SELECT id, title, parent_id, position
+                FROM notes
+                WHERE id <> 0
+                ORDER BY position, id
+            """)
+            return cursor.fetchall()
+        except Exception as e:
+            self._report_error("db.get_note_skeleton", f"获取笔记失败: {e}")
+            return []
+    
+    @timed("db.get_note_info")
+    def get_note_info(self, note_id: str) -> Optional[Tuple]:
+        """读取一篇笔记的 (id, title, parent_id, position)，不读取正文"""
+        try:
+            row = self.conn.execute(
+                "SELECT id, title, parent_id, position FROM notes WHERE id = ?", (note_id,)
+            ).fetchone()
+        except Exception as e:
+            self._report_error("db.get_note_info", f"获取笔记失败: {e}")
+            return None
+        if not row:
+            return None
+        return (str(row[0]), row[1], None if row[2] is None else str(row[2]), row[3])
+    
+    @timed("db.get_children")
+    def get_children(self, parent_id: str, offset: int = 0, limit: int = 100) -> Tuple[int, List[Tuple]]:
+        """按排序读取一页子节点，返回 (子节点总数, [(id, title, position, 是否有子节点)])"""
+        try:
+            conn = self.conn
+            total = conn.execute("SELECT COUNT(*) FROM notes WHERE parent_id = ?", (parent_id,)).fetchone()[0]
+            rows = conn.execute("""
+                SELECT id, title, position,
+                       EXISTS (SELECT 1 FROM notes AS c WHERE c.parent_id = notes.id)
+                FROM notes
+                WHERE parent_id = ?
+                ORDER BY position, id
+                LIMIT ? OFFSET ?
+            """, (parent_id, limit, offset)).fetchall()
+        except Exception as e:
+            self._report_error("db.get_children", f"获取子笔记失败: {e}")
+            return 0, []
+        return total, [(str(note_id), title, position, bool(has_children))
+                       for note_id, title, position, has_children in rows]
+    
+    def iter_note_contents(self):
+        """逐行返回所有笔记的 (id, content)，不会一次性读入内存"""
+        for note_id, content in self.conn.execute("SELECT id, content FROM notes"):
+            yield str(note_id), content_codec.decode(content)
+    
+    @timed("db.get_note_content")
+    def get_note_content(self, note_id: str) -> Optional[str]:
+        try:
+            row = self.conn.execute("SELECT content FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if not row:
+                return None
+            if instrumentation.enabled:
+                instrumentation.add_bytes("db.get_note_content", read=_stored_size(row[0]))
+            return content_codec.decode(row[0])
+        except Exception as e:
+            self._report_error("db.get_note_content", f"获取笔记内容失败: {e}")
+            return None
+    
+    @timed("db.search_notes")
+    def search_notes(self, query: str, limit: int = 100) -> List[SearchHit]:
+        """全文搜索标题和正文，按相关度排序；匹配位置由 match_offsets 按需计算"""
+        terms = query.lower().split()
+        if not terms:
+            return []
+        
+        # 长词走 trigram 索引，两个汉字的词走二元组索引，其余过短的词只能用 LIKE 过滤
+        long_terms = [t for t in terms if len(t) >= self.FTS_MIN_TERM]
+        bigram_terms = [t for t in terms if len(t) == 2 and _CJK_RUN.fullmatch(t)]
+        short_terms = [t for t in terms if len(t) < self.FTS_MIN_TERM and t not in bigram_terms]
+        where, params = [], []
+        for term in short_terms:
+            where.append("(notes_fts.title LIKE ? ESCAPE '\\' OR notes_fts.body LIKE ? ESCAPE '\\')")
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params.extend([pattern, pattern])
+        bigram_match = " AND ".join(f'"{t}"' for t in bigram_terms)
+        # rowid 就是笔记 id，只读索引表，不连接 notes 表，也不读取正文
+        conn = self.conn
+        try:
+            if long_terms:
+                match = " AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+                where.insert(0, "notes_fts MATCH ?")
+                params.insert(0, match)
+                if bigram_terms:
+                    # 由 trigram 条件驱动查询，二元组结果只用来过滤（+ 阻止按 rowid 逐条匹配）
+                    where.append("+notes_fts.rowid IN (SELECT rowid FROM notes_bigrams WHERE notes_bigrams MATCH ?)")
+                    params.append(bigram_match)
+                # 常见词会匹配大量笔记，先不评分地按 rowid 倒序取最新的 RANK_CANDIDATES 篇，
+                # bm25 只在这些候选上计算
+                candidates = [rowid for (rowid,) in conn.execute(f"""
+                    SELECT rowid FROM notes_fts WHERE {" AND ".join(where)}
+                    ORDER BY rowid DESC LIMIT ?
+                """, params + [self.RANK_CANDIDATES])]
+                if not candidates:
+                    return []
+                # 标题权重高于正文
+                rows = conn.execute("""
+                    SELECT rowid, bm25(notes_fts, 10.0, 1.0) AS rank
+                    FROM notes_fts
+                    WHERE notes_fts MATCH ? AND rowid >= ? AND +rowid IN (SELECT value FROM json_each(?))
+                    ORDER BY rank
+                    LIMIT ?
+                """, (match, candidates[-1], json.dumps(candidates), limit)).fetchall()
+            elif bigram_terms:
+                # 由二元组索引驱动，没有可评分的词时不排序，取够数量即可停止
+                join = "JOIN notes_fts ON notes_fts.rowid = notes_bigrams.rowid" if where else ""
+                rows = conn.execute(f"""
+                    SELECT notes_bigrams.rowid, 0
+                    FROM notes_bigrams {join}
+                    WHERE {" AND ".join(["notes_bigrams MATCH ?"] + where)}
+                    LIMIT ?
+                """, [bigram_match] + params + [limit]).fetchall()
+            else:
+                rows = conn.execute(f"""
+                    SELECT rowid, 0 FROM notes_fts WHERE {" AND ".join(where)} LIMIT ?
+                """, params + [limit]).fetchall()
+        except Exception as e:
+            self._report_error("db.search_notes", f"搜索笔记失败: {e}")
+            return []
+        return [SearchHit(str(note_id), rank) for note_id, rank in rows]
+    
+    @timed("db.match_offsets")
+    def match_offsets(self, note_ids: List[str], query: str) -> Dict[str, List[Tuple[int, int]]]:
+        """搜索词在这些笔记正文纯文本中的 (起点, 长度)，只为要显示的结果读取正文"""
+        terms = query.lower().split()
+        offsets = {}
+        try:
+            for start in range(0, len(note_ids), self.SQL_BATCH):
+                batch = note_ids[start:start + self.SQL_BATCH]
+                for rowid, body in self.conn.execute(
+                        f"SELECT rowid, body FROM notes_fts WHERE rowid IN ({','.join('?' * len(batch))})", batch):
+                    offsets[str(rowid)] = self._match_offsets(body, terms)
+        except Exception as e:
+            self._report_error("db.match_offsets", f"查找匹配位置失败: {e}")
+        return offsets
+    
+    def _match_offsets(self, body: str, terms: List[str]) -> List[Tuple[int, int]]:
+        lowered = body.lower()
+        offsets = []
+        for term in terms:
+            pos = lowered.find(term)
+            while pos >= 0 and len(offsets) < self.MAX_HIT_OFFSETS:
+                offsets.append((pos, len(term)))
+                pos = lowered.find(term, pos + len(term))
+        offsets.sort()
+        return offsets
+    
+    @timed("db.add_image")
     def add_image(self, note_id: str, image_path: str) -> str:
         image_id = str(uuid4())
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.transaction() as conn:
                 conn.execute("""
                     INSERT INTO note_images (id, note_id, image_path)
                     VALUES (?, ?, ?)
                 """, (image_id, note_id, image_path))
-                conn.commit()
             return image_id
         except Exception as e:
-            print(f"添加图片记录失败: {e}")
+            self._report_error("db.add_image", f"添加图片记录失败: {e}")
             return None
     
+    def count_image_refs(self, image_path: str) -> int:
+        try:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM note_images WHERE image_path = ?", (image_path,)
+            ).fetchone()
+            return row[0]
+        except Exception as e:
+            self._report_error("db.count_image_refs", f"获取图片引用失败: {e}")
+            # 查询失败时按仍被引用处理，避免误删文件
+            return 1
+    
+    def iter_image_refs(self):
+        """逐行返回所有图片引用 (id, note_id, image_path)"""
+        yield from self.conn.execute("SELECT id, note_id, image_path FROM note_images")
+    
+    @timed("db.get_images_for_notes")
+    def get_images_for_notes(self, note_ids: List[str]) -> List[str]:
+        paths = []
+        try:
+            for start in range(0, len(note_ids), self.SQL_BATCH):
+                batch = note_ids[start:start + self.SQL_BATCH]
+                cursor = self.conn.execute(
+                    f"SELECT image_path FROM note_images WHERE note_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                )
+                paths.extend(row[0] for row in cursor)
+        except Exception as e:
+            self._report_error("db.get_images_for_notes", f"获取笔记图片失败: {e}")
+        return paths
+    
+    @timed("db.delete_image_refs")
+    def delete_image_refs(self, image_ids: List[str]) -> bool:
+        try:
+            with self.transaction() as conn:
+                conn.executemany("DELETE FROM note_images WHERE id = ?", [(i,) for i in image_ids])
+            return True
+        except Exception as e:
+            self._report_error("db.delete_image_refs", f"删除图片记录失败: {e}")
+            return False
+    
+    @timed("db.get_note_images")
     def get_note_images(self, note_id: str) -> List[Tuple[str, str]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute("""
-                    SELECT id, image_path 
-                    FROM note_images 
-                    WHERE note_id = ?
-                """, (note_id,))
-                return cursor.fetchall()
-        except Exception as e:
-            print(f"获取笔记图片失败: {e}")
-            return []
\ No newline at end of file
+            cursor = self.conn.execute("""
+                SELECT id, image_path 
+                FROM note_images 
+                WHERE note_id = ?
+            """, (note_id,))
+            return cursor.fetchall()
+        except Exception as e:
+            self._report_error("db.get_note_images", f"获取笔记图片失败: {e}")
+            return []
@@ -0,0 +1,39 @@
+from html.parser import HTMLParser
+
+
+class _TextExtractor(HTMLParser):
+    # 这些标签内的文字不属于正文
+    SKIPPED = {"head", "style", "script", "title"}
+    # 这些标签前后需要断行，避免相邻段落的文字粘在一起
+    BLOCKS = {"p", "div", "br", "li", "tr", "td", "th", "h1", "h2", "h3", "h4", "h5", "h6", "pre", "hr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skip_depth += 1
+        elif tag in self.BLOCKS and self.parts and self.parts[-1] != "\n":
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skip_depth = max(0, self._skip_depth - 1)
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """提取 QTextEdit 生成的 HTML 中的纯文本，用于全文索引"""
+    if not html:
+        return ""
+    if "<" not in html:
+        return html
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.parts).strip()
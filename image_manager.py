@@ -1,37 +1,144 @@
 import os
+import re
+import logging
+import hashlib
 import shutil
-from uuid import uuid4
-from typing import Optional
+import threading
+from pathlib import Path
+from typing import Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
 
 class ImageManager:
-    def __init__(self):
-        self.base_dir = "d:\\program\\tree\\images"
-        os.makedirs(self.base_dir, exist_ok=True)
-    
-    def _get_note_image_dir(self, note_id: str) -> str:
-        note_image_dir = os.path.join(self.base_dir, note_id)
-        os.makedirs(note_image_dir, exist_ok=True)
-        return note_image_dir
-    
+    """按内容哈希寻址的图片仓库
+
+    图片以 sha256 命名并按哈希前缀分两级目录存放，相同内容只保存一份，
+    每次引用记录在 note_images 表中，没有引用的文件由 collect_garbage 清理。
+    正文中的图片地址相对于笔记本目录 root（如 images/ab/cd/<哈希>.png），
+    笔记本目录移动或程序在其他目录启动时地址仍然有效。
+    """
+    HASH_CHUNK = 1024 * 1024
+    IMG_SRC = re.compile(r'<img[^>]*?\ssrc="([^"]+)"', re.IGNORECASE)
+
+    def __init__(self, db, base_dir="images", root=None):
+        self.db = db
+        # base_dir 相对于笔记本目录，root 默认是当前目录
+        self.root = Path(root) if root else Path()
+        self.base_dir = self.root / base_dir
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def _hash_file(self, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def image_path(self, digest: str, ext: str) -> Path:
+        return self.base_dir / digest[:2] / digest[2:4] / f"{digest}{ext.lower()}"
+
+    @staticmethod
+    def normalize(src: str) -> str:
+        # 旧版本在 Windows 下写入的路径使用反斜杠
+        return src.replace("\\", "/")
+
+    def resolve(self, src: str) -> Path:
+        """正文中的图片地址对应的文件，绝对路径原样返回"""
+        return self.root / self.normalize(src)
+
+    def src_for(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+    def _store(self, digest: str, ext: str, write) -> str:
+        target = self.image_path(digest, ext)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再改名，并发写入同一张图片时也不会留下半个文件
+            tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            write(tmp)
+            os.replace(tmp, target)
+        return self.src_for(target)
+
+    def store_file(self, source_path: str) -> str:
+        """把文件复制进仓库（内容相同则复用），返回仓库中的路径，不记录引用"""
+        digest = self._hash_file(source_path)
+        return self._store(digest, os.path.splitext(source_path)[1], lambda tmp: shutil.copyfile(source_path, tmp))
+
+    def store_bytes(self, data: bytes, ext: str) -> str:
+        """把编码好的图片数据写入仓库，ext 带点，如 .png"""
+        return self._store(hashlib.sha256(data).hexdigest(), ext, lambda tmp: tmp.write_bytes(data))
+
+    def add_ref(self, note_id: str, src: str):
+        """记录笔记对图片的引用，同一笔记重复引用同一张图片只记一次"""
+        if not any(path == src for _, path in self.db.get_note_images(note_id)):
+            self.db.add_image(note_id, src)
+
     def save_image(self, note_id: str, source_path: str) -> Optional[str]:
         try:
-            note_image_dir = self._get_note_image_dir(note_id)
-            ext = os.path.splitext(source_path)[1]
-            new_filename = f"{uuid4()}{ext}"
-            new_path = os.path.join(note_image_dir, new_filename)
-            
-            shutil.copy2(source_path, new_path)
-            return f"images/{note_id}/{new_filename}"
+            src = self.store_file(source_path)
+            self.add_ref(note_id, src)
+            return src
         except Exception as e:
-            print(f"保存图片失败: {e}")
+            logger.error(f"保存图片失败: {e}")
             return None
-    
-    def delete_note_images(self, note_id: str) -> bool:
+
+    def refcount(self, src: str) -> int:
+        return self.db.count_image_refs(self.normalize(src))
+
+    def release(self, paths: Iterable[str]) -> int:
+        """删除已经没有任何引用的图片文件，返回删除数量"""
+        removed = 0
+        for src in set(paths):
+            src = self.normalize(src)
+            if self.refcount(src) == 0 and self._remove_file(self.resolve(src)):
+                removed += 1
+        return removed
+
+    def _remove_file(self, path: Path) -> bool:
         try:
-            note_image_dir = os.path.join(self.base_dir, note_id)
-            if os.path.exists(note_image_dir):
-                shutil.rmtree(note_image_dir)
-            return True
+            path.unlink()
+        except FileNotFoundError:
+            return False
         except Exception as e:
-            print(f"删除笔记图片失败: {e}")
-            return False
\ No newline at end of file
+            logger.error(f"删除图片失败: {e}")
+            return False
+        # 顺带清理空的分片目录
+        for parent in path.parents:
+            if parent == self.base_dir or self.base_dir not in parent.parents:
+                break
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+        return True
+
+    def collect_garbage(self, dry_run: bool = False) -> Tuple[int, int]:
+        """按笔记正文重新核对引用，删除没有被任何笔记引用的图片
+
+        返回 (删除的文件数, 释放的字节数)。
+        """
+        note_srcs = {}
+        for note_id, content in self.db.iter_note_contents():
+            srcs = {self.normalize(src) for src in self.IMG_SRC.findall(content or "")}
+            if srcs:
+                note_srcs[note_id] = srcs
+        referenced = set().union(*note_srcs.values())
+        stale_refs = [image_id for image_id, note_id, src in self.db.iter_image_refs()
+                      if self.normalize(src) not in note_srcs.get(note_id, ())]
+
+        removed, freed = 0, 0
+        for dirpath, dirnames, filenames in os.walk(self.base_dir):
+            # 以点开头的目录是缓存（如缩略图），不属于图片仓库
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                if self.src_for(path) in referenced:
+                    continue
+                size = path.stat().st_size
+                if dry_run or self._remove_file(path):
+                    removed += 1
+                    freed += size
+        if not dry_run:
+            self.db.delete_image_refs(stale_refs)
+        return removed, freed
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger("treenote.slow")
+
+# 延迟直方图各桶的上界（毫秒），最后一个桶收集更慢的调用
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class OperationStats:
+    __slots__ = ("count", "errors", "total", "max", "histogram", "bytes_read", "bytes_written")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total * 1000 / self.count if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "histogram": {f"<={b}ms" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}ms": n
+                          for i, (b, n) in enumerate(zip(BUCKETS_MS + (None,), self.histogram)) if n},
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+        }
+
+
+class Instrumentation:
+    """热点路径的调用次数、延迟直方图、读写字节数和慢操作日志
+
+    通过环境变量 TREENOTE_PROFILE=1 或 enable() 开启；关闭时被装饰的函数
+    只多一次属性判断。慢操作阈值默认 TREENOTE_SLOW_MS 毫秒，可按操作名单独设置。
+    """
+    SLOW_LOG_SIZE = 500
+
+    def __init__(self):
+        self.enabled = os.environ.get("TREENOTE_PROFILE") == "1"
+        self.slow_ms = float(os.environ.get("TREENOTE_SLOW_MS", 100))
+        self.thresholds: Dict[str, float] = {}
+        self.slow_log = deque(maxlen=self.SLOW_LOG_SIZE)
+        self._stats: Dict[str, OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+
+    def set_threshold(self, name: str, ms: float):
+        self.thresholds[name] = ms
+
+    def _get(self, name: str) -> OperationStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats.setdefault(name, OperationStats())
+        return stats
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._get(name)
+            stats.count += 1
+            stats.errors += error
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.histogram[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        ms = seconds * 1000
+        if ms >= self.thresholds.get(name, self.slow_ms):
+            entry = {"name": name, "ms": ms, "time": time.time(), "thread": threading.current_thread().name}
+            self.slow_log.append(entry)
+            logger.warning("慢操作 %s 耗时 %.1fms（线程 %s）", name, ms, entry["thread"])
+
+    def add_bytes(self, name: str, read: int = 0, written: int = 0):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._get(name)
+            stats.bytes_read += read
+            stats.bytes_written += written
+
+    def record_error(self, name: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._get(name).errors += 1
+
+    def timed(self, name: str):
+        """记录被装饰函数耗时的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                error = False
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    self.record(name, time.perf_counter() - start, error)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            operations = {name: stats.to_dict() for name, stats in sorted(self._stats.items())}
+        return {"operations": operations, "slow_log": list(self.slow_log)}
+
+    def dump(self, path: Optional[str] = None) -> str:
+        path = path or os.environ.get("TREENOTE_PROFILE_OUT") or "treenote_stats.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.slow_log.clear()
+
+
+class StartupTimer:
+    """记录启动各阶段相对进程启动的耗时
+
+    设置 TREENOTE_STARTUP_REPORT=1 或开启性能统计时，启动完成后打印各阶段耗时。
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.enabled = os.environ.get("TREENOTE_STARTUP_REPORT") == "1"
+
+    def mark(self, phase: str):
+        self.phases.append((phase, time.perf_counter()))
+
+    def report(self) -> str:
+        lines = ["启动耗时:"]
+        previous = self.start
+        for phase, at in self.phases:
+            lines.append(f"  {phase:<24}{(at - previous) * 1000:>8.1f}ms  累计 {(at - self.start) * 1000:>8.1f}ms")
+            previous = at
+        return "\n".join(lines)
+
+    def finish(self, phase: str = "完成"):
+        self.mark(phase)
+        if self.enabled or instrumentation.enabled:
+            print(self.report())
+        if instrumentation.enabled:
+            for (_, previous), (phase, at) in zip([("", self.start)] + self.phases, self.phases):
+                instrumentation.record(f"startup.{phase}", at - previous)
+
+
+instrumentation = Instrumentation()
+timed = instrumentation.timed
+startup = StartupTimer()
@@ -1,9 +1,17 @@
 import sys
+from instrumentation import startup
+from PyQt6.QtCore import QTimer
 from PyQt6.QtWidgets import QApplication
+startup.mark("导入 Qt")
 from ui.main_window import MainWindow
+startup.mark("导入界面模块")
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    startup.mark("创建 QApplication")
     window = MainWindow()
+    startup.mark("创建主窗口")
     window.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    # 事件循环处理完第一批事件时窗口已经完成首次绘制
+    QTimer.singleShot(0, lambda: startup.mark("首次绘制"))
+    sys.exit(app.exec())
@@ -0,0 +1,253 @@
+"""离线维护：检查并修复树结构、图片引用和全文索引，整理数据库文件
+
+检查项：
+  - SQLite 自身的完整性（PRAGMA quick_check）
+  - 父节点不存在的孤儿笔记、从根目录无法到达的环，统一挂回根目录末尾
+  - 笔记已删除的图片记录、正文引用了但没有记录的图片、文件已丢失的图片、
+    没有任何笔记引用的图片文件
+  - 全文索引中多余或缺少的行
+  - 修复后剩余的外键冲突
+修复按批在事务中写入。之后执行 ANALYZE、全文索引合并和 VACUUM（或增量 VACUUM），
+并报告文件大小和几个典型查询在维护前后的耗时。应在没有其他程序打开笔记本时运行。
+"""
+import os
+import statistics
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List
+
+from html_text import html_to_text
+import content_codec
+
+# 用于对比维护前后耗时的典型查询
+BENCH_QUERIES = (
+    ("读取树结构", "SELECT id, title, parent_id, position FROM notes WHERE id <> 0 ORDER BY position, id", ()),
+    ("子节点分页", "SELECT id, title FROM notes WHERE parent_id = 0 ORDER BY position, id LIMIT 100", ()),
+    ("按笔记查图片", "SELECT image_path FROM note_images WHERE note_id = ?", ("1",)),
+    ("按路径数引用", "SELECT COUNT(*) FROM note_images WHERE image_path = ?", ("images/none.png",)),
+    ("全文搜索", "SELECT rowid FROM notes_fts WHERE notes_fts MATCH ? LIMIT 50", ('"笔记本"',)),
+    ("两字搜索", "SELECT rowid FROM notes_bigrams WHERE notes_bigrams MATCH ? LIMIT 50", ('"笔记"',)),
+)
+BENCH_REPEAT = 5
+# PRAGMA auto_vacuum 的取值
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def file_size(db) -> int:
+    """数据库文件连同 WAL 文件的大小"""
+    total = 0
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            total += os.path.getsize(f"{db.db_path}{suffix}")
+        except OSError:
+            pass
+    return total
+
+
+def measure_queries(db) -> Dict[str, float]:
+    """每个查询执行若干次，返回中位数耗时（毫秒）"""
+    results = {}
+    for name, sql, params in BENCH_QUERIES:
+        samples = []
+        for _ in range(BENCH_REPEAT):
+            start = time.perf_counter()
+            db.conn.execute(sql, params).fetchall()
+            samples.append(time.perf_counter() - start)
+        results[name] = statistics.median(samples) * 1000
+    return results
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def find_tree_problems(db):
+    """返回 (孤儿笔记, 环上选出的断开点)；根目录 id 为 0"""
+    parents = dict(db.conn.execute("SELECT id, parent_id FROM notes WHERE id <> 0"))
+    orphans = sorted(nid for nid, parent in parents.items() if parent is None or (parent != 0 and parent not in parents))
+    children = defaultdict(list)
+    for nid, parent in parents.items():
+        children[parent].append(nid)
+
+    reachable = set()
+
+    def mark(start):
+        stack = [start]
+        while stack:
+            nid = stack.pop()
+            if nid not in reachable:
+                reachable.add(nid)
+                stack.extend(children.get(nid, ()))
+    mark(0)
+    # 孤儿会被挂回根目录，它们的子树也算可到达
+    for nid in orphans:
+        mark(nid)
+
+    # 剩下的笔记都在环上或挂在环下，沿父节点走到重复出现的笔记即找到环
+    breaks = []
+    for nid in sorted(parents):
+        if nid in reachable:
+            continue
+        on_path = set()
+        current = nid
+        while current not in on_path:
+            on_path.add(current)
+            current = parents[current]
+        # 从环上断开一处挂回根目录，环和挂在环下的笔记随之可到达
+        breaks.append(current)
+        mark(current)
+    return orphans, breaks
+
+
+def reattach_to_root(db, note_ids: List[int]) -> int:
+    """把笔记按顺序挂到根目录末尾"""
+    if not note_ids:
+        return 0
+    last = db.conn.execute("SELECT IFNULL(MAX(position), 0) FROM notes WHERE parent_id = 0").fetchone()[0]
+    moves = [(0, last + (i + 1) * db.POSITION_GAP, nid) for i, nid in enumerate(note_ids)]
+    for batch in _batches(moves, db.SQL_BATCH):
+        with db.transaction() as conn:
+            conn.executemany("UPDATE notes SET parent_id = ?, position = ? WHERE id = ?", batch)
+    return len(moves)
+
+
+def check_images(db, images) -> dict:
+    """核对图片引用，返回 dangling（笔记不存在的记录 id）、missing_refs（(笔记 id, 路径)）
+    和 missing_files（正文引用但文件不存在的路径）"""
+    dangling = [image_id for (image_id,) in db.conn.execute(
+        "SELECT id FROM note_images WHERE CAST(note_id AS INTEGER) NOT IN (SELECT id FROM notes)")]
+    refs = defaultdict(set)
+    for _, note_id, src in db.iter_image_refs():
+        refs[str(note_id)].add(images.normalize(src))
+    base = images.src_for(images.base_dir).rstrip("/") + "/"
+    missing_refs, missing_files = [], set()
+    for note_id, content in db.iter_note_contents():
+        for src in {images.normalize(src) for src in images.IMG_SRC.findall(content or "")}:
+            # 只核对图片仓库中的图片，外部链接不归仓库管理
+            if not src.startswith(base):
+                continue
+            if src not in refs[note_id]:
+                missing_refs.append((note_id, src))
+            if not images.resolve(src).exists():
+                missing_files.add(src)
+    return {"dangling": dangling, "missing_refs": missing_refs, "missing_files": sorted(missing_files)}
+
+
+def check_fts(db) -> dict:
+    """全文索引表中多余的 rowid 和至少缺一张索引表的笔记 rowid（根目录没有索引行）"""
+    conn = db.conn
+    extra, missing = set(), set()
+    for table in db.FTS_TABLES:
+        extra.update(rowid for (rowid,) in conn.execute(
+            f"SELECT rowid FROM {table} WHERE rowid NOT IN (SELECT rowid FROM notes)"))
+        missing.update(rowid for (rowid,) in conn.execute(
+            f"SELECT rowid FROM notes WHERE id <> 0 AND rowid NOT IN (SELECT rowid FROM {table})"))
+    return {"extra": sorted(extra), "missing": sorted(missing)}
+
+
+def repair_fts(db, extra: List[int], missing: List[int]):
+    # 缺索引的笔记先从各索引表删除残留的行，再整体重建
+    for batch in _batches(extra + missing, db.SQL_BATCH):
+        with db.transaction() as conn:
+            for table in db.FTS_TABLES:
+                conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(rowid,) for rowid in batch])
+    for batch in _batches(missing, db.SQL_BATCH):
+        with db.transaction() as conn:
+            rows = conn.execute(
+                f"SELECT rowid, title, content FROM notes WHERE rowid IN ({','.join('?' * len(batch))})", batch
+            ).fetchall()
+            db.index_notes(conn, ((rowid, title, html_to_text(content_codec.decode(content)))
+                                  for rowid, title, content in rows))
+
+
+def optimize(db, vacuum: bool = True, quick: bool = False) -> List[str]:
+    """更新统计信息、合并全文索引段并整理文件，返回执行过的步骤"""
+    conn = db.conn
+    steps = []
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    steps.append("ANALYZE")
+    for table in db.FTS_TABLES:
+        conn.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+    steps.append("全文索引合并")
+    if db.trim_change_log():
+        steps.append("截短变更日志")
+    if vacuum:
+        if quick and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == AUTO_VACUUM_INCREMENTAL:
+            conn.execute("PRAGMA incremental_vacuum").fetchall()
+            steps.append("增量 VACUUM")
+        else:
+            # 改为增量模式后，之后的 --quick 维护只需释放空闲页，不必重写整个文件
+            conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+            conn.execute("VACUUM")
+            steps.append("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    return steps
+
+
+def run(db, images, repair: bool = True, vacuum: bool = True, quick: bool = False,
+        log: Callable[[str], None] = print) -> dict:
+    """执行一次完整维护，repair 为 False 时只检查不修改"""
+    report = {"size_before": file_size(db), "queries_before": measure_queries(db)}
+
+    report["integrity"] = [row[0] for row in db.conn.execute("PRAGMA quick_check") if row[0] != "ok"]
+    if report["integrity"]:
+        # 文件本身损坏时不做任何修改，应先从备份恢复
+        log("数据库完整性检查失败:\n  " + "\n  ".join(report["integrity"]))
+        return report
+
+    orphans, breaks = find_tree_problems(db)
+    image_problems = check_images(db, images)
+    fts_problems = check_fts(db)
+    report.update(orphans=len(orphans), cycles=len(breaks),
+                  dangling_images=len(image_problems["dangling"]),
+                  missing_image_refs=len(image_problems["missing_refs"]),
+                  missing_image_files=image_problems["missing_files"],
+                  fts_extra=len(fts_problems["extra"]), fts_missing=len(fts_problems["missing"]))
+    log(f"孤儿笔记 {len(orphans)}，环 {len(breaks)}，"
+        f"失效图片记录 {len(image_problems['dangling'])}，缺少的图片记录 {len(image_problems['missing_refs'])}，"
+        f"丢失的图片文件 {len(image_problems['missing_files'])}，"
+        f"全文索引多余 {len(fts_problems['extra'])}、缺少 {len(fts_problems['missing'])}")
+    for src in image_problems["missing_files"]:
+        log(f"  图片文件不存在: {src}")
+    if not repair:
+        removed, freed = images.collect_garbage(dry_run=True)
+        report["unreferenced_files"] = removed
+        log(f"没有引用的图片文件 {removed} 个（{freed} 字节）")
+        return report
+
+    reattach_to_root(db, orphans + breaks)
+    db.delete_image_refs(image_problems["dangling"])
+    for batch in _batches(image_problems["missing_refs"], db.SQL_BATCH):
+        with db.transaction():
+            for note_id, src in batch:
+                db.add_image(note_id, src)
+    repair_fts(db, fts_problems["extra"], fts_problems["missing"])
+    # 正文已不再引用的图片记录和文件
+    removed, freed = images.collect_garbage()
+    report["unreferenced_files"] = removed
+    log(f"已修复；删除没有引用的图片文件 {removed} 个（{freed} 字节）")
+
+    report["foreign_key_violations"] = len(db.conn.execute("PRAGMA foreign_key_check").fetchall())
+    if report["foreign_key_violations"]:
+        log(f"仍有 {report['foreign_key_violations']} 处外键冲突")
+
+    report["steps"] = optimize(db, vacuum, quick)
+    report["size_after"] = file_size(db)
+    report["queries_after"] = measure_queries(db)
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = []
+    if "size_after" in report:
+        before, after = report["size_before"], report["size_after"]
+        lines.append(f"文件大小: {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB（{(after - before) / 1e6:+.2f} MB）")
+        lines.append("执行: " + "、".join(report["steps"]))
+        lines.append(f"{'查询':<12}{'维护前 ms':>12}{'维护后 ms':>12}")
+        for name, before_ms in report["queries_before"].items():
+            lines.append(f"{name:<12}{before_ms:>12.3f}{report['queries_after'][name]:>12.3f}")
+    else:
+        lines.append(f"文件大小: {report['size_before'] / 1e6:.2f} MB")
+    return "\n".join(lines)
@@ -1,31 +1,71 @@
-from datetime import datetime
-from typing import Optional, List
+from typing import List, Optional
+
+from note_store import NoteStore
+
 
 class Note:
-    def __init__(self, title: str, content: str = "", parent: Optional['Note'] = None):
-        self.id = str(datetime.now().timestamp())
-        self.title = title
-        self.content = content
-        self.parent = parent
-        self.children: List[Note] = []
-        
-    def add_child(self, child: 'Note') -> bool:
-        if self._would_create_cycle(child):
-            return False
-        
-        child.parent = self
-        self.children.append(child)
-        return True
-    
-    def remove_child(self, child: 'Note') -> None:
-        if child in self.children:
-            self.children.remove(child)
-            child.parent = None
-            
+    """NoteStore 中一篇笔记的轻量视图，id 和子节点 id 以字符串形式给出"""
+    __slots__ = ("store", "nid")
+
+    def __init__(self, store: NoteStore, nid: int):
+        self.store = store
+        self.nid = nid
+
+    @property
+    def id(self) -> str:
+        return str(self.nid)
+
+    @property
+    def title(self) -> str:
+        return self.store.title(self.nid)
+
+    @title.setter
+    def title(self, title: str):
+        self.store.set_title(self.nid, title)
+
+    @property
+    def parent(self) -> Optional['Note']:
+        parent = self.store.parent(self.nid)
+        return None if parent is None else Note(self.store, parent)
+
+    @property
+    def children(self) -> List[str]:
+        return [str(nid) for nid in self.store.child_ids(self.nid)]
+
     def _would_create_cycle(self, new_child: 'Note') -> bool:
-        current = self
-        while current:
-            if current == new_child:
-                return True
-            current = current.parent
-        return False
\ No newline at end of file
+        return self.store.is_ancestor(new_child.nid, self.nid)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Note) and other.store is self.store and other.nid == self.nid
+
+    def __hash__(self) -> int:
+        return hash(self.nid)
+
+
+class NoteMap:
+    """按字符串 id 访问笔记的只读映射，兼容原先的 NoteManager.notes 字典"""
+    __slots__ = ("manager",)
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def __getitem__(self, note_id: str) -> Note:
+        nid = self.manager.nid(note_id)
+        if nid not in self.manager.store:
+            raise KeyError(note_id)
+        return Note(self.manager.store, nid)
+
+    def get(self, note_id: str, default=None) -> Optional[Note]:
+        try:
+            return self[note_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, note_id) -> bool:
+        return self.manager.nid(note_id) in self.manager.store
+
+    def __iter__(self):
+        return (str(nid) for nid in self.manager.store)
+
+    def __len__(self) -> int:
+        return len(self.manager.store)
@@ -0,0 +1,360 @@
+"""笔记的批量导入与导出
+
+导入源可以是目录树（.md / .markdown / .html / .htm / .txt 文件和子目录，同名的文件与目录
+合并为一篇带子笔记的笔记）或 JSON Lines 归档。源以生成器流式读取，每批笔记在一个事务中
+用 executemany 写入，已写入的源同时记入 import_journal 表，中断后用同样的参数重新导入会
+跳过已完成的部分。导出按先序遍历子树，逐篇读取正文写出，内存占用与笔记数量无关。
+"""
+import html
+import json
+import logging
+import os
+import re
+import shutil
+from collections import namedtuple
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from instrumentation import timed
+from note_store import GAP
+
+logger = logging.getLogger(__name__)
+
+try:
+    import markdown as _markdown
+except ImportError:
+    _markdown = None
+
+NOTE_SUFFIXES = {".md": "markdown", ".markdown": "markdown", ".html": "html", ".htm": "html", ".txt": "text"}
+# 目录导出时图片复制到这个隐藏目录，导入时以点开头的目录会被跳过
+EXPORT_IMAGES_DIR = ".images"
+BATCH_SIZE = 500
+MAX_FILENAME = 120
+
+# 待导入的一篇笔记：path 为正文文件（没有正文时为 None），content 为归档中直接给出的正文，
+# base_dir 是解析正文中相对图片路径的目录
+ImportItem = namedtuple("ImportItem", ["source", "parent", "title", "format", "path", "content", "base_dir"])
+
+_UNSAFE_NAME = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+_MD_IMAGE = re.compile(r'!\[([^\]]*)\]\(([^)\s]+)(?:\s+"[^"]*")?\)')
+_MD_LINK = re.compile(r'\[([^\]]+)\]\(([^)\s]+)\)')
+_MD_EMPHASIS = re.compile(r'(\*\*|__)(.+?)\1|(\*|_)(.+?)\3')
+_MD_CODE = re.compile(r'`([^`]+)`')
+
+
+def _inline_markdown(text: str) -> str:
+    text = html.escape(text, quote=False)
+    text = _MD_IMAGE.sub(lambda m: f'<img src="{m.group(2)}" alt="{m.group(1)}" />', text)
+    text = _MD_LINK.sub(lambda m: f'<a href="{m.group(2)}">{m.group(1)}</a>', text)
+    text = _MD_CODE.sub(r'<code>\1</code>', text)
+    return _MD_EMPHASIS.sub(lambda m: f"<b>{m.group(2)}</b>" if m.group(1) else f"<i>{m.group(4)}</i>", text)
+
+
+def markdown_to_html(text: str) -> str:
+    """安装了 markdown 包时使用它，否则只转换标题、段落、列表、代码块和行内格式"""
+    if _markdown is not None:
+        return _markdown.markdown(text)
+    blocks, paragraph, items, code = [], [], [], None
+
+    def flush():
+        if paragraph:
+            blocks.append("<p>" + "<br />".join(_inline_markdown(line) for line in paragraph) + "</p>")
+            paragraph.clear()
+        if items:
+            blocks.append("<ul>" + "".join(f"<li>{_inline_markdown(item)}</li>" for item in items) + "</ul>")
+            items.clear()
+
+    for line in text.splitlines():
+        if code is not None:
+            if line.strip().startswith("```"):
+                blocks.append("<pre>" + html.escape("\n".join(code)) + "</pre>")
+                code = None
+            else:
+                code.append(line)
+            continue
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            flush()
+            code = []
+        elif not stripped:
+            flush()
+        elif stripped.startswith("#"):
+            flush()
+            level = min(len(stripped) - len(stripped.lstrip("#")), 6)
+            blocks.append(f"<h{level}>{_inline_markdown(stripped[level:].strip())}</h{level}>")
+        elif stripped[:2] in ("- ", "* ", "+ "):
+            if paragraph:
+                flush()
+            items.append(stripped[2:])
+        else:
+            if items:
+                flush()
+            paragraph.append(stripped)
+    if code is not None:
+        blocks.append("<pre>" + html.escape("\n".join(code)) + "</pre>")
+    flush()
+    return "".join(blocks)
+
+
+def text_to_html(text: str) -> str:
+    paragraphs = re.split(r"\n\s*\n", text.strip())
+    return "".join("<p>" + html.escape(p).replace("\n", "<br />") + "</p>" for p in paragraphs if p)
+
+
+def to_html(text: str, fmt: str) -> str:
+    if fmt == "markdown":
+        return markdown_to_html(text)
+    if fmt == "text":
+        return text_to_html(text)
+    return text
+
+
+# 导入源
+
+def _note_file(path: str) -> Optional[str]:
+    return NOTE_SUFFIXES.get(os.path.splitext(path)[1].lower())
+
+
+def iter_directory(root: Path) -> Iterator[ImportItem]:
+    """逐个目录读取，父笔记总在子笔记之前返回；source 是相对 root 的路径（不含扩展名）"""
+    root = Path(root)
+    if root.is_file():
+        fmt = _note_file(root.name)
+        if fmt:
+            yield ImportItem(root.stem, None, root.stem, fmt, str(root), None, str(root.parent))
+        return
+    stack = [(str(root), None)]
+    while stack:
+        directory, parent_source = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logger.error(f"读取目录失败: {e}")
+            continue
+        files, dirs = {}, {}
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                dirs[entry.name] = entry.path
+            elif _note_file(entry.name):
+                files.setdefault(os.path.splitext(entry.name)[0], entry.path)
+        subdirs = []
+        for title in sorted(set(files) | set(dirs)):
+            source = title if parent_source is None else f"{parent_source}/{title}"
+            path = files.get(title)
+            yield ImportItem(source, parent_source, title, _note_file(path) if path else "html", path, None, directory)
+            if title in dirs:
+                subdirs.append((dirs[title], source))
+        stack.extend(reversed(subdirs))
+
+
+def iter_jsonl(path: Path) -> Iterator[ImportItem]:
+    """每行一篇笔记: {"id", "parent", "title", "content", "format"}，父笔记必须出现在前面"""
+    base_dir = str(Path(path).parent)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            parent = record.get("parent")
+            yield ImportItem(str(record["id"]), None if parent is None else str(parent),
+                             record.get("title") or "无标题", record.get("format", "html"),
+                             None, record.get("content") or "", base_dir)
+
+
+def detect_format(source: Path) -> str:
+    return "jsonl" if Path(source).suffix.lower() in (".jsonl", ".json") else "dir"
+
+
+def iter_source(source: Path, fmt: str) -> Iterator[ImportItem]:
+    return iter_jsonl(source) if fmt == "jsonl" else iter_directory(source)
+
+
+def _load_content(item: ImportItem, images) -> tuple:
+    """读取并转换正文，把引用的本地图片复制进图片仓库，返回 (html, 图片路径列表)"""
+    if item.path:
+        with open(item.path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    else:
+        text = item.content or ""
+    content = to_html(text, item.format)
+    stored = {}
+    for src in set(images.IMG_SRC.findall(content)):
+        if re.match(r"^[a-z][a-z0-9+.-]*:", src, re.IGNORECASE) and not src.startswith("file:"):
+            continue
+        path = src[len("file://"):] if src.startswith("file://") else src
+        path = os.path.join(item.base_dir, path)
+        if os.path.isfile(path):
+            try:
+                stored[src] = images.store_file(path)
+            except OSError as e:
+                logger.error(f"复制图片失败: {e}")
+    for src, new_src in stored.items():
+        content = content.replace(f'src="{src}"', f'src="{new_src}"')
+    return content, sorted(set(stored.values()))
+
+
+@timed("io.import_notes")
+def import_notes(manager, source, parent_id: str, fmt: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                 progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """把 source 导入到 parent_id 之下，返回本次新导入的笔记数"""
+    source = Path(source)
+    fmt = fmt or detect_format(source)
+    db, store = manager.db, manager.store
+    target = manager.nid(parent_id)
+    if target not in store:
+        raise ValueError(f"父笔记不存在: {parent_id}")
+    job = f"{fmt}:{source.resolve()}:{target}"
+
+    # 恢复上次中断时已经导入的部分
+    ids = {src: note_id for src, note_id, _ in db.get_import_journal(job)}
+    total = sum(1 for _ in iter_source(source, fmt))
+
+    imported, done = 0, 0
+    items = iter_source(source, fmt)
+    while True:
+        chunk = list(islice(items, batch_size))
+        if not chunk:
+            break
+        done += len(chunk)
+        batch = [item for item in chunk if item.source not in ids]
+        if batch:
+            first = db.reserve_note_ids(len(batch))
+            if first is None:
+                return imported
+            rows, image_refs, next_keys = [], [], {}
+            for note_id, item in enumerate(batch, first):
+                parent = target if item.parent is None else ids.get(item.parent, target)
+                content, srcs = _load_content(item, manager.images)
+                # 已导入的部分都在 store 中，本批内的兄弟依次排在后面
+                key = next_keys.get(parent)
+                if key is None:
+                    key = store.next_key(parent)
+                next_keys[parent] = key + GAP
+                rows.append((item.source, note_id, item.title, content, parent, key))
+                image_refs.extend((note_id, src) for src in srcs)
+                ids[item.source] = note_id
+            # 写入失败时保留导入记录，重新执行可以从这一批继续
+            if not db.import_notes(job, rows, image_refs):
+                return imported
+            for _, note_id, title, _, parent, key in rows:
+                store.add(note_id, title, parent, key)
+            manager.generation += 1
+            imported += len(rows)
+        if progress:
+            progress(done, total)
+    db.clear_import_journal(job)
+    return imported
+
+
+# 导出
+
+def safe_filename(title: str, used: set) -> str:
+    """把标题转换为合法且在同一目录下不重复的文件名（不区分大小写）"""
+    name = _UNSAFE_NAME.sub("_", title).strip().rstrip(". ")[:MAX_FILENAME] or "无标题"
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        n += 1
+        candidate = f"{name} ({n})"
+    used.add(candidate.lower())
+    return candidate
+
+
+def _note_content(manager, note_id: str) -> str:
+    # 优先使用缓存中尚未写回的正文，但不为导出填充缓存
+    content = manager.content_cache.get(note_id)
+    if content is None:
+        content = manager.db.get_note_content(note_id) or ""
+    return content
+
+
+def _export_images(content: str, images, images_dir: Path, relative_to: Path, copied: set) -> str:
+    """把正文引用的仓库图片复制到 images_dir，并把地址改写为相对 relative_to 的路径"""
+    def replace(match):
+        src = images.normalize(match.group(1))
+        path = images.resolve(src)
+        if not path.is_file():
+            return match.group(0)
+        target = images_dir / (path.relative_to(images.base_dir) if images.base_dir in path.parents else path.name)
+        if src not in copied:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, target)
+            copied.add(src)
+        return match.group(0).replace(match.group(1), Path(os.path.relpath(target, relative_to)).as_posix())
+    return images.IMG_SRC.sub(replace, content)
+
+
+def _export_roots(manager, note_id: str) -> list:
+    # 导出根目录时导出它的所有子笔记
+    return manager.child_ids(note_id) if note_id == manager.ROOT_ID else [note_id]
+
+
+@timed("io.export_notes")
+def export_notes(manager, note_id: str, target, fmt: Optional[str] = None,
+                 progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """导出 note_id 的子树，返回导出的笔记数
+
+    dir 格式生成与导入对应的目录镜像：每篇笔记一个 .html 文件，有子笔记时再加一个同名目录；
+    jsonl 格式每行一篇笔记。图片都复制到导出位置，正文中的地址改为相对路径。
+    """
+    if note_id not in manager.notes:
+        raise ValueError(f"笔记不存在: {note_id}")
+    target = Path(target)
+    fmt = fmt or detect_format(target)
+    total = sum(1 for root in _export_roots(manager, note_id) for _ in manager.iter_subtree(root))
+    if fmt == "jsonl":
+        return _export_jsonl(manager, note_id, target, total, progress)
+    return _export_dir(manager, note_id, target, total, progress)
+
+
+def _export_dir(manager, note_id, target: Path, total, progress) -> int:
+    target.mkdir(parents=True, exist_ok=True)
+    images_dir = target / EXPORT_IMAGES_DIR
+    copied = set()
+    count = 0
+    # 栈中每项为 (笔记, 所在目录, 该目录已使用的文件名)，同一目录的兄弟共用一个集合
+    top_used = set()
+    stack = [(root, target, top_used) for root in reversed(_export_roots(manager, note_id))]
+    while stack:
+        current, directory, used = stack.pop()
+        name = safe_filename(manager.notes[current].title, used)
+        content = _export_images(_note_content(manager, current), manager.images, images_dir, directory, copied)
+        with open(directory / f"{name}.html", "w", encoding="utf-8") as f:
+            f.write(content)
+        children = manager.child_ids(current)
+        if children:
+            child_dir = directory / name
+            child_dir.mkdir(exist_ok=True)
+            child_used = set()
+            stack.extend((child, child_dir, child_used) for child in reversed(children))
+        count += 1
+        if progress:
+            progress(count, total)
+    return count
+
+
+def _export_jsonl(manager, note_id, target: Path, total, progress) -> int:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    images_dir = target.parent / "images"
+    copied = set()
+    count = 0
+    roots = set(_export_roots(manager, note_id))
+    with open(target, "w", encoding="utf-8") as f:
+        for root in _export_roots(manager, note_id):
+            for current in manager.iter_subtree(root):
+                content = _export_images(_note_content(manager, current), manager.images, images_dir,
+                                         target.parent, copied)
+                record = {
+                    "id": current,
+                    "parent": None if current in roots else manager.parent_of(current),
+                    "title": manager.notes[current].title,
+                    "content": content,
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+                if progress:
+                    progress(count, total)
+    return count
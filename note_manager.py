@@ -1,101 +1,458 @@
-from typing import Dict, Optional
+import os
+import logging
+import marshal
+from collections import namedtuple
+from typing import Optional
 from pathlib import Path
-import shutil
-from note import Note
+from note import Note, NoteMap
+from note_store import NoteStore, ROOT, GAP
 from database import Database
+from content_cache import ContentCache
+from instrumentation import timed
+import content_codec
+
+logger = logging.getLogger(__name__)
+
+# 树和笔记的一次变化；content 表示正文被其他连接改过，已缓存的正文和文档可能过时
+NoteEvent = namedtuple("NoteEvent", ["kind", "note_id", "content"], defaults=(False,))
 
 class NoteManager:
-    def __init__(self):
-        self.notes = {}
-        self.db = Database()
-        self.root = Note("根目录")
-        self.notes[self.root.id] = self.root
-        self.images_dir = Path("images")
-        self.images_dir.mkdir(exist_ok=True)
-        self._load_notes()
+    # 笔记正文缓存上限（字节），正文按需从数据库读取
+    CONTENT_CACHE_BYTES = 32 * 1024 * 1024
+    # 树结构快照的格式版本，格式变化时递增使旧快照失效
+    SNAPSHOT_VERSION = 3
+    # 移动后与兄弟的键间隔小于该值时，把父节点记入待重新编号的集合
+    REBALANCE_MIN_GAP = 8
+    ROOT_ID = str(ROOT)
+    ROOT_TITLE = "根目录"
+    # NoteEvent.kind；RELOADED 表示树结构整体重新读取过
+    CREATED = "created"
+    UPDATED = "updated"
+    MOVED = "moved"
+    DELETED = "deleted"
+    RELOADED = "reloaded"
+
+    def __init__(self, load: bool = True, directory=None):
+        # 树结构保存在以整数 id 为下标的紧凑数组中，对外仍使用字符串 id
+        self.store = NoteStore(self.ROOT_TITLE)
+        self.notes = NoteMap(self)
+        # 笔记本目录下的 notes.db 与 images/，默认是当前目录
+        self.directory = Path(directory) if directory else None
+        self.db = Database(self.directory / "notes.db" if self.directory else None)
+        self.content_cache = ContentCache(self.CONTENT_CACHE_BYTES)
+        self._images = None
+        # 快速打开用的标题索引，第一次用到时建立，之后随增删改名增量维护
+        self._title_index = None
+        # 树结构每次变化时递增，用于判断后台读取的结果是否已经过时
+        self.generation = 0
+        # 树结构已经与数据库一致（而不是来自快照或尚未加载）
+        self.tree_loaded = False
+        # 排序键间隔快用完、等待空闲时重新编号的父节点
+        self.pending_rebalance = set()
+        # 变更事件的订阅者，在修改树结构的线程中同步调用
+        self.listeners = []
+        # 已经同步到的变更日志位置和上次看到的 data_version，见 poll_changes
+        self._change_seq = 0
+        self._data_version = None
+        if load:
+            self._load_notes()
+    
+    @property
+    def images(self):
+        # 图片仓库在第一次用到时才创建，不占用启动时间
+        if self._images is None:
+            from image_manager import ImageManager
+            self._images = ImageManager(self.db, "images", self.directory)
+        return self._images
+    
+    @property
+    def title_index(self):
+        if self._title_index is None:
+            self._title_index = self._build_title_index()
+        return self._title_index
+    
+    @timed("notes.build_title_index")
+    def _build_title_index(self):
+        from title_index import TitleIndex
+        return TitleIndex(self.store)
+    
+    @property
+    def root(self) -> Note:
+        return Note(self.store, ROOT)
+    
+    @staticmethod
+    def nid(note_id) -> int:
+        """字符串 id 转为 NoteStore 下标，无效 id 返回 -1"""
+        try:
+            return int(note_id)
+        except (TypeError, ValueError):
+            return -1
     
+    @property
+    def snapshot_path(self) -> Path:
+        return self.db.db_path.with_suffix(".snapshot")
+    
+    @timed("notes._load_notes")
     def _load_notes(self):
-        notes_data = self.db.get_all_notes()
-        for note_data in notes_data:
-            note_id, title, content, parent_id, position = note_data
-            if note_id == self.root.id:
-                continue
-            note = Note(title, content)
-            note.id = note_id
-            self.notes[note_id] = note
-            
-        for note_data in notes_data:
-            note_id, _, _, parent_id, _ = note_data
-            if note_id == self.root.id or not parent_id:
-                continue
-            parent = self.notes.get(parent_id, self.root)
-            if note_id in self.notes:
-                parent.children.append(note_id)
+        # 启动时只加载树结构，正文在首次访问时读取
+        self._set_tree(self.read_tree())
+    
+    def read_tree(self) -> NoteStore:
+        """从数据库读取树结构，不修改当前状态，可以在后台线程调用"""
+        # 先记下日志位置，读取期间的修改在下次 poll_changes 时再核对一遍
+        change_seq = self.db.last_change_seq()
+        store = NoteStore.from_rows(self.db.get_note_skeleton(), self.ROOT_TITLE)
+        store.change_seq = change_seq
+        return store
+    
+    def _set_tree(self, store: NoteStore, content: bool = False):
+        self.store = store
+        self._change_seq = store.change_seq
+        self._title_index = None
+        self.generation += 1
+        self.tree_loaded = True
+        self._emit(self.RELOADED, self.ROOT_ID, content)
+    
+    def apply_tree(self, store: NoteStore) -> bool:
+        """用后台读取的树结构替换当前状态，结构和标题都相同时返回 False"""
+        if store.same_tree(self.store):
+            self._change_seq = store.change_seq
+            self.tree_loaded = True
+            return False
+        self._set_tree(store)
+        return True
+    
+    def subscribe(self, listener):
+        """listener(NoteEvent) 在每次增删改、移动和重新读取之后调用"""
+        self.listeners.append(listener)
+    
+    def unsubscribe(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
     
+    def _emit(self, kind: str, note_id: str, content: bool = False) -> NoteEvent:
+        event = NoteEvent(kind, note_id, content)
+        for listener in list(self.listeners):
+            listener(event)
+        return event
+    
+    @timed("notes.poll_changes")
+    def poll_changes(self) -> list:
+        """把其他连接（其他进程、窗口或本进程的写入线程）提交的修改同步到内存，返回发出的事件
+
+        data_version 没有变化时只执行这一条 PRAGMA；有变化时按变更日志只重新读取变化过的笔记，
+        与内存比较后才发出事件，自己的写入因此不会重复通知。data_version 按连接计算，
+        应总在同一个线程调用，并且在自己排队的写入落盘之后调用。
+        日志已经截短或变化无法增量应用时整体重新读取树结构。
+        """
+        if not self.tree_loaded:
+            return []
+        version = self.db.data_version()
+        if version == self._data_version:
+            return []
+        self._data_version = version
+        changes = self.db.get_changes(self._change_seq)
+        if changes is None:
+            return [self._reload()]
+        if not changes:
+            return []
+        # 同一笔记多次变化只核对一次；按第一次出现的顺序处理，父节点总是先于子节点创建
+        content_changed = {}
+        for _, nid, _, changed in changes:
+            content_changed[nid] = content_changed.get(nid, False) or bool(changed)
+        self._change_seq = changes[-1][0]
+        events = []
+        for nid, changed in content_changed.items():
+            applied = self._apply_change(nid, changed)
+            if applied is None:
+                events.append(self._reload())
+                break
+            events.extend(applied)
+        return events
+    
+    def _reload(self) -> NoteEvent:
+        self.content_cache.clear()
+        self._set_tree(self.read_tree(), content=True)
+        return NoteEvent(self.RELOADED, self.ROOT_ID, True)
+    
+    def _apply_change(self, nid: int, content_changed: bool) -> Optional[list]:
+        """把一篇笔记在数据库中的当前状态应用到内存，返回发出的事件，无法增量应用时返回 None"""
+        if nid == ROOT:
+            return []
+        store = self.store
+        note_id = str(nid)
+        info = self.db.get_note_info(note_id)
+        if info is None:
+            if nid not in store:
+                return []
+            if self._title_index is not None:
+                for descendant in store.iter_subtree(nid):
+                    self._title_index.remove(descendant, store.title(descendant))
+            for descendant in store.remove_subtree(nid):
+                self.content_cache.discard(str(descendant))
+            self.generation += 1
+            return [self._emit(self.DELETED, note_id)]
+        
+        _, title, parent_id, key = info
+        key = key or 0
+        parent = self.nid(parent_id)
+        if parent not in store:
+            return None
+        if nid not in store:
+            store.add(nid, title, parent, key, store.index_for_key(parent, key, nid))
+            if self._title_index is not None:
+                self._title_index.add(nid, title)
+            self.generation += 1
+            return [self._emit(self.CREATED, note_id)]
+        
+        events = []
+        if title != store.title(nid):
+            if self._title_index is not None:
+                self._title_index.rename(nid, store.title(nid), title)
+            store.set_title(nid, title)
+            self.generation += 1
+            events.append(self._emit(self.UPDATED, note_id))
+        if parent != store.parent(nid) or key != store.key(nid):
+            if store.is_ancestor(nid, parent):
+                # 要等之后的变化把环解开，这里无法逐条应用
+                return None
+            store.detach(nid)
+            store.keys[nid] = key
+            store.attach(nid, parent, store.index_for_key(parent, key, nid))
+            self.generation += 1
+            events.append(self._emit(self.MOVED, note_id))
+        if content_changed:
+            cached = self.content_cache.get(note_id)
+            # 缓存中与数据库相同（保存时做过同样的精简）说明是自己写入的
+            if cached is None or content_codec.minify_html(cached) != self.db.get_note_content(note_id):
+                self.content_cache.discard(note_id)
+                events.append(self._emit(self.UPDATED, note_id, True))
+        return events
+    
+    def load_snapshot(self) -> bool:
+        """从上次退出时写下的快照恢复树结构，用于在读数据库之前先显示界面"""
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                version, rows = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+        if version != self.SNAPSHOT_VERSION:
+            return False
+        # 快照按先序保存，父节点总在子节点之前
+        for nid, title, parent, key in rows:
+            self.store.add(nid, title, parent, key)
+        self._title_index = None
+        self.generation += 1
+        return True
+    
+    def save_snapshot(self) -> bool:
+        # 没有和数据库核对过的树结构不能写回快照
+        if not self.tree_loaded:
+            return False
+        store = self.store
+        rows = [(nid, store.title(nid), store.parent(nid), store.key(nid))
+                for nid in store.iter_subtree(ROOT) if nid != ROOT]
+        tmp = self.snapshot_path.with_suffix(".snapshot.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                marshal.dump((self.SNAPSHOT_VERSION, rows), f)
+            os.replace(tmp, self.snapshot_path)
+            return True
+        except OSError as e:
+            logger.error(f"保存树结构快照失败: {e}")
+            return False
+    
+    def parent_of(self, note_id: str) -> Optional[str]:
+        parent = self.store.parent(self.nid(note_id))
+        return None if parent is None else str(parent)
+    
+    def position_of(self, note_id: str) -> int:
+        return self.store.position(self.nid(note_id))
+    
+    def child_count(self, note_id: str) -> int:
+        nid = self.nid(note_id)
+        return self.store.child_count(nid) if nid in self.store else 0
+    
+    def child_ids(self, note_id: str, start: int = 0, stop: int = None) -> list:
+        """返回子节点 id 列表中 [start, stop) 的部分"""
+        nid = self.nid(note_id)
+        if nid not in self.store:
+            return []
+        return [str(child) for child in self.store.child_ids(nid)[start:stop]]
+    
+    @timed("notes.get_content")
+    def get_content(self, note_id: str) -> str:
+        content = self.content_cache.get(note_id)
+        if content is None:
+            if note_id == self.ROOT_ID:
+                return ""
+            content = self.db.get_note_content(note_id) or ""
+            self.content_cache.put(note_id, content)
+        return content
+    
+    @timed("notes.search")
+    def search(self, query: str, limit: int = 100) -> list:
+        """返回按相关度排序的 SearchHit 列表"""
+        hits = self.db.search_notes(query, limit)
+        # 没有加载树结构（如只为跨笔记本搜索而打开）时以数据库为准
+        if not self.tree_loaded:
+            return hits
+        return [hit for hit in hits if self.store.parent(self.nid(hit.note_id)) is not None]
+    
+    @timed("notes.quick_open")
+    def quick_open(self, query: str, limit: int = 50) -> list:
+        """按标题模糊查找笔记，返回 (id, 标题, 所在路径)，不读取正文和数据库"""
+        index = self.title_index
+        return [(str(nid), self.store.title(nid), index.breadcrumb(nid))
+                for nid, _ in index.search(query, limit)]
+    
+    def iter_subtree(self, note_id: str):
+        """按先序遍历返回子树中所有笔记 id（包括自身）"""
+        for nid in self.store.iter_subtree(self.nid(note_id)):
+            yield str(nid)
+    
+    @timed("notes.create_note")
     def create_note(self, title: str, parent_id: str) -> str:
-        if parent_id not in self.notes:
+        parent = self.nid(parent_id)
+        if parent not in self.store:
+            return None
+        
+        # id 由数据库的自增主键分配，不会重复
+        key = self.store.next_key(parent)
+        note_id = self.db.create_note(title, parent_id, key)
+        if note_id is None:
             return None
+        self.store.add(int(note_id), title, parent, key)
+        if self._title_index is not None:
+            self._title_index.add(int(note_id), title)
+        self.content_cache.put(note_id, "")
+        self.generation += 1
+        self._emit(self.CREATED, note_id)
+        return note_id
+    
+    @timed("notes.move_note")
+    def move_note(self, note_id: str, new_parent_id: str, index: int) -> bool:
+        """把笔记移动到 new_parent_id 的第 index 个子节点之前（index 按移动前的子节点列表计算）
+
+        只给被移动的笔记分配一个前后兄弟之间的新排序键并写入一行，
+        只有两侧已经没有间隔时才立即重新编号整个兄弟列表。
+        """
+        nid, parent = self.nid(note_id), self.nid(new_parent_id)
+        if nid == ROOT or self.store.parent(nid) is None or parent not in self.store:
+            return False
+        if self.notes[new_parent_id]._would_create_cycle(self.notes[note_id]):
+            return False
         
-        new_note = Note(title)
-        parent = self.notes[parent_id]
-        parent.children.append(new_note.id)
-        self.notes[new_note.id] = new_note
+        store = self.store
+        old_parent, old_index, old_key = store.parent(nid), store.position(nid), store.key(nid)
+        if old_parent == parent and index > old_index:
+            index -= 1
+        store.detach(nid)
+        index = max(0, min(index, store.child_count(parent)))
+        key = store.key_at(parent, index)
+        store.keys[nid] = old_key if key is None else key
+        store.attach(nid, parent, index)
+        if key is None:
+            moves = [(str(child), new_parent_id, child_key) for child, child_key in store.rebalance(parent)]
+            if not any(child == note_id for child, _, _ in moves):
+                moves.append((note_id, new_parent_id, store.key(nid)))
+            self.pending_rebalance.discard(parent)
+        else:
+            moves = [(note_id, new_parent_id, key)]
+            if store.min_gap(parent, index) < self.REBALANCE_MIN_GAP:
+                self.pending_rebalance.add(parent)
         
-        position = len(parent.children) - 1
-        self.db.save_note(new_note.id, title, "", parent_id, position)
-        return new_note.id
+        if not self.db.move_notes(moves):
+            # 写入失败时恢复内存中的位置（重新编号过的键与数据库不一致，但顺序相同）
+            store.detach(nid)
+            store.keys[nid] = old_key
+            store.attach(nid, old_parent, old_index)
+            return False
+        self.generation += 1
+        self._emit(self.MOVED, note_id)
+        return True
+    
+    @timed("notes.rebalance")
+    def rebalance_pending(self) -> int:
+        """重新编号排序键间隔快用完的兄弟列表，返回写入的行数；适合在空闲时调用"""
+        parents, self.pending_rebalance = self.pending_rebalance, set()
+        moves = []
+        for parent in parents:
+            if parent in self.store:
+                moves.extend((str(child), str(parent), key) for child, key in self.store.rebalance(parent))
+        if moves and not self.db.move_notes(moves):
+            self.pending_rebalance |= parents
+            return 0
+        return len(moves)
     
+    @timed("notes.delete_note")
     def delete_note(self, note_id: str) -> bool:
-        if note_id == self.root.id:
+        nid = self.nid(note_id)
+        if nid == ROOT or self.store.parent(nid) is None:
             return False
-            
-        note = self.notes[note_id]
-        parent = None
         
-        for potential_parent in self.notes.values():
-            if note_id in potential_parent.children:
-                parent = potential_parent
-                break
+        # 整个子树在一个事务中批量删除
+        subtree = list(self.iter_subtree(note_id))
+        image_paths = self.db.get_images_for_notes(subtree)
+        if not self.db.delete_notes(subtree):
+            return False
+        # 引用计数归零的图片文件随笔记一起删除
+        self.images.release(image_paths)
         
-        if parent:
-            parent.children.remove(note_id)
-            children = note.children.copy()
-            for child_id in children:
-                self.delete_note(child_id)
-            
-            del self.notes[note_id]
-            self.db.delete_note(note_id)
-            return True
-            
-        return False
+        if self._title_index is not None:
+            for descendant in self.store.iter_subtree(nid):
+                self._title_index.remove(descendant, self.store.title(descendant))
+        self.store.remove_subtree(nid)
+        self.generation += 1
+        for descendant_id in subtree:
+            self.content_cache.discard(descendant_id)
+        self._emit(self.DELETED, note_id)
+        return True
     
+    @timed("notes.update_note")
     def update_note(self, note_id: str, title: str = None, content: str = None) -> bool:
-        if note_id not in self.notes:
+        record = self.stage_note(note_id, title, content)
+        if record is None:
             return False
+        return self.db.save_note(*record)
+    
+    @timed("notes.stage_note")
+    def stage_note(self, note_id: str, title: str = None, content: str = None) -> Optional[tuple]:
+        """只更新内存中的笔记，返回待写入数据库的记录"""
+        nid = self.nid(note_id)
+        if nid not in self.store:
+            return None
             
-        note = self.notes[note_id]
-        if title is not None:
-            note.title = title
+        if title is not None and title != self.store.title(nid):
+            if self._title_index is not None:
+                self._title_index.rename(nid, self.store.title(nid), title)
+            self.store.set_title(nid, title)
+            self.generation += 1
+            self._emit(self.UPDATED, note_id)
         if content is not None:
-            note.content = content
+            self.content_cache.put(note_id, content)
+        else:
+            content = self.get_content(note_id)
             
-        parent_id = None
-        position = 0
-        for potential_parent in self.notes.values():
-            if note_id in potential_parent.children:
-                parent_id = potential_parent.id
-                position = potential_parent.children.index(note_id)
-                break
-                
-        return self.db.save_note(note_id, note.title, note.content, parent_id, position)
+        return (note_id, self.store.title(nid), content, self.parent_of(note_id), self.store.key(nid))
+    
+    def import_notes(self, source, parent_id: str = None, fmt: str = None, progress=None) -> int:
+        """从目录或 JSON Lines 归档批量导入，返回新导入的笔记数，见 note_io"""
+        import note_io
+        # 批量导入后标题索引整体重建比逐条维护更快
+        self._title_index = None
+        count = note_io.import_notes(self, source, parent_id or self.ROOT_ID, fmt, progress=progress)
+        # 导入的每一行都记入了变更日志，其他读者落后这么多时整体重新读取更快
+        self.db.trim_change_log()
+        self._change_seq = self.db.last_change_seq()
+        self._emit(self.RELOADED, self.ROOT_ID)
+        return count
     
+    def export_notes(self, note_id: str, target, fmt: str = None, progress=None) -> int:
+        """把子树导出为目录镜像或 JSON Lines 归档，返回导出的笔记数"""
+        import note_io
+        return note_io.export_notes(self, note_id, target, fmt, progress=progress)
+    
+    @timed("notes.save_image")
     def save_image(self, note_id: str, image_path: str) -> str:
-        note_images_dir = self.images_dir / note_id
-        note_images_dir.mkdir(exist_ok=True)
-        
-        source_path = Path(image_path)
-        target_name = f"{len(list(note_images_dir.glob('*')))}{source_path.suffix}"
-        target_path = note_images_dir / target_name
-        
-        shutil.copy2(image_path, target_path)
-        return str(target_path)
\ No newline at end of file
+        return self.images.save_image(note_id, image_path)
@@ -0,0 +1,212 @@
+import sys
+from array import array
+from typing import Iterator, Optional
+
+# 不存在的笔记在父节点数组中的取值
+NO_PARENT = -1
+# 根目录对应数据库中 id 为 0 的行（没有全文索引行），固定使用 0 号
+ROOT = 0
+# 兄弟排序键的默认间隔，插入两者之间时取中值，间隔用完才需要重新编号
+GAP = 1024
+
+
+class NoteStore:
+    """紧凑的树结构存储
+
+    笔记 id 是 notes 表的整数主键，直接作为并行数组的下标：父节点、兄弟位置和
+    排序键保存在 array 中，子节点列表是整数 array（叶子节点为 None），标题经过驻留，
+    相同标题只保存一份。删除的 id 留下空位，不会被数据库重新分配。
+
+    排序键即 notes.position，是兄弟之间留有间隔的稀疏整数，移动一篇笔记只需要
+    给它一个前后两个兄弟之间的新键；positions 则是笔记在兄弟中的下标。
+    """
+    __slots__ = ("parents", "positions", "keys", "titles", "children", "count", "change_seq")
+
+    def __init__(self, root_title: str):
+        self.parents = array("i", [NO_PARENT])
+        self.positions = array("i", [0])
+        self.keys = array("q", [0])
+        self.titles = [sys.intern(root_title)]
+        self.children = [None]
+        self.count = 1
+        # 读取时变更日志的位置，之后的修改由 NoteManager.poll_changes 增量应用
+        self.change_seq = 0
+
+    @classmethod
+    def from_rows(cls, rows, root_title: str) -> "NoteStore":
+        """由按 position 排序的 (id, title, parent_id, ...) 行构建，父节点不存在的笔记挂到根目录"""
+        store = cls(root_title)
+        rows = [row for row in rows if row[0] != ROOT and row[2] is not None]
+        if rows:
+            store._grow(max(row[0] for row in rows))
+        titles, parents, keys = store.titles, store.parents, store.keys
+        for row in rows:
+            titles[row[0]] = sys.intern(row[1])
+            keys[row[0]] = row[3] or 0
+            # 先占位，第二遍再确定真实父节点
+            parents[row[0]] = ROOT
+        for row in rows:
+            parent = row[2]
+            if not (0 <= parent < len(titles)) or titles[parent] is None:
+                parent = ROOT
+            store.attach(row[0], parent)
+        store.count += len(rows)
+        return store
+
+    def _grow(self, nid: int):
+        missing = nid + 1 - len(self.titles)
+        if missing > 0:
+            self.parents.extend([NO_PARENT] * missing)
+            self.positions.extend([0] * missing)
+            self.keys.extend([0] * missing)
+            self.titles.extend([None] * missing)
+            self.children.extend([None] * missing)
+
+    def __contains__(self, nid: int) -> bool:
+        return 0 <= nid < len(self.titles) and self.titles[nid] is not None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        return (nid for nid, title in enumerate(self.titles) if title is not None)
+
+    def same_tree(self, other: "NoteStore") -> bool:
+        return (self.parents == other.parents and self.positions == other.positions
+                and self.keys == other.keys and self.titles == other.titles)
+
+    def title(self, nid: int) -> str:
+        return self.titles[nid]
+
+    def set_title(self, nid: int, title: str):
+        self.titles[nid] = sys.intern(title)
+
+    def parent(self, nid: int) -> Optional[int]:
+        if not 0 <= nid < len(self.parents) or self.parents[nid] == NO_PARENT:
+            return None
+        return self.parents[nid]
+
+    def position(self, nid: int) -> int:
+        return self.positions[nid] if 0 <= nid < len(self.positions) else 0
+
+    def key(self, nid: int) -> int:
+        return self.keys[nid]
+
+    def next_key(self, parent: int) -> int:
+        """排在 parent 最后一个子节点之后的排序键"""
+        children = self.children[parent] if 0 <= parent < len(self.children) else None
+        return self.keys[children[-1]] + GAP if children else GAP
+
+    def key_at(self, parent: int, index: int) -> Optional[int]:
+        """插入到 parent 的第 index 个子节点之前时使用的排序键，两侧没有间隔时返回 None"""
+        children = self.child_ids(parent)
+        if not children:
+            return GAP
+        if index >= len(children):
+            return self.keys[children[-1]] + GAP
+        after = self.keys[children[index]]
+        if index == 0:
+            return after - GAP
+        before = self.keys[children[index - 1]]
+        return (before + after) // 2 if after - before > 1 else None
+
+    def min_gap(self, parent: int, index: int) -> int:
+        """第 index 个子节点与两侧兄弟的最小键间隔"""
+        children = self.child_ids(parent)
+        key = self.keys[children[index]]
+        gaps = [GAP]
+        if index > 0:
+            gaps.append(key - self.keys[children[index - 1]])
+        if index + 1 < len(children):
+            gaps.append(self.keys[children[index + 1]] - key)
+        return min(gaps)
+
+    def index_for_key(self, parent: int, key: int, nid: int) -> int:
+        """键为 key 的笔记在 parent 子节点中的位置（与数据库一样按键、再按 id 排序），二分查找"""
+        children = self.child_ids(parent)
+        keys = self.keys
+        lo, hi = 0, len(children)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (keys[children[mid]], children[mid]) < (key, nid):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def rebalance(self, parent: int) -> list:
+        """把 parent 的子节点按 GAP 重新编号，返回 (id, 新键)"""
+        updates = []
+        for i, nid in enumerate(self.child_ids(parent), 1):
+            if self.keys[nid] != i * GAP:
+                self.keys[nid] = i * GAP
+                updates.append((nid, i * GAP))
+        return updates
+
+    def child_ids(self, nid: int):
+        return self.children[nid] or ()
+
+    def child_count(self, nid: int) -> int:
+        children = self.children[nid]
+        return len(children) if children else 0
+
+    def add(self, nid: int, title: str, parent: int, key: Optional[int] = None, index: Optional[int] = None):
+        self._grow(nid)
+        self.titles[nid] = sys.intern(title)
+        self.keys[nid] = self.next_key(parent) if key is None else key
+        self.attach(nid, parent, index)
+        self.count += 1
+
+    def attach(self, nid: int, parent: int, index: Optional[int] = None):
+        siblings = self.children[parent]
+        if siblings is None:
+            siblings = self.children[parent] = array("i")
+        if index is None or index >= len(siblings):
+            self.positions[nid] = len(siblings)
+            siblings.append(nid)
+        else:
+            siblings.insert(index, nid)
+            for i in range(index, len(siblings)):
+                self.positions[siblings[i]] = i
+        self.parents[nid] = parent
+
+    def detach(self, nid: int):
+        parent = self.parents[nid]
+        index = self.positions[nid]
+        siblings = self.children[parent]
+        del siblings[index]
+        for i in range(index, len(siblings)):
+            self.positions[siblings[i]] = i
+        if not siblings:
+            self.children[parent] = None
+        self.parents[nid] = NO_PARENT
+
+    def remove_subtree(self, nid: int) -> list:
+        """删除整个子树，返回被删除的 id（先序）"""
+        removed = list(self.iter_subtree(nid))
+        self.detach(nid)
+        for descendant in removed:
+            self.parents[descendant] = NO_PARENT
+            self.positions[descendant] = 0
+            self.titles[descendant] = None
+            self.children[descendant] = None
+        self.count -= len(removed)
+        return removed
+
+    def is_ancestor(self, ancestor: int, nid: int) -> bool:
+        """ancestor 是否是 nid 本身或它的祖先"""
+        while nid != NO_PARENT:
+            if nid == ancestor:
+                return True
+            nid = self.parents[nid]
+        return False
+
+    def iter_subtree(self, nid: int) -> Iterator[int]:
+        """按先序遍历返回子树中所有笔记 id（包括自身）"""
+        stack = [nid]
+        while stack:
+            current = stack.pop()
+            yield current
+            children = self.children[current]
+            if children:
+                stack.extend(reversed(children))
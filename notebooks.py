@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from note_manager import NoteManager
+from instrumentation import timed
+
+
+class NotebookRegistry:
+    """笔记本目录：每个笔记本是独立的数据库和图片目录，按需打开，空闲时关闭
+
+    默认笔记本就是基础目录本身（notes.db 与 images/，与旧版本的布局相同），
+    其他笔记本位于 notebooks/<名称>/ 下。打开笔记本只建立 NoteManager，不读取树结构，
+    由调用方决定何时加载；长时间没有用到的笔记本会保存快照并关闭数据库连接。
+    """
+    DEFAULT = "默认"
+    NOTEBOOKS_DIR = "notebooks"
+    # 超过这个时间（秒）没有用到的笔记本会被关闭
+    IDLE_SECONDS = 300
+    # 同时打开的笔记本上限，超出时关闭最久没用的
+    MAX_OPEN = 8
+    SEARCH_THREADS = 4
+
+    def __init__(self, base_dir=None):
+        # 使用绝对路径，之后切换当前目录也不影响已打开的笔记本
+        self.base_dir = Path(base_dir).resolve() if base_dir else Path.cwd()
+        # 名称 -> NoteManager，按最近使用排序
+        self._open: "OrderedDict[str, NoteManager]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # 正在搜索的笔记本不能关闭
+        self._busy: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def directory(self, name: str) -> Path:
+        if name == self.DEFAULT:
+            return self.base_dir
+        return self.base_dir / self.NOTEBOOKS_DIR / name
+
+    def names(self) -> List[str]:
+        """默认笔记本在前，其余按名称排序"""
+        root = self.base_dir / self.NOTEBOOKS_DIR
+        others = sorted(path.name for path in root.iterdir()
+                        if path.is_dir() and not path.name.startswith(".")) if root.is_dir() else []
+        return [self.DEFAULT] + others
+
+    def exists(self, name: str) -> bool:
+        return name == self.DEFAULT or self.directory(name).is_dir()
+
+    def create(self, name: str) -> str:
+        """新建空笔记本，返回整理后的名称；名称无效或已存在时抛出 ValueError"""
+        name = name.strip()
+        if not name or name.startswith(".") or any(c in name for c in "/\\:"):
+            raise ValueError(f"无效的笔记本名称: {name!r}")
+        if self.exists(name):
+            raise ValueError(f"笔记本已存在: {name}")
+        self.directory(name).mkdir(parents=True)
+        return name
+
+    def open(self, name: str) -> NoteManager:
+        """返回笔记本的 NoteManager，没有打开时创建（不加载树结构）"""
+        with self._lock:
+            manager = self._open.get(name)
+            if manager is None:
+                if not self.exists(name):
+                    raise ValueError(f"笔记本不存在: {name}")
+                manager = NoteManager(load=False, directory=self.directory(name))
+                self._open[name] = manager
+            self._open.move_to_end(name)
+            self._last_used[name] = time.monotonic()
+            return manager
+
+    def close(self, name: str) -> bool:
+        with self._lock:
+            if self._busy.get(name):
+                return False
+            manager = self._open.pop(name, None)
+            self._last_used.pop(name, None)
+        if manager is None:
+            return False
+        manager.save_snapshot()
+        manager.db.trim_change_log()
+        manager.db.close()
+        return True
+
+    def evict_idle(self, keep: Iterable[str] = (), now: Optional[float] = None) -> List[str]:
+        """关闭空闲太久或超出数量上限的笔记本，keep 中的笔记本（如界面正在使用的）保留"""
+        now = time.monotonic() if now is None else now
+        keep = set(keep)
+        with self._lock:
+            names = list(self._open)
+        excess = len(names) - self.MAX_OPEN
+        closed = []
+        # 按最近使用排序，最久没用的在前
+        for name in names:
+            if name in keep:
+                continue
+            if excess > 0 or now - self._last_used.get(name, now) > self.IDLE_SECONDS:
+                if self.close(name):
+                    closed.append(name)
+                    excess -= 1
+        return closed
+
+    def close_all(self):
+        for name in list(self._open):
+            self.close(name)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _search_one(self, name: str, manager: NoteManager, query: str, limit: int):
+        try:
+            return [(name, hit) for hit in manager.search(query, limit)]
+        finally:
+            with self._lock:
+                self._busy[name] -= 1
+
+    @timed("notebooks.search")
+    def search(self, query: str, limit: int = 100, names: Iterable[str] = None) -> List[Tuple[str, object]]:
+        """在多个笔记本中并行搜索，返回合并后的 (笔记本, SearchHit)
+
+        默认只搜索已经打开的笔记本，其他笔记本只有在 names 中明确列出时才打开。
+        每个笔记本在自己的线程和连接上查询，SQLite 执行查询时释放 GIL。
+        """
+        if names is None:
+            with self._lock:
+                names = list(self._open)
+        else:
+            names = list(names)
+        jobs = []
+        for name in names:
+            manager = self.open(name)
+            with self._lock:
+                self._busy[name] = self._busy.get(name, 0) + 1
+            jobs.append((name, manager))
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.SEARCH_THREADS, thread_name_prefix="notebook-search")
+        futures = [self._pool.submit(self._search_one, name, manager, query, limit) for name, manager in jobs]
+        # 各笔记本的 bm25 基于各自的词频统计，不能直接比较，按名次轮流合并
+        results = [future.result() for future in futures]
+        hits = [hit for group in zip_longest(*results) for hit in group if hit is not None]
+        return hits[:limit]
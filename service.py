@@ -0,0 +1,279 @@
+"""无界面的笔记服务：在本地提供 JSON over HTTP 接口，供脚本、网页查看器和桌面程序共用同一个 notes.db
+
+接口（id 均为字符串，根目录为 "0"）:
+  GET    /tree                               整棵树 [[id, title, parent, position], ...]
+  GET    /notes/ID                           笔记信息和正文
+  GET    /notes/ID/children?offset=0&limit=100  分页读取子节点
+  GET    /search?q=关键词&limit=50            全文搜索
+  POST   /notes            {"title", "parent"}  新建笔记
+  PATCH  /notes/ID         {"title"?, "content"?}  修改标题或正文
+  POST   /notes/ID/move    {"parent", "index"?}  移动笔记
+  DELETE /notes/ID                           删除笔记及其子树
+
+读请求直接查询数据库，由读线程池并发执行，每个线程持有自己的 WAL 连接；
+写请求交给唯一的写线程按顺序执行，经过 NoteManager 维护排序键、图片引用和修订历史。
+其他进程（例如桌面程序）写入后，写线程通过 PRAGMA data_version 发现，按变更日志只重新读取变化的笔记。
+"""
+import asyncio
+import json
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class NoteService:
+    DEFAULT_HOST = "127.0.0.1"
+    DEFAULT_PORT = 8765
+    # 读线程数，也就是同时打开的只读连接数
+    READERS = 4
+    # 请求体上限（字节）
+    MAX_BODY = 16 * 1024 * 1024
+    # 分页和搜索每次最多返回的条数
+    MAX_LIMIT = 1000
+    REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+               405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+    def __init__(self, manager, readers: int = READERS):
+        self.manager = manager
+        self.db = manager.db
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="service-reader")
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="service-writer")
+        self.routes = [
+            ("GET", re.compile(r"/tree"), self.get_tree),
+            ("GET", re.compile(r"/notes/([^/]+)"), self.get_note),
+            ("GET", re.compile(r"/notes/([^/]+)/children"), self.get_children),
+            ("GET", re.compile(r"/search"), self.search),
+            ("POST", re.compile(r"/notes"), self.create_note),
+            ("PATCH", re.compile(r"/notes/([^/]+)"), self.update_note),
+            ("POST", re.compile(r"/notes/([^/]+)/move"), self.move_note),
+            ("DELETE", re.compile(r"/notes/([^/]+)"), self.delete_note),
+        ]
+
+    # ---- 线程调度 ----
+
+    async def _read(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, func, *args)
+
+    async def _write(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._writer, self._run_write, func, args)
+
+    def _run_write(self, func, args):
+        self._sync()
+        return func(*args)
+
+    def _sync(self):
+        """把其他连接的修改增量应用到树结构和正文缓存，总在写线程上调用"""
+        self.manager.poll_changes()
+
+    # ---- 读接口 ----
+
+    async def get_tree(self, query, body):
+        rows = await self._read(self.db.get_note_skeleton)
+        return 200, {"notes": [[str(note_id), title, None if parent is None else str(parent), position]
+                               for note_id, title, parent, position in rows]}
+
+    async def get_note(self, query, body, note_id):
+        if note_id == self.manager.ROOT_ID:
+            return 200, {"id": note_id, "title": self.manager.ROOT_TITLE, "parent": None,
+                         "position": 0, "content": ""}
+
+        def read():
+            info = self.db.get_note_info(note_id)
+            return info, (self.db.get_note_content(note_id) if info else None)
+        info, content = await self._read(read)
+        if info is None:
+            raise HTTPError(404, f"笔记不存在: {note_id}")
+        _, title, parent, position = info
+        return 200, {"id": note_id, "title": title, "parent": parent, "position": position, "content": content or ""}
+
+    async def get_children(self, query, body, note_id):
+        offset = _int_param(query, "offset", 0)
+        limit = min(_int_param(query, "limit", 100), self.MAX_LIMIT)
+        total, rows = await self._read(self.db.get_children, note_id, offset, limit)
+        return 200, {"total": total, "offset": offset,
+                     "children": [{"id": child_id, "title": title, "position": position, "has_children": has_children}
+                                  for child_id, title, position, has_children in rows]}
+
+    async def search(self, query, body):
+        text = query.get("q", [""])[0]
+        if not text.strip():
+            raise HTTPError(400, "缺少参数 q")
+        limit = min(_int_param(query, "limit", 50), self.MAX_LIMIT)
+        hits = await self._read(self.db.search_notes, text, limit)
+        offsets = await self._read(self.db.match_offsets, [hit.note_id for hit in hits], text)
+        return 200, {"hits": [{"id": hit.note_id, "rank": hit.rank, "offsets": offsets.get(hit.note_id, [])}
+                              for hit in hits]}
+
+    # ---- 写接口 ----
+
+    async def create_note(self, query, body):
+        # 先校验请求体，不让格式错误被当成父笔记不存在
+        title = _str_field(body, "title", "新建笔记")
+        if title is None:
+            raise HTTPError(400, "title 不能为 null")
+        parent = _id_field(body, "parent", self.manager.ROOT_ID)
+        if parent is None:
+            raise HTTPError(400, "parent 不能为 null")
+
+        def create():
+            if parent not in self.manager.notes:
+                raise HTTPError(404, f"父笔记不存在: {parent}")
+            note_id = self.manager.create_note(title, parent)
+            if note_id is None:
+                raise HTTPError(500, "创建笔记失败")
+            return note_id
+        return 201, {"id": await self._write(create)}
+
+    async def update_note(self, query, body, note_id):
+        # 根目录只是树的起点，没有标题和正文可改，也不能写入全文索引
+        if note_id == self.manager.ROOT_ID:
+            raise HTTPError(400, "不能修改根目录")
+        title = _str_field(body, "title")
+        content = _str_field(body, "content")
+        if title is None and content is None:
+            raise HTTPError(400, "需要 title 或 content")
+        if not await self._write(self.manager.update_note, note_id, title, content):
+            raise HTTPError(404, f"笔记不存在: {note_id}")
+        return 200, {"id": note_id}
+
+    async def move_note(self, query, body, note_id):
+        parent = _id_field(body, "parent", self.manager.ROOT_ID)
+        index = body.get("index")
+        if index is not None and not isinstance(index, int):
+            raise HTTPError(400, "index 必须是整数")
+
+        def move():
+            return self.manager.move_note(note_id, parent, self.manager.child_count(parent) if index is None else index)
+        if not await self._write(move):
+            raise HTTPError(400, f"无法把 {note_id} 移动到 {parent} 下")
+        return 200, {"id": note_id, "parent": parent}
+
+    async def delete_note(self, query, body, note_id):
+        if not await self._write(self.manager.delete_note, note_id):
+            raise HTTPError(404, f"无法删除笔记: {note_id}")
+        return 200, {"id": note_id}
+
+    # ---- HTTP ----
+
+    async def dispatch(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HTTPError(400, "请求体不是有效的 JSON")
+            if not isinstance(data, dict):
+                raise HTTPError(400, "请求体必须是 JSON 对象")
+            return await handler(parse_qs(url.query), data, *map(unquote, match.groups()))
+        if allowed:
+            raise HTTPError(405, f"不支持的方法: {method}")
+        raise HTTPError(404, f"没有这个接口: {path}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # HTTP/1.1 默认保持连接，同一连接上的请求依次处理
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if length > self.MAX_BODY:
+                    status, payload = 413, {"error": "请求体过大"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, payload = await self.dispatch(method, target, body)
+                    except HTTPError as e:
+                        status, payload = e.status, {"error": str(e)}
+                    except Exception as e:
+                        logger.exception("处理请求失败: %s %s", method, target)
+                        status, payload = 500, {"error": str(e)}
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                head = (f"HTTP/1.1 {status} {self.REASONS[status]}\r\n"
+                        f"Content-Type: application/json; charset=utf-8\r\n"
+                        f"Content-Length: {len(data)}\r\n")
+                if not keep_alive:
+                    head += "Connection: close\r\n"
+                writer.write(head.encode("latin-1") + b"\r\n" + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # 客户端断开或请求格式错误，直接关闭连接
+            pass
+        finally:
+            writer.close()
+
+    async def serve_forever(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"笔记服务已启动: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        # 等待排队中的写入完成
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+
+def _int_param(query: dict, name: str, default: int) -> int:
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise HTTPError(400, f"参数 {name} 必须是整数")
+    if value < 0:
+        raise HTTPError(400, f"参数 {name} 不能为负数")
+    return value
+
+
+def _str_field(body: dict, name: str, default=None):
+    value = body.get(name, default)
+    if value is not None and not isinstance(value, str):
+        raise HTTPError(400, f"{name} 必须是字符串")
+    return value
+
+
+def _id_field(body: dict, name: str, default: str) -> str:
+    # id 也接受 JSON 整数
+    value = body.get(name, default)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return _str_field(body, name, default)
+
+
+def serve(manager, host: str = NoteService.DEFAULT_HOST, port: int = NoteService.DEFAULT_PORT,
+          readers: int = NoteService.READERS):
+    service = NoteService(manager, readers)
+    try:
+        asyncio.run(service.serve_forever(host, port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
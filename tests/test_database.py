@@ -0,0 +1,19 @@
+import pytest
+
+from database import Database
+
+
+def test_inner_transaction_failure_is_rolled_back(tmp_path):
+    """内层事务出错、外层捕获后继续提交时，内层写了一半的内容不应提交"""
+    db = Database(tmp_path / "notes.db")
+    note_id = db.create_note("原标题", "0", 1024)
+    with db.transaction():
+        with pytest.raises(RuntimeError):
+            with db.transaction() as conn:
+                conn.execute("UPDATE notes SET title = '写了一半' WHERE id = ?", (note_id,))
+                raise RuntimeError
+        other = db.create_note("另一篇", "0", 2048)
+    titles = dict(db.conn.execute("SELECT id, title FROM notes"))
+    assert titles[int(note_id)] == "原标题"
+    assert titles[int(other)] == "另一篇"
+    db.close()
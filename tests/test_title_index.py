@@ -0,0 +1,18 @@
+from note_manager import NoteManager
+from title_index import TitleIndex
+
+
+def test_delete_subtree_past_rebuild_threshold(tmp_path):
+    """删除的笔记数超过重建阈值时，快速打开不应返回已删除的笔记"""
+    manager = NoteManager(directory=tmp_path)
+    parent = manager.create_note("parent", manager.ROOT_ID)
+    for i in range(TitleIndex.REBUILD_MIN_STALE * 2 + 500):
+        manager.create_note(f"child {i}", parent)
+    kept = manager.create_note("child kept", manager.ROOT_ID)
+    assert manager.quick_open("child")
+
+    assert manager.delete_note(parent)
+    results = manager.quick_open("child")
+    assert [note_id for note_id, _, _ in results] == [kept]
+    assert all(title is not None for _, title, _ in results)
+    manager.db.close()
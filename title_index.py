@@ -0,0 +1,259 @@
+import re
+from array import array
+from math import ceil
+from typing import List, Optional, Tuple
+
+from note_store import NoteStore, ROOT
+
+# 面包屑查询 "父/子" 或 "父 > 子" 中的层级分隔符
+_LEVELS = re.compile(r"\s*[/>]\s*")
+_WORD_BREAK = "-_.()[]【】（）·,，"
+
+
+def _trigrams(text: str) -> set:
+    # 不足三个字的词整体作为一个 gram
+    return {text[i:i + 3] for i in range(len(text) - 2)} or {text}
+
+
+class TitleIndex:
+    """笔记标题的内存索引，用于快速打开
+
+    标题（忽略大小写）按空白拆成词，trigram 倒排表建在不同的词上，再由词找到
+    包含它的标题，大量笔记共用少量词汇时建索引很快。查询词不含空白，
+    子串匹配一定落在单个词内；没有子串匹配时按 trigram 重合度模糊匹配。
+
+    相同标题只保存一份；删除和改名只从标题的笔记中移除，倒排表中过时的标题在
+    查询时过滤，失效过半时在下一次查询前整体重建（删除子树时 store 稍后才更新，
+    不能在删除中途按 store 重建）。一两个字的查询通过包含这些字的 trigram
+    找到候选词。查询 "父/子" 时最后一段匹配标题，前面各段依次匹配祖先标题。
+    """
+    # 每次查询最多评分的候选词数和标题数
+    MAX_CANDIDATES = 1000
+    # 一两个字的查询匹配面太广，只取少量候选，继续输入后结果会收窄
+    SHORT_CANDIDATES = 200
+    # 多词查询时最多检查的标题数，常见词可能出现在大量标题中
+    MAX_SCANNED = 50000
+    # 没有子串匹配时，至少要有这一比例的 trigram 相同才算模糊匹配
+    MIN_OVERLAP = 0.6
+    # 失效的标题超过这个数量且超过一半时重建
+    REBUILD_MIN_STALE = 1000
+
+    def __init__(self, store: NoteStore):
+        self.store = store
+        self._rebuild()
+
+    def _rebuild(self):
+        self._title_no = {}
+        self._titles: List[str] = []
+        # 每个标题的第一篇笔记，-1 表示已经没有笔记；同名的其余笔记放在 _more 中
+        self._first = array("i")
+        self._more = {}
+        self._word_no = {}
+        self._words: List[str] = []
+        # 同样，每个词的第一个标题和其余标题
+        self._word_first = array("i")
+        self._word_more = {}
+        # trigram -> 包含它的词
+        self._postings = {}
+        # 单字 / 两个字 -> 包含它的 trigram，用于短查询
+        self._grams_by_part = {}
+        self._stale = 0
+        # 批量构建：先按词收集标题编号，最后一次性建 trigram 倒排表
+        title_no, titles, first, more = self._title_no, self._titles, self._first, self._more
+        word_titles = {}
+        for nid, title in enumerate(self.store.titles):
+            if title is None or nid == ROOT:
+                continue
+            key = title.casefold()
+            no = title_no.get(key)
+            if no is None:
+                no = title_no[key] = len(titles)
+                titles.append(key)
+                first.append(nid)
+                for word in set(key.split()):
+                    try:
+                        word_titles[word].append(no)
+                    except KeyError:
+                        word_titles[word] = [no]
+            else:
+                more.setdefault(no, array("i")).append(nid)
+        for word, nos in word_titles.items():
+            self._add_word(word, nos[0])
+            if len(nos) > 1:
+                self._word_more[self._word_no[word]] = array("i", nos[1:])
+
+    def __len__(self) -> int:
+        return len(self._titles) - self._stale
+
+    def add(self, nid: int, title: str):
+        key = title.casefold()
+        no = self._title_no.get(key)
+        if no is None:
+            no = self._title_no[key] = len(self._titles)
+            self._titles.append(key)
+            self._first.append(nid)
+            for word in set(key.split()):
+                self._add_word(word, no)
+        elif self._first[no] < 0:
+            self._first[no] = nid
+            self._stale -= 1
+        else:
+            self._more.setdefault(no, array("i")).append(nid)
+
+    def _add_word(self, word: str, title_no: int):
+        word_no = self._word_no.get(word)
+        if word_no is not None:
+            self._word_more.setdefault(word_no, array("i")).append(title_no)
+            return
+        word_no = self._word_no[word] = len(self._words)
+        self._words.append(word)
+        self._word_first.append(title_no)
+        postings = self._postings
+        for gram in _trigrams(word):
+            try:
+                postings[gram].append(word_no)
+            except KeyError:
+                postings[gram] = array("i", (word_no,))
+                parts = set(gram)
+                parts.update(gram[i:i + 2] for i in range(len(gram) - 1))
+                for part in parts:
+                    self._grams_by_part.setdefault(part, []).append(gram)
+
+    def remove(self, nid: int, title: str):
+        no = self._title_no.get(title.casefold())
+        if no is None:
+            return
+        more = self._more.get(no)
+        if self._first[no] == nid:
+            if more:
+                self._first[no] = more.pop()
+                if not more:
+                    del self._more[no]
+                return
+            self._first[no] = -1
+            self._stale += 1
+        elif more and nid in more:
+            more.remove(nid)
+            if not more:
+                del self._more[no]
+
+    def rename(self, nid: int, old_title: str, new_title: str):
+        if old_title.casefold() != new_title.casefold():
+            self.remove(nid, old_title)
+            self.add(nid, new_title)
+
+    def _candidate_words(self, term: str, cap: int) -> List[int]:
+        if len(term) < 3:
+            postings = [self._postings[gram] for gram in self._grams_by_part.get(term, ())]
+        else:
+            grams = _trigrams(term)
+            postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+            # 至少命中 need 个 trigram 的词一定出现在最短的 len - need + 1 个倒排表之一中
+            need = max(1, ceil(len(grams) * self.MIN_OVERLAP))
+            postings = postings[:len(grams) - need + 1]
+        seen = set()
+        for posting in postings:
+            for word_no in posting:
+                seen.add(word_no)
+                if len(seen) >= cap:
+                    return list(seen)
+        return list(seen)
+
+    def _score_word(self, term: str, word: str) -> Optional[float]:
+        pos = word.find(term)
+        if pos >= 0:
+            score = 3.0
+            if pos == 0:
+                score += 1.0
+            elif word[pos - 1] in _WORD_BREAK:
+                score += 0.5
+            if len(word) == len(term):
+                score += 1.0
+            return score
+        term_grams = _trigrams(term)
+        overlap = len(term_grams & _trigrams(word)) / len(term_grams)
+        if overlap >= self.MIN_OVERLAP:
+            return overlap * 2
+        return None
+
+    def _title_nos(self, word_no: int):
+        yield self._word_first[word_no]
+        yield from self._word_more.get(word_no, ())
+
+    def _note_ids(self, no: int):
+        first = self._first[no]
+        if first < 0:
+            return ()
+        more = self._more.get(no)
+        return (first, *more) if more else (first,)
+
+    def _ancestors_match(self, nid: int, segments: List[str]) -> bool:
+        """segments 从上到下依次包含在某个祖先标题中"""
+        if not segments:
+            return True
+        remaining = list(segments)
+        parent = self.store.parent(nid)
+        while parent is not None and parent != ROOT and remaining:
+            if remaining[-1] in self.store.title(parent).casefold():
+                remaining.pop()
+            parent = self.store.parent(parent)
+        return not remaining
+
+    def breadcrumb(self, nid: int) -> str:
+        titles = []
+        parent = self.store.parent(nid)
+        while parent is not None and parent != ROOT:
+            titles.append(self.store.title(parent))
+            parent = self.store.parent(parent)
+        return " / ".join(reversed(titles))
+
+    def search(self, query: str, limit: int = 50) -> List[Tuple[int, float]]:
+        """返回按相关度排序的 (笔记 id, 得分)
+
+        最后一段中的多个词都要出现在标题中，最长的词用于查找和模糊匹配。
+        """
+        segments = [s for s in _LEVELS.split(query.casefold().strip()) if s]
+        if not segments:
+            return []
+        if self._stale > self.REBUILD_MIN_STALE and self._stale * 2 > len(self._titles):
+            self._rebuild()
+        terms = sorted(set(segments[-1].split()), key=len, reverse=True)
+        term, others = terms[0], terms[1:]
+        ancestors = segments[:-1]
+        cap = self.SHORT_CANDIDATES if len(term) < 3 else self.MAX_CANDIDATES
+        words = []
+        for word_no in self._candidate_words(term, cap):
+            score = self._score_word(term, self._words[word_no])
+            if score is not None:
+                words.append((score, word_no))
+        words.sort(key=lambda item: -item[0])
+        scored = {}
+        scanned = 0
+        for word_score, word_no in words:
+            for no in self._title_nos(word_no):
+                scanned += 1
+                if self._first[no] < 0 or no in scored:
+                    continue
+                title = self._titles[no]
+                if others and not all(other in title for other in others):
+                    if scanned >= self.MAX_SCANNED:
+                        break
+                    continue
+                score = word_score - len(title) / 1000
+                if title == segments[-1]:
+                    score += 1.0
+                elif title.startswith(term):
+                    score += 0.5
+                scored[no] = score
+                if len(scored) >= cap:
+                    break
+            if len(scored) >= cap or scanned >= self.MAX_SCANNED:
+                break
+        results = []
+        for no, score in sorted(scored.items(), key=lambda item: -item[1]):
+            for nid in self._note_ids(no):
+                if self._ancestors_match(nid, ancestors):
+                    results.append((nid, score))
+                    if len(results) >= limit:
+                        return results
+        return results
@@ -0,0 +1,116 @@
+import queue
+import logging
+import threading
+from typing import Callable, Optional
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+class AutoSaver(QObject):
+    """编辑内容的延迟写回：空闲一段时间后序列化一次，由后台线程写入数据库"""
+    UNSAVED = "未保存"
+    SAVING = "保存中"
+    SAVED = "已保存"
+    FAILED = "保存失败"
+
+    state_changed = pyqtSignal(str)
+    # 写入失败时发出，携带错误信息
+    failed = pyqtSignal(str)
+    _written = pyqtSignal(int, bool, str)
+
+    def __init__(self, note_manager, serialize: Callable[[], str], idle_ms: int = 800, parent=None):
+        super().__init__(parent)
+        self.note_manager = note_manager
+        self.idle_ms = idle_ms
+        self.state = self.SAVED
+        # 返回编辑器当前内容，只在空闲窗口结束或强制刷新时调用
+        self._serialize = serialize
+        self._dirty_note_id: Optional[str] = None
+        self._inflight = 0
+        
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+        self._written.connect(self._on_written)
+        
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+        self._thread.start()
+    
+    def mark_dirty(self, note_id: str):
+        """记录一次编辑，重新开始空闲计时"""
+        if self._dirty_note_id is not None and self._dirty_note_id != note_id:
+            self.flush()
+        self._dirty_note_id = note_id
+        self._timer.start(self.idle_ms)
+        self._set_state(self.UNSAVED)
+    
+    def flush(self):
+        """立即序列化待保存的笔记并交给后台线程"""
+        self._timer.stop()
+        note_id, self._dirty_note_id = self._dirty_note_id, None
+        if note_id is None:
+            return
+        record = self.note_manager.stage_note(note_id, content=self._serialize())
+        if record:
+            self.submit(record)
+    
+    def submit(self, record: tuple):
+        """把一条已暂存的笔记记录排入写入队列"""
+        self._inflight += 1
+        self._set_state(self.SAVING)
+        self._queue.put(record)
+    
+    def wait(self):
+        """刷新并等待所有写入完成，用于切换笔记后的同步操作和退出"""
+        self.flush()
+        self._queue.join()
+    
+    def shutdown(self):
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            # 合并队列中积压的记录，同一笔记只写最新的一份
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            latest = {}
+            for record in records:
+                if record is not None:
+                    latest[record[0]] = record
+            if latest:
+                db = self.note_manager.db
+                error = ""
+                try:
+                    with db.transaction():
+                        ok = all([db.save_note(*record) for record in latest.values()])
+                except Exception as e:
+                    logger.exception("自动保存失败")
+                    ok = False
+                    error = str(e) or type(e).__name__
+                self._written.emit(len(records) - stop, ok, error)
+            for _ in records:
+                self._queue.task_done()
+            if stop:
+                break
+    
+    def _on_written(self, count: int, ok: bool, error: str):
+        self._inflight -= count
+        if not ok:
+            self._set_state(self.FAILED)
+            # save_note 自己记录了具体错误，只返回失败
+            self.failed.emit(error or "写入数据库失败")
+        elif self._inflight == 0 and self._dirty_note_id is None:
+            self._set_state(self.SAVED)
+    
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.state_changed.emit(state)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from typing import Callable, Optional
+from PyQt6.QtCore import QObject
+
+from ui.note_document import NoteDocument
+
+
+class DocumentCache(QObject):
+    """按估算大小淘汰的 LRU 文档缓存
+
+    缓存解析和排版好的 NoteDocument，切换回最近看过的笔记时直接换上文档，
+    不再重新解析 HTML、加载图片。文档的父对象是缓存，淘汰时销毁；
+    编辑器正在显示的文档不会被淘汰。每篇笔记还记下离开时的光标和滚动位置。
+    """
+    # 每个字符估算占用的字节数（文本、格式和排版信息）
+    BYTES_PER_CHAR = 32
+
+    def __init__(self, thumbnails, max_bytes: int, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        self.max_bytes = max_bytes
+        self.size = 0
+        # 正在显示的笔记
+        self.pinned: Optional[str] = None
+        # note_id -> [文档, 估算字节数, (锚点, 光标位置, 滚动位置)]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+
+    def __contains__(self, note_id: str) -> bool:
+        return note_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        # 返回副本，遍历时可以淘汰或丢弃
+        return iter(list(self._entries))
+
+    def _estimate(self, document: NoteDocument) -> int:
+        return document.characterCount() * self.BYTES_PER_CHAR
+
+    def get(self, note_id: str, load: Callable[[], str]) -> NoteDocument:
+        """返回笔记的文档并把它标记为正在显示，不在缓存中时用 load() 的 HTML 创建"""
+        self.pinned = note_id
+        entry = self._entries.get(note_id)
+        if entry is not None:
+            self._entries.move_to_end(note_id)
+            return entry[0]
+        document = NoteDocument(self.thumbnails, self)
+        document.setHtml(load())
+        # 载入内容不算编辑，只有之后的修改才会把文档标记为已修改
+        document.setModified(False)
+        size = self._estimate(document)
+        self._entries[note_id] = [document, size, None]
+        self.size += size
+        self._evict()
+        return document
+
+    def peek(self, note_id: str) -> Optional[NoteDocument]:
+        """返回缓存中的文档，不改变淘汰顺序，也不标记为正在显示"""
+        entry = self._entries.get(note_id)
+        return entry[0] if entry is not None else None
+
+    def update_size(self, note_id: str):
+        """文档被编辑后重新估算大小"""
+        entry = self._entries.get(note_id)
+        if entry is not None:
+            size = self._estimate(entry[0])
+            self.size += size - entry[1]
+            entry[1] = size
+            self._evict()
+
+    def save_view(self, note_id: str, view: tuple):
+        entry = self._entries.get(note_id)
+        if entry is not None:
+            entry[2] = view
+
+    def view(self, note_id: str) -> Optional[tuple]:
+        entry = self._entries.get(note_id)
+        return entry[2] if entry is not None else None
+
+    def _evict(self):
+        for note_id in list(self._entries):
+            if self.size <= self.max_bytes:
+                break
+            if note_id != self.pinned:
+                self.discard(note_id)
+
+    def discard(self, note_id: str):
+        entry = self._entries.pop(note_id, None)
+        if entry is not None:
+            self.size -= entry[1]
+            entry[0].deleteLater()
+            if note_id == self.pinned:
+                self.pinned = None
+
+    def clear(self):
+        for note_id in list(self._entries):
+            self.discard(note_id)
@@ -0,0 +1,127 @@
+import os
+from PyQt6.QtCore import (QBuffer, QByteArray, QCoreApplication, QIODevice, QObject, QRunnable, QSize,
+                          QThreadPool, pyqtSignal)
+from PyQt6.QtGui import QColor, QImage, QImageWriter
+
+
+class _IngestJob(QRunnable):
+    def __init__(self, ingester, job_id, note_id, source):
+        super().__init__()
+        self.ingester = ingester
+        self.job_id = job_id
+        self.note_id = note_id
+        self.source = source
+
+    def run(self):
+        try:
+            src = self.ingester.ingest(self.source)
+            self.ingester.images.add_ref(self.note_id, src)
+        except Exception as e:
+            self.ingester._done.emit(self.job_id, self.note_id, "", str(e) or type(e).__name__)
+            return
+        finally:
+            # 线程池的线程空闲一段时间后退出，连接随任务释放
+            self.ingester.images.db.release_thread_connection()
+        self.ingester._done.emit(self.job_id, self.note_id, src, "")
+
+
+class ImageIngester(QObject):
+    """后台导入图片：复制文件或编码剪贴板图片、按需重新编码、写入图片引用
+
+    每张图片是线程池中的一个任务，界面先插入占位图，任务完成后发出 finished
+    （失败时发出 failed），再由界面把占位图换成仓库中的图片。
+    较大的无损图片（PNG/BMP/TIFF）会尝试重新编码，只在结果更小时采用。
+    """
+    # 超过这个大小的无损图片才尝试重新编码
+    REENCODE_MIN_BYTES = 2 * 1024 * 1024
+    LOSSLESS_SUFFIXES = {"png", "bmp", "tif", "tiff"}
+    THREADS = 2
+    PLACEHOLDER_COLOR = QColor(230, 230, 230)
+    PLACEHOLDER_SIZE = QSize(320, 180)
+
+    # (任务号, 笔记 id, 仓库中的图片路径)
+    finished = pyqtSignal(int, str, str)
+    # (任务号, 笔记 id, 错误信息)
+    failed = pyqtSignal(int, str, str)
+    _done = pyqtSignal(int, str, str, str)
+
+    def __init__(self, images, reencode_format: str = "webp", quality: int = 100, parent=None):
+        super().__init__(parent)
+        self.images = images
+        # WebP 的质量为 100 时是无损编码；格式不受支持（缺少 Qt 插件）时不重新编码
+        supported = {bytes(f).decode() for f in QImageWriter.supportedImageFormats()}
+        self.reencode_format = reencode_format if reencode_format in supported else None
+        self.quality = quality
+        self.pending = {}
+        self._next_id = 0
+        # 独立的线程池，不占用缩略图生成的全局线程池
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(self.THREADS)
+        self._done.connect(self._on_done)
+
+    @staticmethod
+    def placeholder_name(job_id: int) -> str:
+        return f"ingest:{job_id}"
+
+    @classmethod
+    def placeholder(cls, size: QSize, display_width: int) -> QImage:
+        """和图片同样比例、不超过显示宽度的灰色占位图"""
+        if not size.isValid() or size.isEmpty():
+            size = cls.PLACEHOLDER_SIZE
+        if size.width() > display_width:
+            size = QSize(display_width, max(1, size.height() * display_width // size.width()))
+        image = QImage(size, QImage.Format.Format_RGB32)
+        image.fill(cls.PLACEHOLDER_COLOR)
+        return image
+
+    def submit(self, note_id: str, source) -> int:
+        """导入文件路径或 QImage，返回任务号"""
+        self._next_id += 1
+        self.pending[self._next_id] = note_id
+        self._pool.start(_IngestJob(self, self._next_id, note_id, source))
+        return self._next_id
+
+    def _encode(self, image: QImage, fmt: str, quality: int = -1) -> bytes:
+        data = QByteArray()
+        buffer = QBuffer(data)
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        if not image.save(buffer, fmt, quality):
+            raise OSError(f"无法编码为 {fmt}")
+        return bytes(data)
+
+    def _reencode(self, image: QImage, size: int):
+        """返回 (数据, 扩展名)，重新编码没有变小或不适用时返回 None"""
+        if self.reencode_format is None or size < self.REENCODE_MIN_BYTES:
+            return None
+        # JPEG 没有透明通道
+        if self.reencode_format in ("jpg", "jpeg") and image.hasAlphaChannel():
+            return None
+        data = self._encode(image, self.reencode_format, self.quality)
+        return (data, "." + self.reencode_format) if len(data) < size else None
+
+    def ingest(self, source) -> str:
+        """在工作线程中执行：把图片写入仓库，返回仓库中的路径"""
+        if isinstance(source, QImage):
+            data, ext = self._encode(source, "png"), ".png"
+            data, ext = self._reencode(source, len(data)) or (data, ext)
+            return self.images.store_bytes(data, ext)
+        suffix = os.path.splitext(source)[1].lower().lstrip(".")
+        size = os.path.getsize(source)
+        if suffix in self.LOSSLESS_SUFFIXES and self.reencode_format and size >= self.REENCODE_MIN_BYTES:
+            image = QImage(source)
+            encoded = None if image.isNull() else self._reencode(image, size)
+            if encoded:
+                return self.images.store_bytes(*encoded)
+        return self.images.store_file(source)
+
+    def _on_done(self, job_id: int, note_id: str, src: str, error: str):
+        self.pending.pop(job_id, None)
+        if src:
+            self.finished.emit(job_id, note_id, src)
+        else:
+            self.failed.emit(job_id, note_id, error)
+
+    def wait(self):
+        """等待所有任务完成并投递它们的结果，用于退出前"""
+        self._pool.waitForDone()
+        QCoreApplication.sendPostedEvents()
@@ -1,28 +1,227 @@
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                           QTreeWidget, QTreeWidgetItem, QTextEdit, QPushButton,
-                           QInputDialog, QMessageBox, QFileDialog, QLineEdit)
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QTextCharFormat, QTextCursor
+                           QTreeView, QPushButton, QDialog, QScrollArea,
+                           QInputDialog, QMessageBox, QFileDialog, QLineEdit, QLabel, QCheckBox,
+                           QApplication)
+from PyQt6.QtCore import Qt, QCoreApplication, QSettings, QTimer, QUrl
+from PyQt6.QtGui import (QTextCursor, QTextDocument, QTextImageFormat, QImage, QImageReader, QPixmap,
+                         QShortcut, QKeySequence)
 import sys
 import os
+import re
+import logging
 
 # 添加项目根目录到 Python 路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from notebooks import NotebookRegistry
 from note_manager import NoteManager
+from instrumentation import instrumentation, timed, startup
+from ui.autosave import AutoSaver
+from ui.skeleton_loader import SkeletonLoader
+from ui.note_tree_model import NoteTreeModel
+from ui.note_document import NoteDocument
+from ui.note_editor import NoteEditor
+from ui.image_ingest import ImageIngester
+from ui.document_cache import DocumentCache
+from ui.thumbnail_cache import ThumbnailCache
+from ui.search_highlighter import SearchHighlighter
+
+logger = logging.getLogger(__name__)
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    # 停止输入多久后自动保存（毫秒）
+    AUTOSAVE_IDLE_MS = 800
+    # 拖动排序后空闲多久再重新编号排序键（毫秒）
+    REBALANCE_IDLE_MS = 5000
+    # 一次搜索最多返回的结果数
+    SEARCH_LIMIT = 200
+    # 已解析文档缓存的上限（估算字节）
+    DOCUMENT_CACHE_BYTES = 64 * 1024 * 1024
+    # 多久检查一次空闲的笔记本（毫秒）
+    NOTEBOOK_EVICT_MS = 60 * 1000
+    # 多久检查一次其他进程或窗口对数据库的修改（毫秒）
+    CHANGE_POLL_MS = 1000
+
+    def __init__(self, settings: QSettings = None):
         super().__init__()
-        self.note_manager = NoteManager()
+        # 可以传入单独的设置（如性能测试），不读写用户的设置
+        self.settings = settings or QSettings("TreeNote", "TreeNote")
+        self.notebooks = NotebookRegistry()
+        self.notebook = self.settings.value("notebooks/active", NotebookRegistry.DEFAULT, type=str)
+        if not self.notebooks.exists(self.notebook):
+            self.notebook = NotebookRegistry.DEFAULT
+        # 先用上次退出时的快照显示树，数据库中的树结构在后台读取后再核对
+        self.note_manager = self.notebooks.open(self.notebook)
+        self.note_manager.load_snapshot()
+        startup.mark("读取树结构快照")
         self.search_text = ""
-        self.current_search_item = None
+        self.search_results = None
+        self.search_index = -1
+        # 编辑器中显示的笔记，和树的当前项不一定相同
+        self.shown_note_id = None
+        self._image_ingester = None
+        self.expanded_ids = self._load_expanded()
+        self.autosaver = AutoSaver(self.note_manager, self.serialize_editor,
+                                   idle_ms=self.AUTOSAVE_IDLE_MS, parent=self)
         self.init_ui()
+        self.autosaver.failed.connect(lambda message: self.statusBar().showMessage(f"自动保存失败: {message}", 5000))
+        self.note_manager.subscribe(self.on_note_event)
         self.setup_shortcuts()
-    def on_item_clicked(self, item):
+        self.skeleton_loader = SkeletonLoader(self.note_manager, self)
+        self.skeleton_loader.loaded.connect(self.on_skeleton_loaded)
+        self.skeleton_loader.failed.connect(lambda message: logger.error(f"加载笔记树失败: {message}"))
+        self.skeleton_loader.start()
+        # 其他笔记本空闲一段时间后关闭数据库、释放树结构
+        self.evict_timer = QTimer(self)
+        self.evict_timer.timeout.connect(lambda: self.notebooks.evict_idle(keep=(self.notebook,)))
+        self.evict_timer.start(self.NOTEBOOK_EVICT_MS)
+        self.change_timer = QTimer(self)
+        self.change_timer.timeout.connect(self.poll_changes)
+        self.change_timer.start(self.CHANGE_POLL_MS)
+    def _expanded_key(self, notebook):
+        # 默认笔记本沿用旧版本的设置项
+        return "tree/expanded" if notebook == NotebookRegistry.DEFAULT else f"notebooks/{notebook}/expanded"
+    def _load_expanded(self):
+        return set(self.settings.value(self._expanded_key(self.notebook), [], type=list))
+    def _save_expanded(self):
+        expanded = [note_id for note_id in self.expanded_ids if note_id in self.note_manager.notes]
+        self.settings.setValue(self._expanded_key(self.notebook), sorted(expanded))
+    @timed("ui.switch_notebook")
+    def switch_notebook(self, name):
+        """换成另一个笔记本：写完当前笔记本的待保存内容，再打开并显示目标笔记本的树"""
+        if name == self.notebook:
+            return
+        self.show_note(None)
+        if self._image_ingester is not None:
+            # 导入中的图片属于当前笔记本，替换完占位图再切换
+            self._image_ingester.wait()
+            self._image_ingester.deleteLater()
+            self._image_ingester = None
+        self.autosaver.wait()
+        self.skeleton_loader.wait()
+        QCoreApplication.sendPostedEvents()
+        self.rebalance_timer.stop()
+        self.note_manager.rebalance_pending()
+        self._save_expanded()
+        self.documents.clear()
+
+        self.note_manager.unsubscribe(self.on_note_event)
+        self.notebook = name
+        self.note_manager = self.notebooks.open(name)
+        self.thumbnails.root = self.notebooks.directory(name)
+        self.autosaver.note_manager = self.note_manager
+        self.skeleton_loader.set_manager(self.note_manager)
+        # 第一次打开：有快照先显示快照并在后台核对，没有快照时直接读取（单个笔记本不大）
+        if self.note_manager.generation == 0 and not self.note_manager.load_snapshot():
+            self.note_manager.apply_tree(self.note_manager.read_tree())
+        if not self.note_manager.tree_loaded:
+            self.skeleton_loader.start()
+        self.note_manager.subscribe(self.on_note_event)
+        self.expanded_ids = self._load_expanded()
+        self.refresh_tree()
+        self.tree.setCurrentIndex(self.tree_model.root_index())
+    def on_note_event(self, event):
+        """把 NoteManager 的变化增量同步到树和已缓存的文档"""
+        kind, note_id = event.kind, event.note_id
+        if kind == NoteManager.CREATED:
+            self.tree_model.note_inserted(note_id)
+        elif kind == NoteManager.MOVED:
+            self.tree_model.note_moved(note_id)
+        elif kind == NoteManager.UPDATED:
+            self.tree_model.note_changed(note_id)
+            if event.content:
+                self._reload_document(note_id)
+        elif kind == NoteManager.DELETED:
+            self.tree_model.note_removed(note_id)
+            self._discard_missing_documents()
+        elif kind == NoteManager.RELOADED:
+            self.refresh_tree()
+            self._discard_missing_documents()
+            if event.content:
+                # 日志被截短后整体重新读取，无法知道哪些正文变了
+                for cached_id in self.documents:
+                    self._reload_document(cached_id)
+    def _discard_missing_documents(self):
+        if self.shown_note_id and self.shown_note_id not in self.note_manager.notes:
+            self.show_note(None)
+        for cached_id in self.documents:
+            if cached_id not in self.note_manager.notes:
+                self.documents.discard(cached_id)
+    def _reload_document(self, note_id):
+        """正文被其他连接改过：丢弃缓存的文档，正在显示时重新载入"""
+        if note_id not in self.documents:
+            return
+        shown = note_id == self.shown_note_id
+        if shown:
+            if self.editor.document().isModified():
+                # 本地还有没保存的编辑，以本地为准，保存时会覆盖
+                return
+            self.show_note(None)
+        self.documents.discard(note_id)
+        if shown:
+            self.show_note(note_id)
+    def poll_changes(self):
+        # 自己排队的写入还没落盘时数据库落后于内存，等写完再核对
+        if self.autosaver.state in (self.autosaver.UNSAVED, self.autosaver.SAVING):
+            return
+        self.note_manager.poll_changes()
+    def create_notebook(self):
+        name, ok = QInputDialog.getText(self, "新建笔记本", "笔记本名称：")
+        if not ok or not name:
+            return
+        try:
+            name = self.notebooks.create(name)
+        except (ValueError, OSError) as e:
+            QMessageBox.warning(self, "新建笔记本", str(e))
+            return
+        self.switch_notebook(name)
+    def current_note_id(self):
+        return self.tree_model.note_id(self.tree.currentIndex())
+    @timed("ui.on_item_clicked")
+    def on_item_clicked(self, index):
         """处理树形控件项点击事件"""
-        note_id = item.data(0, Qt.ItemDataRole.UserRole)
-        note = self.note_manager.notes[note_id]
-        self.editor.setText(note.content)
+        notebook = self.tree_model.notebook_of(index)
+        if notebook:
+            # 切换会重置模型，不在视图的信号处理中进行
+            QTimer.singleShot(0, lambda: self.switch_notebook(notebook))
+            return
+        self.show_note(self.tree_model.note_id(index))
+    @timed("ui.show_note")
+    def show_note(self, note_id):
+        """在编辑器中换上笔记的文档，最近看过的笔记直接使用缓存中已排版的文档"""
+        if note_id == self.shown_note_id and note_id in self.documents:
+            return
+        self.autosaver.flush()
+        if self.shown_note_id in self.documents:
+            cursor = self.editor.textCursor()
+            self.documents.save_view(self.shown_note_id, (cursor.anchor(), cursor.position(),
+                                                          self.editor.verticalScrollBar().value()))
+        if note_id:
+            document = self.documents.get(note_id, lambda: self.note_manager.get_content(note_id))
+        else:
+            document = self.blank_document
+        # 换文档不是编辑，不能触发 textChanged
+        blocked = self.editor.blockSignals(True)
+        try:
+            self.editor.setDocument(document)
+        finally:
+            self.editor.blockSignals(blocked)
+        self.highlighter.setDocument(document)
+        self.shown_note_id = note_id
+        view = self.documents.view(note_id) if note_id else None
+        if view:
+            anchor, position, scroll = view
+            cursor = QTextCursor(document)
+            cursor.setPosition(min(anchor, document.characterCount() - 1))
+            cursor.setPosition(min(position, document.characterCount() - 1), QTextCursor.MoveMode.KeepAnchor)
+            self.editor.setTextCursor(cursor)
+            self.editor.verticalScrollBar().setValue(scroll)
+    def serialize_editor(self):
+        """供自动保存调用：序列化正在显示的文档，并清除它的已修改标记"""
+        document = self.editor.document()
+        document.setModified(False)
+        if self.shown_note_id:
+            self.documents.update_size(self.shown_note_id)
+        return document.toHtml()
     def init_ui(self):
         self.setWindowTitle('Tree Note')
         self.setGeometry(100, 100, 800, 600)
@@ -48,20 +247,34 @@ class MainWindow(QMainWindow):
         self.search_box.textChanged.connect(self.on_search_text_changed)
         search_layout.addWidget(self.search_box)
         
+        self.case_box = QCheckBox("Aa")
+        self.case_box.setToolTip("高亮时区分大小写")
+        self.case_box.toggled.connect(lambda checked: self.highlighter.set_case_sensitive(checked))
+        search_layout.addWidget(self.case_box)
+        
         btn_search = QPushButton("查找下一个")
         btn_search.setToolTip("F3")
-        btn_search.clicked.connect(self.find_next)
+        btn_search.clicked.connect(lambda: self.find_next())
         search_layout.addWidget(btn_search)
         
         left_layout.addWidget(search_panel)
         
         # 添加树形控件
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabel("笔记")
+        self.tree_model = NoteTreeModel(self.note_manager, self)
+        self.tree = QTreeView()
+        self.tree.setModel(self.tree_model)
+        self.tree.setUniformRowHeights(True)
         self.tree.setDragEnabled(True)
         self.tree.setAcceptDrops(True)
-        self.tree.setDragDropMode(QTreeWidget.DragDropMode.InternalMove)
-        self.tree.itemClicked.connect(self.on_item_clicked)
+        self.tree.setDragDropMode(QTreeView.DragDropMode.InternalMove)
+        self.tree.setDropIndicatorShown(True)
+        self.tree_model.move_requested.connect(self.move_note)
+        self.rebalance_timer = QTimer(self)
+        self.rebalance_timer.setSingleShot(True)
+        self.rebalance_timer.timeout.connect(lambda: self.note_manager.rebalance_pending())
+        self.tree.clicked.connect(self.on_item_clicked)
+        self.tree.expanded.connect(self.on_tree_expanded)
+        self.tree.collapsed.connect(self.on_tree_collapsed)
         left_layout.addWidget(self.tree)
         
         # 添加按钮
@@ -73,6 +286,10 @@ class MainWindow(QMainWindow):
         btn_delete.clicked.connect(self.delete_current_note)
         left_layout.addWidget(btn_delete)
         
+        btn_notebook = QPushButton("新建笔记本")
+        btn_notebook.clicked.connect(self.create_notebook)
+        left_layout.addWidget(btn_notebook)
+        
         layout.addWidget(left_panel)
         
         # 右侧面板
@@ -80,35 +297,72 @@ class MainWindow(QMainWindow):
         right_layout = QVBoxLayout()
         right_panel.setLayout(right_layout)
         
-        self.editor = QTextEdit()
+        # 缩略图按图片文件的绝对路径命名，各笔记本共用默认笔记本下的缓存目录
+        self.thumbnails = ThumbnailCache(self.notebooks.directory(NotebookRegistry.DEFAULT) / "images" / ".thumbs",
+                                         parent=self)
+        # 正文中的图片地址相对于当前笔记本目录
+        self.thumbnails.root = self.notebooks.directory(self.notebook)
+        self.documents = DocumentCache(self.thumbnails, self.DOCUMENT_CACHE_BYTES, self)
+        # 没有打开笔记时显示的空文档
+        self.blank_document = NoteDocument(self.thumbnails, self)
+        self.editor = NoteEditor()
+        self.editor.setDocument(self.blank_document)
         self.editor.textChanged.connect(self.on_content_changed)
+        self.editor.images_inserted.connect(self.insert_images)
+        self.highlighter = SearchHighlighter(self.editor)
+        self.editor.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.editor.customContextMenuRequested.connect(self.show_editor_menu)
         
         btn_insert_image = QPushButton("插入图片")
-        btn_insert_image.clicked.connect(self.insert_image)
+        btn_insert_image.clicked.connect(lambda: self.insert_image())
         
         right_layout.addWidget(self.editor)
         right_layout.addWidget(btn_insert_image)
         
         layout.addWidget(right_panel)
         
+        self.save_state_label = QLabel(self.autosaver.state)
+        self.statusBar().addPermanentWidget(self.save_state_label)
+        self.autosaver.state_changed.connect(self.save_state_label.setText)
+        
         self.refresh_tree()
     def setup_shortcuts(self):
-        self.tree.itemDoubleClicked.connect(self.rename_note)
+        self.tree.doubleClicked.connect(self.rename_note)
         self.tree.keyPressEvent = self.handle_tree_key_press
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.show_stats_panel)
+        QShortcut(QKeySequence("Ctrl+P"), self, self.show_quick_open)
+    def show_stats_panel(self):
+        """显示性能统计面板（Ctrl+Shift+D）"""
+        from ui.stats_panel import StatsPanel
+        StatsPanel(instrumentation, self).exec()
+    def show_quick_open(self):
+        """按标题快速跳转（Ctrl+P）"""
+        from ui.quick_open import QuickOpenDialog
+        # 第一次打开时建立标题索引，笔记很多时需要几秒
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            self.note_manager.title_index
+        finally:
+            QApplication.restoreOverrideCursor()
+        dialog = QuickOpenDialog(self.note_manager, self)
+        if dialog.exec() and dialog.note_id and self.select_note(dialog.note_id):
+            self.show_note(dialog.note_id)
     def handle_tree_key_press(self, event):
         if event.key() == Qt.Key.Key_F2:
-            current_item = self.tree.currentItem()
-            if current_item:
-                self.rename_note(current_item)
+            current_index = self.tree.currentIndex()
+            if current_index.isValid():
+                self.rename_note(current_index)
         elif event.key() == Qt.Key.Key_F3:
             self.find_next()
         else:
-            QTreeWidget.keyPressEvent(self.tree, event)
+            QTreeView.keyPressEvent(self.tree, event)
     def on_search_text_changed(self, text):
         self.search_text = text.lower()
-        self.current_search_item = None
-        # 清除之前的高亮
-        self.clear_highlight()
+        self.search_results = None
+        self.search_index = -1
+        # 高亮随输入增量更新，不修改正文的格式
+        self.highlighter.set_terms(text.split())
+    @timed("ui.find_next")
     def find_next(self):
         if not self.search_text:
             self.search_text = self.search_box.text().lower()
@@ -116,130 +370,66 @@ class MainWindow(QMainWindow):
                 QMessageBox.information(self, "搜索", "请输入搜索内容")
                 return
         
-        # 获取所有节点
-        all_items = []
-        self._collect_tree_items(self.tree.topLevelItem(0), all_items)
+        # 并行查询已打开的笔记本（至少包括当前笔记本）的全文索引，之后按下 F3 只在结果中移动
+        if self.search_results is None:
+            self.search_results = self.notebooks.search(self.search_text, self.SEARCH_LIMIT)
+            self.search_index = -1
         
-        if not all_items:
-            QMessageBox.information(self, "搜索", "没有可搜索的项目")
+        if not self.search_results:
+            QMessageBox.information(self, "搜索", "搜索已完成，没有匹配项")
+            self.search_results = None
             return
         
-        # 确定开始位置
-        start_index = 0
-        if self.current_search_item in all_items:
-            start_index = all_items.index(self.current_search_item) + 1
+        self.search_index += 1
+        if self.search_index >= len(self.search_results):
+            QMessageBox.information(self, "搜索", "已到尾部，将从头开始搜索")
+            self.search_index = 0
         
-        # 搜索下一个匹配项
-        found = False
-        for i in range(len(all_items)):
-            index = (start_index + i) % len(all_items)
-            if index == 0 and i > 0:
-                QMessageBox.information(self, "搜索", "已到尾部，将从头开始搜索")
-            item = all_items[index]
-            note_id = item.data(0, Qt.ItemDataRole.UserRole)
-            note = self.note_manager.notes[note_id]
-            
-            # 检查标题和内容
-            if self.search_text in item.text(0).lower() or self.search_text in note.content.lower():
-                self.tree.setCurrentItem(item)
-                item.setExpanded(True)
-                if item.parent():
-                    item.parent().setExpanded(True)
-                self.current_search_item = item
-                
-                # 自动显示匹配的笔记内容
-                self.editor.setText(note.content)
-                
-                # 高亮显示搜索内容
-                self.highlight_search_text(note.content)
-                found = True
-                break
-        
-        # 未找到新的匹配项
-        if not found:
-            QMessageBox.information(self, "搜索", "搜索已完成，没有新的匹配项")
-            self.current_search_item = None
-    def clear_highlight(self):
-        cursor = self.editor.textCursor()
-        cursor.setPosition(0)
-        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
-        cursor.setCharFormat(QTextCharFormat())
-    def highlight_search_text(self, content):
-        cursor = self.editor.textCursor()
-        format = QTextCharFormat()
-        format.setBackground(Qt.GlobalColor.yellow)
+        notebook, hit = self.search_results[self.search_index]
+        self.switch_notebook(notebook)
+        note_id = hit.note_id
+        if not self.select_note(note_id):
+            return
         
-        # 清除之前的高亮
-        self.clear_highlight()
+        # 自动显示匹配的笔记内容
+        self.show_note(note_id)
         
-        # 搜索并高亮
-        pos = 0
-        while pos >= 0:
-            pos = content.lower().find(self.search_text, pos)
-            if pos >= 0:
-                # 确保光标位置在文本范围内
-                if pos + len(self.search_text) <= len(content):
-                    cursor.setPosition(pos)
-                    cursor.movePosition(QTextCursor.MoveOperation.Right, QTextCursor.MoveMode.KeepAnchor, len(self.search_text))
-                    cursor.setCharFormat(format)
-                pos += len(self.search_text)
-    def _collect_tree_items(self, item, items):
-        if not item:
-            return
-        items.append(item)
-        for i in range(item.childCount()):
-            self._collect_tree_items(item.child(i), items)
-    def get_next_item(self, item):
-        if item.childCount() > 0:
-            return item.child(0)
-            
-        next_sibling = self.get_next_sibling(item)
-        if next_sibling:
-            return next_sibling
-            
-        parent = item.parent()
-        while parent:
-            next_sibling = self.get_next_sibling(parent)
-            if next_sibling:
-                return next_sibling
+        # 高亮由 highlighter 按块完成，这里只滚动到第一个匹配
+        self.show_first_match()
+    def select_note(self, note_id):
+        """展开到笔记所在位置并选中它"""
+        index = self.tree_model.index_for_note(note_id)
+        if not index.isValid():
+            return False
+        parent = index.parent()
+        while parent.isValid():
+            self.tree.expand(parent)
             parent = parent.parent()
-            
-        return self.tree.topLevelItem(0)
-    def get_next_sibling(self, item):
-        parent = item.parent()
-        if not parent:
-            index = self.tree.indexOfTopLevelItem(item)
-            if index < self.tree.topLevelItemCount() - 1:
-                return self.tree.topLevelItem(index + 1)
-            return None
-            
-        index = parent.indexOfChild(item)
-        if index < parent.childCount() - 1:
-            return parent.child(index + 1)
-        return None
+        self.tree.setCurrentIndex(index)
+        self.tree.scrollTo(index)
+        return True
+    def show_first_match(self):
+        flags = QTextDocument.FindFlag.FindCaseSensitively if self.case_box.isChecked() else QTextDocument.FindFlag(0)
+        document = self.editor.document()
+        matches = [document.find(term, 0, flags) for term in self.highlighter.terms]
+        matches = [cursor for cursor in matches if not cursor.isNull()]
+        if matches:
+            self.editor.setTextCursor(min(matches, key=lambda cursor: cursor.selectionStart()))
     def create_new_note(self):
         """创建新笔记"""
-        current_item = self.tree.currentItem()
-        if not current_item:
-            current_item = self.tree.topLevelItem(0)
-            
-        parent_id = current_item.data(0, Qt.ItemDataRole.UserRole)
+        parent_id = self.current_note_id() or self.note_manager.root.id
         title = "新建笔记"
         note_id = self.note_manager.create_note(title, parent_id)
+        if not note_id:
+            return
         
-        new_item = QTreeWidgetItem([title])
-        new_item.setData(0, Qt.ItemDataRole.UserRole, note_id)
-        current_item.addChild(new_item)
-        current_item.setExpanded(True)
-        
-        self.tree.setCurrentItem(new_item)
-        self.rename_note(new_item)
+        self.select_note(note_id)
+        self.rename_note(self.tree.currentIndex())
     def delete_current_note(self):
-        current_item = self.tree.currentItem()
-        if not current_item:
+        note_id = self.current_note_id()
+        if not note_id:
             return
             
-        note_id = current_item.data(0, Qt.ItemDataRole.UserRole)
         note = self.note_manager.notes[note_id]
         
         if note.children:
@@ -252,76 +442,213 @@ class MainWindow(QMainWindow):
             )
             if reply == QMessageBox.StandardButton.No:
                 return
-            
+        
+        # 等待排队中的保存完成，避免已删除的笔记被重新写回
+        self.autosaver.wait()
+        # 其他连接可能刚在这棵子树下新建了笔记，先同步，否则删除会违反外键
+        self.note_manager.poll_changes()
+        if note_id not in self.note_manager.notes:
+            return
+        parent_id = self.note_manager.parent_of(note_id)
+        # 树和文档缓存随 DELETED 事件更新
         if self.note_manager.delete_note(note_id):
-            parent = current_item.parent()
-            if parent:
-                parent.removeChild(current_item)
-                self.tree.setCurrentItem(parent)
-    def rename_note(self, item):
-        note_id = item.data(0, Qt.ItemDataRole.UserRole)
-        if note_id == self.note_manager.root.id:
+            if self.select_note(parent_id):
+                self.show_note(parent_id)
+    @timed("ui.move_note")
+    def move_note(self, note_id, parent_id, index):
+        """拖放移动笔记，写入数据库后由 MOVED 事件同步到树"""
+        if not self.note_manager.move_note(note_id, parent_id, index):
+            return
+        self.select_note(note_id)
+        if self.note_manager.pending_rebalance:
+            self.rebalance_timer.start(self.REBALANCE_IDLE_MS)
+    def rename_note(self, index):
+        note_id = self.tree_model.note_id(index)
+        if not note_id or note_id == self.note_manager.root.id:
             return
             
         note = self.note_manager.notes[note_id]
         title, ok = QInputDialog.getText(self, "重命名", "请输入新标题：", text=note.title)
         
         if ok and title:
-            note.title = title
-            item.setText(0, title)
-            self.note_manager.update_note(note_id, title=title)
+            # 与自动保存共用写入队列，保证同一笔记的写入顺序
+            record = self.note_manager.stage_note(note_id, title=title)
+            if record:
+                self.autosaver.submit(record)
+    @timed("ui.on_content_changed")
     def on_content_changed(self):
-        current_item = self.tree.currentItem()
-        if not current_item:
+        # 重新排版、高亮和图片加载也会触发 textChanged，只有修改过的文档才需要保存
+        if not self.shown_note_id or not self.editor.document().isModified():
             return
             
-        note_id = current_item.data(0, Qt.ItemDataRole.UserRole)
-        content = self.editor.toHtml()
-        self.note_manager.update_note(note_id, content=content)
+        self.autosaver.mark_dirty(self.shown_note_id)
+    @timed("ui.insert_image")
     def insert_image(self):
-        file_name, _ = QFileDialog.getOpenFileName(
+        file_names, _ = QFileDialog.getOpenFileNames(
             self,
             "选择图片",
             "",
-            "图片文件 (*.png *.jpg *.jpeg *.gif *.bmp)"
+            "图片文件 (*.png *.jpg *.jpeg *.gif *.bmp *.webp *.tif *.tiff)"
         )
-        if file_name:
-            current_item = self.tree.currentItem()
-            if current_item:
-                note_id = current_item.data(0, Qt.ItemDataRole.UserRole)
-                saved_path = self.note_manager.save_image(note_id, file_name)
-                if saved_path:
-                    self.editor.insertHtml(f'<img src="{saved_path}" />')
-                    self.on_content_changed()
+        if file_names:
+            self.insert_images(file_names)
+    def image_ingester(self):
+        # 第一次插入图片时才创建，图片仓库也因此保持按需创建
+        if self._image_ingester is None:
+            self._image_ingester = ImageIngester(
+                self.note_manager.images,
+                self.settings.value("images/reencode_format", "webp", type=str),
+                self.settings.value("images/reencode_quality", 100, type=int),
+                parent=self,
+            )
+            self._image_ingester.finished.connect(self.on_image_ingested)
+            self._image_ingester.failed.connect(self.on_image_failed)
+        return self._image_ingester
+    @timed("ui.insert_images")
+    def insert_images(self, sources):
+        """在光标处为每张图片插入占位图，复制和编码在后台完成"""
+        note_id = self.shown_note_id
+        if not note_id:
+            return
+        ingester = self.image_ingester()
+        document = self.editor.document()
+        cursor = self.editor.textCursor()
+        for source in sources:
+            size = source.size() if isinstance(source, QImage) else QImageReader(source).size()
+            name = ingester.placeholder_name(ingester.submit(note_id, source))
+            document.addResource(QTextDocument.ResourceType.ImageResource.value, QUrl(name),
+                                 ingester.placeholder(size, document.display_width()))
+            image_format = QTextImageFormat()
+            image_format.setName(name)
+            cursor.insertImage(image_format)
+        self.editor.setTextCursor(cursor)
+    def on_image_ingested(self, job_id, note_id, src):
+        self._replace_placeholder(note_id, ImageIngester.placeholder_name(job_id), src)
+    def on_image_failed(self, job_id, note_id, message):
+        self._replace_placeholder(note_id, ImageIngester.placeholder_name(job_id), None)
+        self.statusBar().showMessage(f"导入图片失败: {message}", 5000)
+    def _replace_placeholder(self, note_id, name, src):
+        """把占位图换成仓库中的图片，src 为 None 时删除占位图"""
+        document = self.documents.peek(note_id)
+        if document is None:
+            # 文档已被淘汰，占位图随正文保存过，直接改正文
+            content = self.note_manager.get_content(note_id)
+            image = f'<img src="{src}" />' if src else ""
+            updated = re.sub(f'<img[^>]*?src="{re.escape(name)}"[^>]*>', lambda _: image, content)
+            if updated != content:
+                record = self.note_manager.stage_note(note_id, content=updated)
+                if record:
+                    self.autosaver.submit(record)
+            return
+        block = document.begin()
+        while block.isValid():
+            it = block.begin()
+            while not it.atEnd():
+                fragment = it.fragment()
+                char_format = fragment.charFormat()
+                if char_format.isImageFormat() and char_format.toImageFormat().name() == name:
+                    cursor = QTextCursor(document)
+                    cursor.setPosition(fragment.position())
+                    cursor.setPosition(fragment.position() + fragment.length(), QTextCursor.MoveMode.KeepAnchor)
+                    if src:
+                        image_format = QTextImageFormat()
+                        image_format.setName(src)
+                        cursor.setCharFormat(image_format)
+                    else:
+                        cursor.removeSelectedText()
+                    if document is not self.editor.document():
+                        # 不在编辑器中的文档不会触发自动保存，直接排入写入队列
+                        record = self.note_manager.stage_note(note_id, content=document.toHtml())
+                        document.setModified(False)
+                        if record:
+                            self.autosaver.submit(record)
+                    return
+                it += 1
+            block = block.next()
+    def show_editor_menu(self, pos):
+        menu = self.editor.createStandardContextMenu(pos)
+        # 光标位于图片左侧时，图片是右边的那个字符
+        cursor = self.editor.cursorForPosition(pos)
+        char_format = cursor.charFormat()
+        if not char_format.isImageFormat():
+            cursor.movePosition(QTextCursor.MoveOperation.Right)
+            char_format = cursor.charFormat()
+        if char_format.isImageFormat():
+            src = char_format.toImageFormat().name().replace("\\", "/")
+            action = menu.addAction("查看原图")
+            action.triggered.connect(lambda: self.show_original_image(src))
+        menu.exec(self.editor.viewport().mapToGlobal(pos))
+    def show_original_image(self, src):
+        """编辑器中只显示缩略图，原图只在这里加载"""
+        image = self.thumbnails.load_original(src)
+        if image.isNull():
+            QMessageBox.warning(self, "图片", f"无法打开图片: {src}")
+            return
+        label = QLabel()
+        label.setPixmap(QPixmap.fromImage(image))
+        scroll = QScrollArea()
+        scroll.setWidget(label)
+        dialog = QDialog(self)
+        dialog.setWindowTitle(src)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(scroll)
+        dialog.resize(min(image.width() + 40, 1200), min(image.height() + 40, 900))
+        dialog.exec()
+    @timed("ui.refresh_tree")
     def refresh_tree(self):
-        expanded_items = {}
-        root_item = self.tree.topLevelItem(0)
-        if root_item:
-            self._save_expanded_state(root_item, expanded_items)
+        self.tree_model.set_notebooks(self.note_manager, self.notebooks.names(), self.notebook)
+        root_index = self.tree_model.root_index()
+        self.tree.expand(root_index)
         
-        self.tree.clear()
-        root_item = self._create_tree_item(self.note_manager.root)
-        self.tree.addTopLevelItem(root_item)
-        root_item.setExpanded(True)
-        
-        self._restore_expanded_state(root_item, expanded_items)
-    def _create_tree_item(self, note):
-        item = QTreeWidgetItem([note.title])
-        item.setData(0, Qt.ItemDataRole.UserRole, note.id)
-        
-        for child in note.children:
-            child_item = self._create_tree_item(self.note_manager.notes[child])
-            item.addChild(child_item)
-        
-        return item
-    def _save_expanded_state(self, item, expanded_items):
-        note_id = item.data(0, Qt.ItemDataRole.UserRole)
-        expanded_items[note_id] = item.isExpanded()
-        for i in range(item.childCount()):
-            self._save_expanded_state(item.child(i), expanded_items)
-    def _restore_expanded_state(self, item, expanded_items):
-        note_id = item.data(0, Qt.ItemDataRole.UserRole)
-        if note_id in expanded_items:
-            item.setExpanded(expanded_items[note_id])
-        for i in range(item.childCount()):
-            self._restore_expanded_state(item.child(i), expanded_items)
\ No newline at end of file
+        # 只恢复祖先也都展开的节点，折叠分支下的节点不会被物化
+        root_id = self.note_manager.root.id
+        for note_id in sorted(self.expanded_ids, key=self._note_depth):
+            parent_id = self.note_manager.parent_of(note_id)
+            if parent_id is None or (parent_id != root_id and parent_id not in self.expanded_ids):
+                continue
+            index = self.tree_model.index_for_note(note_id)
+            if index.isValid() and self.tree.isExpanded(index.parent()):
+                self.tree.expand(index)
+    @timed("ui.on_skeleton_loaded")
+    def on_skeleton_loaded(self, tree, generation):
+        if generation != self.note_manager.generation:
+            # 读取期间树结构被修改过，等排队的写入落盘后重新读取
+            self.autosaver.wait()
+            self.skeleton_loader.start()
+            return
+        note_id = self.current_note_id()
+        # 树结构有变化时 RELOADED 事件会重建树
+        if self.note_manager.apply_tree(tree):
+            if note_id and not self.select_note(note_id):
+                self.show_note(None)
+        startup.finish("后台加载树结构")
+    def _note_depth(self, note_id):
+        depth = 0
+        while note_id is not None:
+            note_id = self.note_manager.parent_of(note_id)
+            depth += 1
+        return depth
+    def on_tree_expanded(self, index):
+        notebook = self.tree_model.notebook_of(index)
+        if notebook:
+            QTimer.singleShot(0, lambda: self.switch_notebook(notebook))
+            return
+        note_id = self.tree_model.note_id(index)
+        if note_id != self.note_manager.root.id:
+            self.expanded_ids.add(note_id)
+    def on_tree_collapsed(self, index):
+        self.expanded_ids.discard(self.tree_model.note_id(index))
+    def closeEvent(self, event):
+        self._save_expanded()
+        self.settings.setValue("notebooks/active", self.notebook)
+        if self._image_ingester is not None:
+            # 导入完成后占位图被替换，替换后的正文随自动保存写入
+            self._image_ingester.wait()
+        self.autosaver.shutdown()
+        self.note_manager.rebalance_pending()
+        self.skeleton_loader.wait()
+        # 保存各笔记本的树结构快照并关闭数据库
+        self.notebooks.close_all()
+        if instrumentation.enabled:
+            instrumentation.dump()
+        super().closeEvent(event)
\ No newline at end of file
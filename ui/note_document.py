@@ -0,0 +1,42 @@
+from PyQt6.QtCore import QUrl
+from PyQt6.QtGui import QTextDocument
+
+
+class NoteDocument(QTextDocument):
+    """通过 ThumbnailCache 按显示宽度加载图片的文档"""
+    DEFAULT_WIDTH = 800
+
+    def __init__(self, thumbnails, parent=None):
+        super().__init__(parent)
+        self.thumbnails = thumbnails
+        # 正在等待后台缩略图的图片地址
+        self._waiting = {}
+        thumbnails.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    @staticmethod
+    def image_src(url: QUrl) -> str:
+        return (url.toLocalFile() if url.isLocalFile() else url.toString()).replace("\\", "/")
+
+    def display_width(self) -> int:
+        width = int(self.textWidth() - 2 * self.documentMargin())
+        return width if width > 0 else self.DEFAULT_WIDTH
+
+    def loadResource(self, type, url):
+        if type != QTextDocument.ResourceType.ImageResource.value:
+            return super().loadResource(type, url)
+        src = self.image_src(url)
+        image, ready = self.thumbnails.image_for(src, self.display_width())
+        if image.isNull():
+            return super().loadResource(type, url)
+        if not ready:
+            self._waiting[src] = QUrl(url)
+        return image
+
+    def _on_thumbnail_ready(self, src: str):
+        url = self._waiting.pop(src, None)
+        if url is None:
+            return
+        image, _ = self.thumbnails.image_for(src, self.display_width())
+        self.addResource(QTextDocument.ResourceType.ImageResource.value, url, image)
+        # 替换资源后需要重新排版才能显示新图片
+        self.markContentsDirty(0, self.characterCount())
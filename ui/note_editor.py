@@ -0,0 +1,35 @@
+from PyQt6.QtCore import pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QTextEdit
+
+
+class NoteEditor(QTextEdit):
+    """粘贴或拖入的图片不直接嵌入文档，而是通过 images_inserted 交给后台导入"""
+    IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff")
+
+    # 文件路径或 QImage 列表，插入位置是当前光标
+    images_inserted = pyqtSignal(list)
+
+    def _image_sources(self, source) -> list:
+        if source.hasUrls():
+            paths = [url.toLocalFile() for url in source.urls()
+                     if url.isLocalFile() and url.toLocalFile().lower().endswith(self.IMAGE_SUFFIXES)]
+            if paths:
+                return paths
+        if source.hasImage():
+            image = source.imageData()
+            if isinstance(image, QPixmap):
+                image = image.toImage()
+            if isinstance(image, QImage) and not image.isNull():
+                return [image]
+        return []
+
+    def canInsertFromMimeData(self, source) -> bool:
+        return source.hasImage() or source.hasUrls() or super().canInsertFromMimeData(source)
+
+    def insertFromMimeData(self, source):
+        sources = self._image_sources(source)
+        if sources:
+            self.images_inserted.emit(sources)
+        else:
+            super().insertFromMimeData(source)
@@ -0,0 +1,297 @@
+from typing import Dict, List, Optional
+from PyQt6.QtCore import QAbstractItemModel, QMimeData, QModelIndex, Qt, pyqtSignal
+
+
+class NoteTreeModel(QAbstractItemModel):
+    """NoteManager 之上的懒加载树模型
+
+    只有展开过的节点才会物化子节点，NoteManager 的增删改通过
+    note_inserted / note_removed / note_moved / note_changed 以增量行通知同步到视图。
+    拖放不直接修改模型，而是发出 move_requested，由窗口调用 NoteManager.move_note 后再通知。
+
+    有多个笔记本时顶层每行是一个笔记本：正在使用的笔记本这一行就是它的根目录，
+    其他笔记本只是占位行，不打开数据库，由窗口在展开或点击时切换过去。
+    """
+    # 每次 fetchMore 物化的子节点数量
+    FETCH_BATCH = 500
+    MIME_TYPE = "application/x-treenote-note-ids"
+    # 占位行的键，笔记 id 是整数，不会与之冲突
+    NOTEBOOK_PREFIX = "notebook:"
+
+    # (笔记 id, 新父节点 id, 插入位置)，插入位置按移动前的子节点列表计算
+    move_requested = pyqtSignal(str, str, int)
+
+    def __init__(self, note_manager, parent=None):
+        super().__init__(parent)
+        self.note_manager = note_manager
+        # 笔记本名称和正在使用的笔记本，没有设置时顶层只有根目录
+        self.notebooks: List[str] = []
+        self.active: Optional[str] = None
+        self._reset_mirror()
+
+    def _reset_mirror(self):
+        root_id = self.note_manager.root.id
+        top = [root_id if name == self.active else self.NOTEBOOK_PREFIX + name
+               for name in self.notebooks] or [root_id]
+        # 已物化的子节点列表（NoteManager 中子节点列表的前缀），None 表示不可见的顶层
+        self._children: Dict[Optional[str], List[str]] = {None: top}
+        # 已物化节点的父节点和行号
+        self._parent_of: Dict[str, Optional[str]] = {key: None for key in top}
+        self._rows: Dict[str, int] = {key: row for row, key in enumerate(top)}
+
+    def reset(self):
+        self.beginResetModel()
+        self._reset_mirror()
+        self.endResetModel()
+
+    def set_notebooks(self, note_manager, notebooks: List[str], active: str):
+        """切换正在使用的笔记本，模型整体重置"""
+        self.beginResetModel()
+        self.note_manager = note_manager
+        self.notebooks = list(notebooks)
+        self.active = active
+        self._reset_mirror()
+        self.endResetModel()
+
+    def _key(self, index: QModelIndex) -> Optional[str]:
+        return index.internalPointer() if index.isValid() else None
+
+    def note_id(self, index: QModelIndex) -> Optional[str]:
+        """笔记 id，笔记本占位行返回 None"""
+        key = self._key(index)
+        return None if key is None or key.startswith(self.NOTEBOOK_PREFIX) else key
+
+    def notebook_of(self, index: QModelIndex) -> Optional[str]:
+        """笔记本占位行对应的笔记本名称，其他行返回 None"""
+        key = self._key(index)
+        return key[len(self.NOTEBOOK_PREFIX):] if key and key.startswith(self.NOTEBOOK_PREFIX) else None
+
+    def root_index(self) -> QModelIndex:
+        return self._index_of(self.note_manager.root.id)
+
+    def _total_children(self, note_id: Optional[str]) -> int:
+        if note_id is None:
+            return len(self._children[None])
+        if note_id.startswith(self.NOTEBOOK_PREFIX):
+            return 0
+        return self.note_manager.child_count(note_id)
+
+    def _index_of(self, note_id: str) -> QModelIndex:
+        return self.createIndex(self._rows[note_id], 0, note_id)
+
+    # QAbstractItemModel 接口
+
+    def index(self, row, column, parent=QModelIndex()):
+        rows = self._children.get(self._key(parent), ())
+        if column != 0 or not 0 <= row < len(rows):
+            return QModelIndex()
+        return self.createIndex(row, 0, rows[row])
+
+    def parent(self, index):
+        parent_id = self._parent_of.get(self._key(index))
+        if parent_id is None:
+            return QModelIndex()
+        return self._index_of(parent_id)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return len(self._children.get(self._key(parent), ()))
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        # 占位行总显示展开箭头，展开时才切换过去加载
+        if self.notebook_of(parent):
+            return True
+        return self._total_children(self._key(parent)) > 0
+
+    def canFetchMore(self, parent):
+        key = self._key(parent)
+        return len(self._children.get(key, ())) < self._total_children(key)
+
+    def fetchMore(self, parent):
+        note_id = self.note_id(parent)
+        if note_id is None:
+            return
+        rows = self._children.setdefault(note_id, [])
+        start = len(rows)
+        children = self.note_manager.child_ids(note_id, start, start + self.FETCH_BATCH)
+        if not children:
+            return
+        end = start + len(children)
+        self.beginInsertRows(parent, start, end - 1)
+        for row, child_id in enumerate(children, start):
+            rows.append(child_id)
+            self._parent_of[child_id] = note_id
+            self._rows[child_id] = row
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        notebook = self.notebook_of(index)
+        if notebook is not None:
+            return notebook if role == Qt.ItemDataRole.DisplayRole else None
+        note_id = self.note_id(index)
+        if note_id is None:
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            if note_id == self.note_manager.root.id and self.active is not None:
+                return self.active
+            note = self.note_manager.notes.get(note_id)
+            return note.title if note else None
+        if role == Qt.ItemDataRole.UserRole:
+            return note_id
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return "笔记"
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        if self.notebook_of(index):
+            return Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable | Qt.ItemFlag.ItemIsDropEnabled
+        if self.note_id(index) != self.note_manager.root.id:
+            flags |= Qt.ItemFlag.ItemIsDragEnabled
+        return flags
+
+    # 拖放
+
+    def supportedDragActions(self):
+        return Qt.DropAction.MoveAction
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+    def mimeTypes(self):
+        return [self.MIME_TYPE]
+
+    def mimeData(self, indexes):
+        data = QMimeData()
+        note_ids = [self.note_id(index) for index in indexes if index.isValid()]
+        data.setData(self.MIME_TYPE, "\n".join(note_ids).encode("utf-8"))
+        return data
+
+    def _dropped_ids(self, data) -> List[str]:
+        if not data.hasFormat(self.MIME_TYPE):
+            return []
+        return [note_id for note_id in bytes(data.data(self.MIME_TYPE)).decode("utf-8").split("\n") if note_id]
+
+    def canDropMimeData(self, data, action, row, column, parent):
+        parent_id = self.note_id(parent)
+        if parent_id is None:
+            return False
+        notes = self.note_manager.notes
+        note_ids = self._dropped_ids(data)
+        return bool(note_ids) and all(
+            note_id in notes and not notes[parent_id]._would_create_cycle(notes[note_id]) for note_id in note_ids)
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if not self.canDropMimeData(data, action, row, column, parent):
+            return False
+        parent_id = self.note_id(parent)
+        # 放在节点上时追加到末尾；多篇笔记依次插入，保持拖动时的顺序
+        index = row if row >= 0 else self._total_children(parent_id)
+        for note_id in self._dropped_ids(data):
+            self.move_requested.emit(note_id, parent_id, index)
+            if self.note_manager.parent_of(note_id) == parent_id:
+                index = self.note_manager.position_of(note_id) + 1
+        # 返回 False，视图不会再删除源行，移动已经通过 note_moved 同步
+        return False
+
+    # 定位与增量更新
+
+    def index_for_note(self, note_id: str) -> QModelIndex:
+        """返回笔记对应的索引，必要时只物化从根到该节点的路径"""
+        path = []
+        current = note_id
+        while current not in self._rows:
+            parent_id = self.note_manager.parent_of(current)
+            if parent_id is None:
+                return QModelIndex()
+            path.append(current)
+            current = parent_id
+        for child_id in reversed(path):
+            parent_id = self.note_manager.parent_of(child_id)
+            parent_index = self._index_of(parent_id)
+            position = self.note_manager.position_of(child_id)
+            while len(self._children.get(parent_id, ())) <= position:
+                self.fetchMore(parent_index)
+        return self._index_of(note_id)
+
+    def _renumber(self, rows: List[str], start: int):
+        for row in range(start, len(rows)):
+            self._rows[rows[row]] = row
+
+    def note_inserted(self, note_id: str):
+        """NoteManager 新增笔记之后调用"""
+        parent_id = self.note_manager.parent_of(note_id)
+        if parent_id not in self._rows:
+            return
+        rows = self._children.setdefault(parent_id, [])
+        row = self.note_manager.position_of(note_id)
+        # 落在尚未物化的尾部时交给 fetchMore
+        if row > len(rows) or (row == len(rows) and len(rows) < self._total_children(parent_id) - 1):
+            return
+        self.beginInsertRows(self._index_of(parent_id), row, row)
+        rows.insert(row, note_id)
+        self._parent_of[note_id] = parent_id
+        self._renumber(rows, row)
+        self.endInsertRows()
+
+    def note_removed(self, note_id: str):
+        """NoteManager 删除笔记之后调用，子树的物化状态一并丢弃"""
+        if note_id not in self._rows:
+            return
+        parent_id = self._parent_of[note_id]
+        row = self._rows[note_id]
+        rows = self._children[parent_id]
+        self.beginRemoveRows(self._index_of(parent_id), row, row)
+        del rows[row]
+        self._renumber(rows, row)
+        stack = [note_id]
+        while stack:
+            current = stack.pop()
+            self._parent_of.pop(current, None)
+            self._rows.pop(current, None)
+            stack.extend(self._children.pop(current, ()))
+        self.endRemoveRows()
+
+    def note_moved(self, note_id: str):
+        """NoteManager 移动笔记之后调用"""
+        if note_id not in self._rows:
+            self.note_inserted(note_id)
+            return
+        old_parent, old_row = self._parent_of[note_id], self._rows[note_id]
+        new_parent = self.note_manager.parent_of(note_id)
+        new_row = self.note_manager.position_of(note_id)
+        target_rows = self._children.get(new_parent) if new_parent in self._rows else None
+        if target_rows is not None:
+            materialized = len(target_rows) - (old_parent == new_parent)
+            others = self._total_children(new_parent) - 1
+            if new_row > materialized or (new_row == materialized and materialized < others):
+                target_rows = None
+        if target_rows is None:
+            # 目标父节点未物化或新位置在未物化的尾部，退化为删除加插入
+            self.note_removed(note_id)
+            self.note_inserted(note_id)
+            return
+        dest = new_row + 1 if old_parent == new_parent and new_row > old_row else new_row
+        if not self.beginMoveRows(self._index_of(old_parent), old_row, old_row, self._index_of(new_parent), dest):
+            return
+        source_rows = self._children[old_parent]
+        del source_rows[old_row]
+        self._renumber(source_rows, old_row)
+        target_rows.insert(new_row, note_id)
+        self._parent_of[note_id] = new_parent
+        self._renumber(target_rows, new_row)
+        self.endMoveRows()
+
+    def note_changed(self, note_id: str):
+        if note_id in self._rows:
+            index = self._index_of(note_id)
+            self.dataChanged.emit(index, index)
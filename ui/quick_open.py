@@ -0,0 +1,57 @@
+from PyQt6.QtCore import Qt, QEvent
+from PyQt6.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QListWidget, QListWidgetItem
+
+
+class QuickOpenDialog(QDialog):
+    """按标题快速跳转到笔记（Ctrl+P）
+
+    每输入一个字就查询内存中的标题索引，不读取正文和数据库。
+    输入 "父/子" 可以按所在路径缩小范围。上下键选择，回车打开。
+    """
+    RESULT_LIMIT = 50
+
+    def __init__(self, note_manager, parent=None):
+        super().__init__(parent)
+        self.note_manager = note_manager
+        self.note_id = None
+        self.setWindowTitle("快速打开")
+        self.resize(520, 420)
+
+        layout = QVBoxLayout(self)
+        self.input = QLineEdit()
+        self.input.setPlaceholderText("输入标题，用 / 分隔上级笔记")
+        self.input.textChanged.connect(self.update_results)
+        self.input.installEventFilter(self)
+        layout.addWidget(self.input)
+
+        self.results = QListWidget()
+        self.results.itemActivated.connect(lambda item: self.open_item(item))
+        layout.addWidget(self.results)
+
+    def update_results(self, text):
+        self.results.clear()
+        if not text.strip():
+            return
+        for note_id, title, path in self.note_manager.quick_open(text, self.RESULT_LIMIT):
+            item = QListWidgetItem(f"{title}\n    {path}" if path else title)
+            item.setData(Qt.ItemDataRole.UserRole, note_id)
+            self.results.addItem(item)
+        self.results.setCurrentRow(0)
+
+    def eventFilter(self, obj, event):
+        # 焦点留在输入框，上下翻页键转给结果列表
+        if obj is self.input and event.type() == QEvent.Type.KeyPress:
+            key = event.key()
+            if key in (Qt.Key.Key_Up, Qt.Key.Key_Down, Qt.Key.Key_PageUp, Qt.Key.Key_PageDown):
+                self.results.keyPressEvent(event)
+                return True
+            if key in (Qt.Key.Key_Return, Qt.Key.Key_Enter):
+                self.open_item(self.results.currentItem())
+                return True
+        return super().eventFilter(obj, event)
+
+    def open_item(self, item):
+        if item is None:
+            return
+        self.note_id = item.data(Qt.ItemDataRole.UserRole)
+        self.accept()
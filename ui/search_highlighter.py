@@ -0,0 +1,118 @@
+import re
+import time
+from typing import List
+from PyQt6.QtCore import QPoint, QTimer, Qt
+from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat
+
+
+class SearchHighlighter(QSyntaxHighlighter):
+    """按文本块高亮搜索词
+
+    格式只作用于排版层，不写入文档，toHtml() 和保存的正文不受影响。
+    每帧的工作量有上限：超出时间预算的块先记下，之后由定时器分批补上，
+    可见区域内的块优先处理。
+    """
+    # 每帧用于高亮的时间（秒）
+    FRAME_BUDGET = 0.008
+    # 两批之间留给界面处理事件的间隔（毫秒）
+    BATCH_INTERVAL_MS = 16
+    MAX_MATCHES_PER_BLOCK = 1000
+
+    def __init__(self, editor):
+        super().__init__(editor.document())
+        self.editor = editor
+        self.terms: List[str] = []
+        self.case_sensitive = False
+        self._pattern = None
+        self._format = QTextCharFormat()
+        self._format.setBackground(Qt.GlobalColor.yellow)
+        # 超出预算尚未高亮的块：块号 -> QTextBlock
+        self._pending = {}
+        self._frame_start = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._process_pending)
+
+    def set_terms(self, terms: List[str]):
+        # 长词在前，重叠时优先匹配较长的词
+        terms = sorted({t for t in terms if t}, key=len, reverse=True)
+        if terms != self.terms:
+            self.terms = terms
+            self._compile()
+
+    def set_case_sensitive(self, case_sensitive: bool):
+        if case_sensitive != self.case_sensitive:
+            self.case_sensitive = case_sensitive
+            self._compile()
+
+    def _compile(self):
+        had_pattern = self._pattern is not None
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        self._pattern = re.compile("|".join(map(re.escape, self.terms)), flags) if self.terms else None
+        if had_pattern or self._pattern is not None:
+            self._schedule_all()
+
+    def setDocument(self, document):
+        self._pending.clear()
+        super().setDocument(document)
+
+    def _schedule_all(self):
+        """把所有块排入待处理队列，由定时器分批重新高亮"""
+        document = self.document()
+        if document is None:
+            return
+        self._pending = {}
+        block = document.begin()
+        while block.isValid():
+            self._pending[block.blockNumber()] = block
+            block = block.next()
+        self._timer.start(0)
+
+    def _in_budget(self) -> bool:
+        now = time.perf_counter()
+        if self._frame_start is None:
+            # Qt 因文档变化主动调用时，从第一次调用开始计算本帧预算
+            self._frame_start = now
+            self._timer.start(0)
+        return now - self._frame_start < self.FRAME_BUDGET
+
+    def highlightBlock(self, text):
+        if self._pattern is None:
+            return
+        if not self._in_budget():
+            block = self.currentBlock()
+            self._pending[block.blockNumber()] = block
+            return
+        for count, match in enumerate(self._pattern.finditer(text)):
+            if count >= self.MAX_MATCHES_PER_BLOCK:
+                break
+            self.setFormat(match.start(), match.end() - match.start(), self._format)
+
+    def _visible_range(self):
+        viewport = self.editor.viewport()
+        first = self.editor.cursorForPosition(QPoint(0, 0)).blockNumber()
+        last = self.editor.cursorForPosition(QPoint(viewport.width(), viewport.height())).blockNumber()
+        return first, last
+
+    def _process_pending(self):
+        self._frame_start = time.perf_counter()
+        if self._pending:
+            first, last = self._visible_range()
+            order = sorted(self._pending, key=lambda n: (not first <= n <= last, n))
+            document = self.document()
+            # 重新高亮会让文档发出内容变化信号，不能被当成用户编辑
+            blocked = document.blockSignals(True)
+            try:
+                for number in order:
+                    if time.perf_counter() - self._frame_start >= self.FRAME_BUDGET:
+                        break
+                    block = self._pending.pop(number)
+                    if block.isValid():
+                        self.rehighlightBlock(block)
+            finally:
+                document.blockSignals(blocked)
+            # rehighlightBlock 不会触发视图重绘
+            self.editor.viewport().update()
+        self._frame_start = None
+        if self._pending:
+            self._timer.start(self.BATCH_INTERVAL_MS)
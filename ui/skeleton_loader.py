@@ -0,0 +1,54 @@
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+
+
+class SkeletonLoader(QObject):
+    """在后台线程中从数据库读取树结构，读完后在界面线程中发出 loaded 信号
+
+    信号携带 NoteManager.read_tree() 的结果和开始读取时的 generation，
+    接收方据此判断读取期间树结构是否被修改过。切换笔记本后，
+    之前的笔记本读到的结果即使已经排入事件队列也会被丢弃。
+    """
+    loaded = pyqtSignal(object, int)
+    failed = pyqtSignal(str)
+    _loaded = pyqtSignal(object, int, int)
+
+    def __init__(self, note_manager, parent=None):
+        super().__init__(parent)
+        self.note_manager = note_manager
+        self._thread = None
+        # 每次切换 NoteManager 递增
+        self._epoch = 0
+        self._loaded.connect(self._on_loaded)
+
+    def set_manager(self, note_manager):
+        self.wait()
+        self.note_manager = note_manager
+        self._epoch += 1
+
+    def start(self):
+        # 重新读取时上一个线程已经发出信号，只差退出
+        self.wait()
+        generation = self.note_manager.generation
+        self._thread = threading.Thread(target=self._run, args=(self.note_manager, generation, self._epoch),
+                                        name="skeleton-loader", daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, note_manager, generation: int, epoch: int):
+        try:
+            tree = note_manager.read_tree()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            # 每次加载都是新线程，用完的连接不能留到关闭数据库时才释放
+            note_manager.db.release_thread_connection()
+        self._loaded.emit(tree, generation, epoch)
+
+    def _on_loaded(self, tree, generation: int, epoch: int):
+        if epoch == self._epoch:
+            self.loaded.emit(tree, generation)
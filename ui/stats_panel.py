@@ -0,0 +1,70 @@
+import time
+from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QPushButton, QCheckBox, QPlainTextEdit, QFileDialog, QLabel)
+
+
+class StatsPanel(QDialog):
+    """调试面板：显示各操作的调用次数、耗时、读写量和慢操作日志"""
+    COLUMNS = ("操作", "次数", "错误", "平均(ms)", "最大(ms)", "读取(B)", "写入(B)")
+
+    def __init__(self, instrumentation, parent=None):
+        super().__init__(parent)
+        self.instrumentation = instrumentation
+        self.setWindowTitle("性能统计")
+        self.resize(760, 520)
+
+        layout = QVBoxLayout(self)
+        self.enabled_box = QCheckBox("记录统计")
+        self.enabled_box.setChecked(instrumentation.enabled)
+        self.enabled_box.toggled.connect(instrumentation.enable)
+        layout.addWidget(self.enabled_box)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSortingEnabled(True)
+        layout.addWidget(self.table)
+
+        layout.addWidget(QLabel("慢操作"))
+        self.slow_log = QPlainTextEdit()
+        self.slow_log.setReadOnly(True)
+        layout.addWidget(self.slow_log)
+
+        buttons = QHBoxLayout()
+        for text, slot in (("刷新", self.refresh), ("清空", self.clear), ("导出 JSON", self.export)):
+            button = QPushButton(text)
+            button.clicked.connect(lambda _, slot=slot: slot())
+            buttons.addWidget(button)
+        layout.addLayout(buttons)
+
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.instrumentation.snapshot()
+        operations = snapshot["operations"]
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(operations))
+        for row, (name, stats) in enumerate(operations.items()):
+            values = (name, stats["count"], stats["errors"], round(stats["mean_ms"], 2),
+                      round(stats["max_ms"], 2), stats["bytes_read"], stats["bytes_written"])
+            for column, value in enumerate(values):
+                item = QTableWidgetItem()
+                item.setData(Qt.ItemDataRole.DisplayRole, value)
+                self.table.setItem(row, column, item)
+        self.table.setSortingEnabled(True)
+        self.table.resizeColumnsToContents()
+
+        self.slow_log.setPlainText("\n".join(
+            f"{time.strftime('%H:%M:%S', time.localtime(entry['time']))}  {entry['name']}  "
+            f"{entry['ms']:.1f}ms  [{entry['thread']}]"
+            for entry in reversed(snapshot["slow_log"])
+        ))
+
+    def clear(self):
+        self.instrumentation.reset()
+        self.refresh()
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, "导出统计", "treenote_stats.json", "JSON (*.json)")
+        if path:
+            self.instrumentation.dump(path)
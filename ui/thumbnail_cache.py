@@ -0,0 +1,160 @@
+import os
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Tuple
+from PyQt6.QtCore import QObject, QRunnable, QSize, QThreadPool, QTimer, pyqtSignal
+from PyQt6.QtGui import QColor, QImage, QImageReader
+
+
+class _ThumbnailJob(QRunnable):
+    def __init__(self, cache, src, path, width, target):
+        super().__init__()
+        self.cache = cache
+        self.src = src
+        self.path = path
+        self.width = width
+        self.target = target
+
+    def run(self):
+        reader = QImageReader(self.path)
+        size = reader.size()
+        if size.width() > self.width:
+            # 解码时直接缩放，JPEG 等格式不需要解出全尺寸像素
+            reader.setScaledSize(QSize(self.width, max(1, size.height() * self.width // size.width())))
+        image = reader.read()
+        ok = False
+        if not image.isNull():
+            self.target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.target.with_name(f"{self.target.stem}.{os.getpid()}.tmp.png")
+            ok = image.save(str(tmp), "PNG")
+            if ok:
+                os.replace(tmp, self.target)
+        self.cache._generated.emit(self.src, self.width, ok)
+
+
+class ThumbnailCache(QObject):
+    """编辑器显示用的缩略图缓存
+
+    按显示宽度档位生成缩略图并保存在磁盘上，生成工作在线程池中完成；
+    内存中保留有限数量的已解码图片，原图只在显式查看时加载。
+    正文中的图片地址相对于当前笔记本目录 root；仓库中的图片按内容哈希命名，
+    不同笔记本中的同一地址就是同一张图片，切换笔记本时缓存不必清空。
+    """
+    # 显示宽度按档位取整，避免窗口尺寸变化时反复生成
+    WIDTH_STEP = 256
+    MAX_BYTES = 64 * 1024 * 1024
+    PLACEHOLDER_COLOR = QColor(230, 230, 230)
+    # 生成失败后隔 RETRY_MS、两倍、四倍……重试，失败 MAX_ATTEMPTS 次后改为显示原图
+    RETRY_MS = 2000
+    MAX_ATTEMPTS = 3
+
+    thumbnail_ready = pyqtSignal(str)
+    _generated = pyqtSignal(str, int, bool)
+
+    def __init__(self, cache_dir="images/.thumbs", max_bytes=MAX_BYTES, parent=None):
+        super().__init__(parent)
+        self.cache_dir = Path(cache_dir)
+        self.root = Path()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images: "OrderedDict[tuple, QImage]" = OrderedDict()
+        self._pending = set()
+        # (地址, 宽度) -> 生成失败的次数
+        self._failures = {}
+        self._pool = QThreadPool.globalInstance()
+        self._generated.connect(self._on_generated)
+
+    def bucket(self, width: int) -> int:
+        return max(self.WIDTH_STEP, -(-width // self.WIDTH_STEP) * self.WIDTH_STEP)
+
+    def path(self, src: str) -> str:
+        """图片地址对应的文件，绝对路径原样返回"""
+        return str(self.root / src)
+
+    def _thumb_path(self, path: str, width: int) -> Path:
+        stat = os.stat(path)
+        key = hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+        return self.cache_dir / key[:2] / f"{key}_{width}.png"
+
+    def image_for(self, src: str, display_width: int) -> Tuple[QImage, bool]:
+        """返回适合显示宽度的图片以及它是否已就绪
+
+        缩略图尚未生成时返回同尺寸的占位图，生成完成（或放弃重试）后发出 thumbnail_ready。
+        """
+        path = self.path(src)
+        reader = QImageReader(path)
+        size = reader.size()
+        if not size.isValid():
+            return QImage(), True
+        width = self.bucket(display_width)
+        if size.width() <= width:
+            # 原图本身就不大，直接按原尺寸缓存
+            width = size.width()
+
+        key = (src, width)
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            return image, True
+
+        if self._failures.get(key, 0) >= self.MAX_ATTEMPTS:
+            # 原图也无法解码时返回空图，文档显示为损坏的图片
+            return QImage(path), True
+
+        target = self._thumb_path(path, width)
+        if width == size.width() or target.exists():
+            image = QImage(str(target) if target.exists() else path)
+            if not image.isNull():
+                self._remember(key, image)
+                return image, True
+
+        # 失败后等待重试期间不重复提交，由定时器重新生成
+        if key not in self._pending and key not in self._failures:
+            self._pending.add(key)
+            self._pool.start(_ThumbnailJob(self, src, path, width, target))
+        placeholder = QImage(width, max(1, size.height() * width // size.width()), QImage.Format.Format_RGB32)
+        placeholder.fill(self.PLACEHOLDER_COLOR)
+        return placeholder, False
+
+    def load_original(self, src: str) -> QImage:
+        return QImage(self.path(src))
+
+    def _remember(self, key, image: QImage):
+        old = self._images.pop(key, None)
+        if old is not None:
+            self.size -= old.sizeInBytes()
+        self._images[key] = image
+        self.size += image.sizeInBytes()
+        while self.size > self.max_bytes and len(self._images) > 1:
+            _, evicted = self._images.popitem(last=False)
+            self.size -= evicted.sizeInBytes()
+
+    def _on_generated(self, src: str, width: int, ok: bool):
+        key = (src, width)
+        self._pending.discard(key)
+        if ok:
+            self._failures.pop(key, None)
+            self.thumbnail_ready.emit(src)
+            return
+        failures = self._failures[key] = self._failures.get(key, 0) + 1
+        if failures >= self.MAX_ATTEMPTS:
+            # 等待中的文档重新取图，这时换成原图，不再一直显示占位图
+            self.thumbnail_ready.emit(src)
+        else:
+            QTimer.singleShot(self.RETRY_MS * 2 ** (failures - 1), lambda: self._retry(src, width))
+
+    def _retry(self, src: str, width: int):
+        key = (src, width)
+        if key in self._pending:
+            return
+        path = self.path(src)
+        try:
+            target = self._thumb_path(path, width)
+        except OSError:
+            # 原图已经不存在
+            self._failures[key] = self.MAX_ATTEMPTS
+            self.thumbnail_ready.emit(src)
+            return
+        self._pending.add(key)
+        self._pool.start(_ThumbnailJob(self, src, path, width, target))